@@ -0,0 +1,60 @@
+"""Benchmark pod5 completeness probes on a filesystem with injected latency: serial vs. parallel probing.
+
+Usage:
+    python -m benchmarks.bench_probe --files 1000 --latency-ms 2 --workers 16 --repeats 3
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.bench_run_info import time_it
+from eldorado.utils import is_complete_pod5_file, probe_pod5_files
+
+POD5_SIGNATURE = b"\x8BPOD\r\n\x1A\n"
+
+
+def with_latency(func, latency: float):
+    # Simulate a round trip to network storage for each call
+    def wrapper(*args, **kwargs):
+        time.sleep(latency)
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=1000, help="Number of pod5 files to probe")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="Latency added to each open, stat and read call")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pod5_files = []
+        for i in range(args.files):
+            pod5_file = Path(tmp_dir) / f"file{i}.pod5"
+            pod5_file.write_bytes(POD5_SIGNATURE + os.urandom(1024) + POD5_SIGNATURE)
+            pod5_files.append(pod5_file)
+
+        latency = args.latency_ms / 1000
+        with (
+            mock.patch.object(os, "open", with_latency(os.open, latency)),
+            mock.patch.object(os, "fstat", with_latency(os.fstat, latency)),
+            mock.patch.object(os, "pread", with_latency(os.pread, latency)),
+        ):
+            serial_time = time_it(lambda: [is_complete_pod5_file(pod5_file) for pod5_file in pod5_files], args.repeats)
+            parallel_time = time_it(lambda: probe_pod5_files(pod5_files, max_workers=args.workers), args.repeats)
+
+        print(f"Files:    {args.files} with {args.latency_ms} ms latency per call")
+        print(f"Serial:   {serial_time * 1000:8.2f} ms")
+        print(f"Parallel: {parallel_time * 1000:8.2f} ms ({args.workers} workers)")
+        print(f"Speedup:  {serial_time / parallel_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark reading run info from pod5 files: pod5.Reader vs. the footer-only reader.
+
+Usage:
+    python -m benchmarks.bench_run_info --size-gb 2 --repeats 5 [--pod5-file existing.pod5]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from eldorado.configuration import read_metadata
+from eldorado.pod5_handling import read_metadata_from_footers
+from tests.conftest import create_pod5_file
+
+
+def time_it(func, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-gb", type=float, default=2.0, help="Size of generated pod5 file in GB")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--pod5-file", type=Path, default=None, help="Use an existing pod5 file instead of generating one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pod5_file = args.pod5_file
+        if pod5_file is None:
+            # Random signal is stored with ~2 bytes per sample
+            n_samples = 4_000_000
+            n_reads = max(1, int(args.size_gb * 1024**3 / (2 * n_samples)))
+            pod5_file = Path(tmp_dir) / "bench.pod5"
+            print(f"Writing {n_reads} reads to {pod5_file}...")
+            create_pod5_file(pod5_file, n_reads=n_reads, n_samples=n_samples)
+
+        print(f"File size: {pod5_file.stat().st_size / 1024**3:.2f} GB")
+
+        reader_time = time_it(lambda: read_metadata(pod5_file), args.repeats)
+        footer_time = time_it(lambda: read_metadata_from_footers([pod5_file]), args.repeats)
+
+        print(f"pod5.Reader:   {reader_time * 1000:8.2f} ms")
+        print(f"Footer reader: {footer_time * 1000:8.2f} ms")
+        print(f"Speedup:       {reader_time / footer_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 import hashlib
+import heapq
+import math
 import subprocess
 import textwrap
 import time
@@ -6,10 +8,32 @@ from dataclasses import dataclass, field
 from pathlib import Path
 from typing import List
 
-from eldorado.filenames import BATCH_BAM, BATCH_DONE, BATCH_JOB_ID, BATCH_LOG, BATCH_MANIFEST, BATCH_SCRIPT
+from eldorado.cluster import ClusterLoad, GpuTarget
+from eldorado.constants import (
+    BALANCED_PACKING_NUMPY_THRESHOLD,
+    BASECALLING_JOB_NAME_PREFIX,
+    BATCH_PACKING_BALANCED,
+    BATCH_PACKING_SEQUENTIAL,
+    STAGE_BASECALLING,
+)
+from eldorado.filenames import (
+    ARRAY_JOB_ID,
+    ARRAY_MANIFEST,
+    ARRAY_SCRIPT,
+    BATCH_BAM,
+    BATCH_DONE,
+    BATCH_JOB_ID,
+    BATCH_LOG,
+    BATCH_MANIFEST,
+    BATCH_SCRIPT,
+    DORADO_CONFIG,
+)
 from eldorado.logging_config import logger
-from eldorado.pod5_handling import SequencingRun
-from eldorado.utils import is_in_queue, write_to_file
+from eldorado.pod5_handling import SequencingRun, get_signal_samples
+from eldorado.resources import DEFAULT_RESOURCES, SlurmResources
+from eldorado.run_state import TRANSFERRED
+from eldorado.throughput import ThroughputModel, record_batch_throughput
+from eldorado.utils import is_in_queue, parse_walltime, submit_slurm_script, write_to_file
 
 
 @dataclass
@@ -29,9 +53,6 @@ class BasecallingBatch:
     script_file: Path = field(init=False)
     done_file: Path = field(init=False)
 
-    pod5_lock_files: List[Path] = field(init=False)
-    pod5_done_files: List[Path] = field(init=False)
-
     def __post_init__(self):
         # Create unique batch id using MD5 hash of pod5 files and current time
         unique_batch_str = "".join([str(x) for x in self.pod5_files]) + str(int(time.time()))
@@ -48,15 +69,6 @@ class BasecallingBatch:
         self.script_file = self.working_dir / BATCH_SCRIPT
         self.done_file = self.working_dir / BATCH_DONE
 
-        # Pod5 lock files
-        self.pod5_lock_files = [self.run.basecalling_lock_files_dir / f"{pod5_file.name}.lock" for pod5_file in self.pod5_files]
-        for lock_file in self.pod5_lock_files:
-            lock_file.parent.mkdir(exist_ok=True, parents=True)
-            lock_file.touch()
-
-        # Pod5 done files
-        self.pod5_done_files = [self.run.basecalling_done_files_dir / f"{pod5_file.name}.done" for pod5_file in self.pod5_files]
-
     def setup(self):
         # Create working directory
         self.working_dir.mkdir(exist_ok=True, parents=True)
@@ -65,34 +77,41 @@ class BasecallingBatch:
         pod5_files_str = "\n".join([str(x) for x in self.pod5_files]) + "\n"
         self.pod5_manifest.write_text(pod5_files_str, encoding="utf-8")
 
-        # Create .lock files
-        for lock_file in self.pod5_lock_files:
-            lock_file.parent.mkdir(exist_ok=True, parents=True)
-            lock_file.touch()
+        # Lock pod5 files
+        self.run.state.lock_batch(self.batch_id, self.working_dir, self.pod5_files)
+
 
+def cleanup_basecalling_lock_files(run: SequencingRun, history_file: Path | None = None):
+    # Loop through all active batches and release pod5 files of batches that are no longer in the queue
+    for batch_id, working_dir, job_id in run.state.get_active_batches():
+        # Mark batch as done if the job has finished
+        if (working_dir / BATCH_DONE).exists():
+            # Add the runtime of the batch to the throughput history
+            if history_file is not None:
+                record_batch_throughput(run, working_dir, history_file)
+            run.state.mark_batch_done(batch_id)
+            continue
 
-def cleanup_basecalling_lock_files(pod5_dir: SequencingRun):
-    # Loop through all batch directories and collect inactive and active pod5 files
-    queued_pod5_files: set[Path] = set()
-    for batch_dir in pod5_dir.basecalling_batches_dir.glob("*"):
-        # Skip if job is done
-        if Path(batch_dir / BATCH_DONE).exists():
+        # Skip if job is in queue
+        if job_id and is_in_queue(job_id):
             continue
 
-        # If job is in queue collect pod5 files and skip
-        slurm_id_file = batch_dir / BATCH_JOB_ID
-        pod5_manifest_file = batch_dir / BATCH_MANIFEST
-        if slurm_id_file.exists() and pod5_manifest_file.exists():
-            job_id = slurm_id_file.read_text().strip()
-            if is_in_queue(job_id):
-                pod5_files = read_pod5_manifest(pod5_manifest_file)
-                queued_pod5_files.update(pod5_files)
-                continue
+        run.state.release_batch(batch_id)
+
+    # Release locked pod5 files that are not part of an active batch
+    run.state.release_orphaned_locks()
 
-    # Remove lock files for pod5 files that are not in active batch directories
-    for lock_file in pod5_dir.get_lock_files():
-        if lock_file.name not in [f"{x.name}.lock" for x in queued_pod5_files]:
-            lock_file.unlink()
+
+def get_basecalling_job_ids(run: SequencingRun) -> List[str] | None:
+    # Job IDs of unfinished basecalling batches. None if a batch has no queued job to depend on
+    job_ids = []
+    for _, working_dir, job_id in run.state.get_active_batches():
+        if (working_dir / BATCH_DONE).exists():
+            continue
+        if not job_id or not is_in_queue(job_id):
+            return None
+        job_ids.append(job_id)
+    return job_ids
 
 
 def read_pod5_manifest(pod5_manifest_file: Path) -> List[Path]:
@@ -119,6 +138,18 @@ def is_completed(job_id):
     return res.returncode == 0 and "COMPLETED" in str(res.stdout.strip())
 
 
+@dataclass
+class PlannedBatch:
+    # Batch of unbasecalled pod5 files that is not set up yet
+    pod5_files: List[Path]
+    cost: int
+    pod5_bytes: int
+    walltime: str
+    oldest_added_at: float | None
+    target: GpuTarget = GpuTarget()
+    gpus: int = 1
+
+
 def process_unbasecalled_pod5_files(
     run: SequencingRun,
     min_batch_size: int,
@@ -127,75 +158,374 @@ def process_unbasecalled_pod5_files(
     mail_user: str,
     slurm_account: str,
     dry_run: bool,
+    job_array: bool = False,
+    batch_packing: str = BATCH_PACKING_SEQUENTIAL,
+    min_batch_samples: int | None = None,
+    max_batch_samples: int | None = None,
+    throughput_model: ThroughputModel | None = None,
+    target_runtime: str | None = None,
+    max_batch_wait: str | None = None,
+    cluster_load: ClusterLoad | None = None,
+    multi_gpu_threshold: int | None = None,
+    resources: SlurmResources = DEFAULT_RESOURCES[STAGE_BASECALLING],
 ):
+    planned_batches = plan_basecalling_batches(
+        run=run,
+        min_batch_size=min_batch_size,
+        max_batch_size=max_batch_size,
+        walltime=walltime,
+        batch_packing=batch_packing,
+        min_batch_samples=min_batch_samples,
+        max_batch_samples=max_batch_samples,
+        throughput_model=throughput_model,
+        target_runtime=target_runtime,
+        max_batch_wait=max_batch_wait,
+        cluster_load=cluster_load,
+        multi_gpu_threshold=multi_gpu_threshold,
+        resources=resources,
+    )
+    submit_basecalling_batches(
+        run=run,
+        planned_batches=planned_batches,
+        walltime=walltime,
+        mail_user=mail_user,
+        slurm_account=slurm_account,
+        dry_run=dry_run,
+        job_array=job_array,
+        resources=resources,
+    )
+
+
+def plan_basecalling_batches(
+    run: SequencingRun,
+    min_batch_size: int,
+    max_batch_size: int,
+    walltime: str,
+    batch_packing: str = BATCH_PACKING_SEQUENTIAL,
+    min_batch_samples: int | None = None,
+    max_batch_samples: int | None = None,
+    throughput_model: ThroughputModel | None = None,
+    target_runtime: str | None = None,
+    max_batch_wait: str | None = None,
+    cluster_load: ClusterLoad | None = None,
+    multi_gpu_threshold: int | None = None,
+    resources: SlurmResources = DEFAULT_RESOURCES[STAGE_BASECALLING],
+) -> List[PlannedBatch]:
     # Get unbasecalled pod5 files
     unbasecalled_pod5_files = run.get_unbasecalled_pod5_files()
+    file_sizes = [pod5_file.stat().st_size for pod5_file in unbasecalled_pod5_files]
+
+    # Get the cost of each file in signal samples or bytes
+    costs, min_batch_cost, max_batch_cost, unit = get_batch_costs(
+        run=run,
+        pod5_files=unbasecalled_pod5_files,
+        file_sizes=file_sizes,
+        min_batch_size=min_batch_size,
+        max_batch_size=max_batch_size,
+        min_batch_samples=min_batch_samples,
+        max_batch_samples=max_batch_samples,
+    )
 
-    # Check if batch size is big enough in GB
-    if file_size(unbasecalled_pod5_files) < min_batch_size and not run.all_pod5_files_are_transferred():
-        logger.info(
-            "Skipping. Batch size is less than %d B",
-            min_batch_size,
-        )
-        return
+    # Check if batch size is big enough. Submit smaller batches once the oldest file has waited too long
+    if sum(costs) < min_batch_cost and not run.all_pod5_files_are_transferred():
+        if not has_waited_too_long(run, max_batch_wait, time.time()):
+            logger.info(
+                "Skipping. Batch size is less than %d %s",
+                min_batch_cost,
+                unit,
+            )
+            return []
+        logger.info("Submitting batch smaller than %d %s. Oldest unbasecalled file has waited more than %s", min_batch_cost, unit, max_batch_wait)
+
+    # Jobs go to the partition of the resource profile, unless the GPU partitions are chosen by cluster load
+    default_target = GpuTarget(resources.partition) if resources.partition else GpuTarget()
+    walltime = resources.walltime or walltime
+
+    # Size batches to finish within the target runtime at the throughput of earlier batches on the preferred target
+    basecalling_model = run.dorado_config.basecalling_model.name
+    preferred_target = cluster_load.targets[0] if cluster_load is not None else default_target
+    if throughput_model is not None and target_runtime is not None:
+        target_batch_cost = throughput_model.get_max_batch_cost(basecalling_model, preferred_target.label, unit, target_runtime)
+        if target_batch_cost is not None and target_batch_cost < max_batch_cost:
+            logger.info("Limiting batch size to %d %s to finish within %s", target_batch_cost, unit, target_runtime)
+            max_batch_cost = target_batch_cost
 
     # Split pod5 files into groups
-    groups = split_files_into_groups(max_batch_size, unbasecalled_pod5_files)
+    cost_by_file = dict(zip(unbasecalled_pod5_files, costs))
+    size_by_file = dict(zip(unbasecalled_pod5_files, file_sizes))
+    max_gpus = cluster_load.max_gpus_per_node if cluster_load is not None else 1
+    if multi_gpu_threshold is not None and max_gpus > 1:
+        groups = split_files_into_multi_gpu_groups(
+            max_batch_cost, max_gpus, multi_gpu_threshold, unbasecalled_pod5_files, batch_packing, cost_by_file, size_by_file
+        )
+    else:
+        groups = split_files_into_groups(max_batch_cost, unbasecalled_pod5_files, batch_packing, costs)
 
+    # Send each batch to the target where it is expected to finish first, and request its predicted runtime there
+    added_at_by_name = run.state.get_pod5_added_at(TRANSFERRED)
+    planned_batches = []
     for pod5_files in groups:
-        batch = BasecallingBatch(run=run, pod5_files=pod5_files)
+        cost = sum(cost_by_file[x] for x in pod5_files)
+        pod5_bytes = sum(size_by_file[x] for x in pod5_files)
+        added_at = [added_at_by_name[x.name] for x in pod5_files if added_at_by_name.get(x.name) is not None]
+
+        # Batches above the threshold get one GPU per maximum batch size
+        gpus = 1
+        if multi_gpu_threshold is not None and pod5_bytes > multi_gpu_threshold:
+            gpus = min(max_gpus, max(math.ceil(cost / max_batch_cost), 1))
+
+        target = cluster_load.choose_target(basecalling_model, unit, cost, gpus) if cluster_load is not None else default_target
+        planned_batches.append(
+            PlannedBatch(
+                pod5_files=pod5_files,
+                cost=cost,
+                pod5_bytes=pod5_bytes,
+                walltime=(
+                    throughput_model.get_walltime(basecalling_model, target.label, unit, cost, walltime, gpus)
+                    if throughput_model is not None
+                    else walltime
+                ),
+                oldest_added_at=min(added_at, default=None),
+                target=target,
+                gpus=gpus,
+            )
+        )
+    return planned_batches
+
+
+def submit_basecalling_batches(
+    run: SequencingRun,
+    planned_batches: List[PlannedBatch],
+    walltime: str,
+    mail_user: str,
+    slurm_account: str,
+    dry_run: bool,
+    job_array: bool = False,
+    project_id: str | None = None,
+    resources: SlurmResources = DEFAULT_RESOURCES[STAGE_BASECALLING],
+):
+    batches = []
+    for planned_batch in planned_batches:
+        batch = BasecallingBatch(run=run, pod5_files=planned_batch.pod5_files)
 
         logger.info("Setting up basecalling batch (id: %s, %d pod5 files)", batch.batch_id, len(batch.pod5_files))
         batch.setup()
+        batches.append(batch)
+
+    # Submit the batches of each target as a single job array. The tasks share the walltime of the longest batch
+    # and a comment with the mean size of the batches
+    if job_array:
+        batches_by_target: dict[tuple[GpuTarget, int], List[tuple[BasecallingBatch, PlannedBatch]]] = {}
+        for batch, planned_batch in zip(batches, planned_batches):
+            batches_by_target.setdefault((planned_batch.target, planned_batch.gpus), []).append((batch, planned_batch))
+        for (target, gpus), target_batches in batches_by_target.items():
+            target_planned_batches = [planned_batch for _, planned_batch in target_batches]
+            submit_basecalling_array_to_slurm(
+                run=run,
+                batches=[batch for batch, _ in target_batches],
+                mail_user=mail_user,
+                slurm_account=slurm_account,
+                walltime=max((x.walltime for x in target_planned_batches), key=parse_walltime),
+                dry_run=dry_run,
+                comment=(
+                    format_basecalling_job_comment(project_id, math.ceil(sum(x.pod5_bytes for x in target_planned_batches) / len(target_planned_batches)))
+                    if project_id is not None
+                    else None
+                ),
+                target=target,
+                gpus=gpus,
+                resources=resources,
+            )
+        return
 
+    for batch, planned_batch in zip(batches, planned_batches):
         submit_basecalling_batch_to_slurm(
             batch=batch,
             mail_user=mail_user,
             slurm_account=slurm_account,
-            walltime=walltime,
+            walltime=planned_batch.walltime,
             dry_run=dry_run,
+            comment=format_basecalling_job_comment(project_id, planned_batch.pod5_bytes) if project_id is not None else None,
+            target=planned_batch.target,
+            gpus=planned_batch.gpus,
+            resources=resources,
         )
 
 
-def split_files_into_groups(max_batch_size: int, unbasecalled_pod5_files: List[Path]) -> List[List[Path]]:
+def get_batch_deadline(run: SequencingRun, max_batch_wait: str | None) -> float | None:
+    # Time at which the oldest unbasecalled file has waited for max batch wait
+    if max_batch_wait is None:
+        return None
+    oldest_added_at = run.state.get_oldest_added_at(TRANSFERRED)
+    return oldest_added_at + parse_walltime(max_batch_wait) if oldest_added_at is not None else None
+
+
+def has_waited_too_long(run: SequencingRun, max_batch_wait: str | None, now: float) -> bool:
+    deadline = get_batch_deadline(run, max_batch_wait)
+    return deadline is not None and now >= deadline
+
+
+def get_batch_costs(
+    run: SequencingRun,
+    pod5_files: List[Path],
+    file_sizes: List[int],
+    min_batch_size: int,
+    max_batch_size: int,
+    min_batch_samples: int | None,
+    max_batch_samples: int | None,
+) -> tuple[List[int], int, int, str]:
+    # Return the cost of each file, the min and max batch cost, and the unit of the costs
+    if min_batch_samples is None and max_batch_samples is None:
+        return file_sizes, min_batch_size, max_batch_size, "B"
+
+    # GPU time follows the signal samples of a file more closely than its compressed size
+    signal_samples = get_signal_samples(run, pod5_files)
+    samples = [signal_samples.get(pod5_file.name) for pod5_file in pod5_files]
+    known = [(n, size) for n, size in zip(samples, file_sizes) if n is not None]
+    if not known or sum(size for _, size in known) == 0:
+        logger.warning("Could not read signal samples. Using file sizes for batching")
+        return file_sizes, min_batch_size, max_batch_size, "B"
+
+    # Estimate files with unreadable reads tables and missing limits from the samples per byte of the other files
+    samples_per_byte = sum(n for n, _ in known) / sum(size for _, size in known)
+    costs = [n if n is not None else round(size * samples_per_byte) for n, size in zip(samples, file_sizes)]
+    min_batch_cost = min_batch_samples if min_batch_samples is not None else round(min_batch_size * samples_per_byte)
+    max_batch_cost = max_batch_samples if max_batch_samples is not None else round(max_batch_size * samples_per_byte)
+    return costs, min_batch_cost, max_batch_cost, "samples"
+
+
+def split_files_into_groups(
+    max_batch_size: int,
+    unbasecalled_pod5_files: List[Path],
+    batch_packing: str = BATCH_PACKING_SEQUENTIAL,
+    sizes: List[int] | None = None,
+) -> List[List[Path]]:
+    # Use file sizes if no other cost is given
+    if sizes is None:
+        sizes = [pod5_file.stat().st_size for pod5_file in unbasecalled_pod5_files]
+
+    if batch_packing == BATCH_PACKING_BALANCED:
+        groups = pack_balanced(sizes, max_batch_size)
+    else:
+        groups = pack_sequential(sizes, max_batch_size)
+
+    return [[unbasecalled_pod5_files[i] for i in group] for group in groups]
+
+
+def split_files_into_multi_gpu_groups(
+    max_batch_size: int,
+    max_gpus: int,
+    multi_gpu_threshold: int,
+    unbasecalled_pod5_files: List[Path],
+    batch_packing: str,
+    cost_by_file: dict[Path, int],
+    size_by_file: dict[Path, int],
+) -> List[List[Path]]:
+    # Fill whole multi-GPU nodes with one maximum batch size per GPU
+    groups = split_files_into_groups(
+        max_batch_size * max_gpus, unbasecalled_pod5_files, batch_packing, [cost_by_file[x] for x in unbasecalled_pod5_files]
+    )
+
+    # Split groups below the threshold into single-GPU batches again
+    split_groups = []
+    for group in groups:
+        if sum(size_by_file[x] for x in group) > multi_gpu_threshold:
+            split_groups.append(group)
+        else:
+            split_groups.extend(split_files_into_groups(max_batch_size, group, batch_packing, [cost_by_file[x] for x in group]))
+    return split_groups
+
+
+def pack_sequential(sizes: List[int], max_batch_size: int) -> List[List[int]]:
     # Initialize variables
     groups = []
     group = []
     group_size = 0
     # Keep adding files to group until total size exceeds max batch size
-    for pod5_file in unbasecalled_pod5_files:
-        file_size = pod5_file.stat().st_size
+    for i, size in enumerate(sizes):
         # When total size exceeds max batch size, add current group to groups and reset varaibles
-        if group and group_size + file_size > max_batch_size:
+        if group and group_size + size > max_batch_size:
             groups.append(group)
             group = []
             group_size = 0
-        group.append(pod5_file)
-        group_size += file_size
+        group.append(i)
+        group_size += size
     # Add last group to groups
     if group:
         groups.append(group)
     return groups
 
 
+def pack_balanced(sizes: List[int], max_batch_size: int) -> List[List[int]]:
+    # Spread files over the fewest batches that fit the max batch size, so the largest batch is as small as possible
+    if not sizes:
+        return []
+
+    n_groups = min(len(sizes), max(1, math.ceil(sum(sizes) / max_batch_size)))
+    while True:
+        if len(sizes) >= BALANCED_PACKING_NUMPY_THRESHOLD:
+            groups, max_group_size = pack_balanced_numpy(sizes, n_groups)
+        else:
+            groups, max_group_size = pack_largest_first(sizes, n_groups)
+
+        # Add a batch if the packing does not fit. Files larger than the max batch size get a batch of their own
+        if max_group_size <= max_batch_size or n_groups == len(sizes):
+            break
+        n_groups += 1
+
+    # Keep files of each batch in input order
+    return [sorted(group) for group in groups if group]
+
+
+def pack_largest_first(sizes: List[int], n_groups: int) -> tuple[List[List[int]], int]:
+    # Add files from largest to smallest to the batch with the smallest total size
+    groups = [[] for _ in range(n_groups)]
+    heap = [(0, i) for i in range(n_groups)]
+    for i in sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True):
+        group_size, group_idx = heapq.heappop(heap)
+        groups[group_idx].append(i)
+        heapq.heappush(heap, (group_size + sizes[i], group_idx))
+    return groups, max(group_size for group_size, _ in heap)
+
+
+def pack_balanced_numpy(sizes: List[int], n_groups: int) -> tuple[List[List[int]], int]:
+    # Import numpy on first use to keep start up of the scheduler fast
+    import numpy as np
+
+    # Deal files from largest to smallest to the batches, reversing direction each round (0, 1, 2, 2, 1, 0, ...)
+    sizes_arr = np.asarray(sizes, dtype=np.int64)
+    order = np.argsort(-sizes_arr, kind="stable")
+    position = np.arange(len(order)) % (2 * n_groups)
+    group_idx = np.where(position < n_groups, position, 2 * n_groups - 1 - position)
+
+    group_sizes = np.bincount(group_idx, weights=sizes_arr[order], minlength=n_groups)
+    groups = [order[group_idx == i].tolist() for i in range(n_groups)]
+    return groups, int(group_sizes.max())
+
+
 def file_size(files: List[Path]) -> int:
     return sum(x.stat().st_size for x in files) if files else 0
 
 
 def basecalling_is_pending(run: SequencingRun) -> bool:
-    return run.dorado_config_file.exists() and has_unbasecalled_pod5_files(run)
+    return DORADO_CONFIG in run.snapshot.output_dir_files and has_unbasecalled_pod5_files(run)
+
 
+def has_unbasecalled_pod5_files(run: SequencingRun) -> bool:
+    return bool(run.snapshot.unbasecalled)
 
-def has_unbasecalled_pod5_files(pod5_dir: SequencingRun) -> bool:
-    # Number of lock and done files
-    lock_files = len(list(pod5_dir.get_lock_files()))
-    done_files = len(list(pod5_dir.get_done_files()))
 
-    # Number of pod5 files
-    pod5_files = len(list(pod5_dir.get_transferred_pod5_files()))
+def format_basecalling_job_comment(project_id: str, pod5_bytes: int) -> str:
+    # Tag basecalling jobs with their project and input size, so the queue shows the load of each project
+    return f"project={project_id};pod5_bytes={pod5_bytes}"
 
-    # If number of lock/done files is less than number of pod5 files, return True
-    return lock_files + done_files < pod5_files
+
+def parse_basecalling_job_comment(comment: str) -> tuple[str, int] | None:
+    fields = dict(x.partition("=")[::2] for x in comment.split(";"))
+    try:
+        return fields["project"], int(fields["pod5_bytes"])
+    except (KeyError, ValueError):
+        return None
 
 
 def submit_basecalling_batch_to_slurm(
@@ -204,16 +534,114 @@ def submit_basecalling_batch_to_slurm(
     mail_user: str,
     dry_run: bool,
     walltime: str,
+    comment: str | None = None,
+    target: GpuTarget = GpuTarget(),
+    gpus: int = 1,
+    resources: SlurmResources = DEFAULT_RESOURCES[STAGE_BASECALLING],
 ):
-    # Get configuration
-    dorado_executable = batch.run.dorado_config.dorado_executable
-    basecalling_model = batch.run.dorado_config.basecalling_model
-    modification_models = batch.run.dorado_config.modification_models
+    # Write Slurm script to a file
+    write_basecalling_script(
+        run=batch.run,
+        script_file=batch.script_file,
+        job_name=f"{BASECALLING_JOB_NAME_PREFIX}{batch.run.metadata.library_pool_id}-{batch.batch_id}",
+        outdir_setup=f'OUTDIR="{batch.working_dir}"',
+        array_size=None,
+        slurm_account=slurm_account,
+        mail_user=mail_user,
+        walltime=walltime,
+        comment=comment,
+        target=target,
+        gpus=gpus,
+        resources=resources,
+    )
+
+    if dry_run:
+        logger.info("Dry run. Skipping submission of basecalling job.")
+        return
+
+    # Submit the job using Slurm
+    job_id = submit_slurm_script(batch.script_file)
+
+    # Write job ID to file
+    write_to_file(batch.slurm_id_file, job_id)
+    batch.run.state.set_batch_job_id(batch.batch_id, job_id)
+
+    logger.info("Submitted basecalling job to SLURM with job ID %s", job_id)
+
+
+def submit_basecalling_array_to_slurm(
+    run: SequencingRun,
+    batches: List[BasecallingBatch],
+    slurm_account: str,
+    mail_user: str,
+    dry_run: bool,
+    walltime: str,
+    comment: str | None = None,
+    target: GpuTarget = GpuTarget(),
+    gpus: int = 1,
+    resources: SlurmResources = DEFAULT_RESOURCES[STAGE_BASECALLING],
+):
+    # Create unique array id from batch ids
+    array_id = hashlib.md5("".join(batch.batch_id for batch in batches).encode()).hexdigest()
+    array_dir = run.basecalling_arrays_dir / array_id
+    script_file = array_dir / ARRAY_SCRIPT
+    batch_manifest = array_dir / ARRAY_MANIFEST
+
+    # Write batch manifest. Line i holds the working directory of array task i
+    batch_dirs_str = "\n".join([str(batch.working_dir) for batch in batches]) + "\n"
+    write_to_file(batch_manifest, batch_dirs_str)
+
+    # Write Slurm script to a file
+    write_basecalling_script(
+        run=run,
+        script_file=script_file,
+        job_name=f"{BASECALLING_JOB_NAME_PREFIX}{run.metadata.library_pool_id}-{array_id}",
+        outdir_setup=f'OUTDIR=$(sed -n "${{SLURM_ARRAY_TASK_ID}}p" {batch_manifest})',
+        array_size=len(batches),
+        slurm_account=slurm_account,
+        mail_user=mail_user,
+        walltime=walltime,
+        comment=comment,
+        target=target,
+        gpus=gpus,
+        resources=resources,
+    )
+
+    if dry_run:
+        logger.info("Dry run. Skipping submission of basecalling job array.")
+        return
+
+    # Submit the job array using Slurm
+    array_job_id = submit_slurm_script(script_file)
+    write_to_file(array_dir / ARRAY_JOB_ID, array_job_id)
+
+    # Write job ID of each array task to its batch
+    for task_id, batch in enumerate(batches, start=1):
+        job_id = f"{array_job_id}_{task_id}"
+        write_to_file(batch.slurm_id_file, job_id)
+        run.state.set_batch_job_id(batch.batch_id, job_id)
 
-    # Convert path lists to strings
-    pod5_files_str = " ".join([str(x) for x in batch.pod5_files])
-    lock_files_str = " ".join([str(x) for x in batch.pod5_lock_files])
-    done_files_str = " ".join([str(x) for x in batch.pod5_done_files])
+    logger.info("Submitted basecalling job array to SLURM with job ID %s (%d tasks)", array_job_id, len(batches))
+
+
+def write_basecalling_script(
+    run: SequencingRun,
+    script_file: Path,
+    job_name: str,
+    outdir_setup: str,
+    array_size: int | None,
+    slurm_account: str,
+    mail_user: str,
+    walltime: str,
+    comment: str | None = None,
+    target: GpuTarget = GpuTarget(),
+    gpus: int = 1,
+    resources: SlurmResources = DEFAULT_RESOURCES[STAGE_BASECALLING],
+):
+    # Get configuration
+    dorado_executable = run.dorado_config.dorado_executable
+    basecalling_model = run.dorado_config.basecalling_model
+    modification_models = run.dorado_config.modification_models
 
     # Construct SLURM job script
     modified_bases_models_arg = ""
@@ -221,32 +649,43 @@ def submit_basecalling_batch_to_slurm(
     if modified_bases_models_str:
         modified_bases_models_arg = f"--modified-bases-models {modified_bases_models_str}"
 
+    # Multi-GPU jobs run the basecaller on all allocated GPUs
+    device_arg = "--device cuda:all" if gpus > 1 else ""
+
+    # Job arrays get one output file per task
+    output_file = f"{script_file}.%A_%a.out" if array_size else f"{script_file}.%j.out"
+
     slurm_script = f"""\
         #!/bin/bash
         #SBATCH --account           {slurm_account}
         #SBATCH --time              {walltime}
-        #SBATCH --cpus-per-task     2
-        #SBATCH --mem               32g
-        #SBATCH --partition         gpu
-        #SBATCH --gres              gpu:1
+        #SBATCH --cpus-per-task     {resources.cpus * gpus}
+        #SBATCH --mem               {resources.mem_gb * gpus}g
+        #SBATCH --partition         {target.partition}
+        #SBATCH --gres              {target.get_gres(gpus)}
         #SBATCH --mail-type         FAIL
         {f"#SBATCH --mail-user         {mail_user}" if mail_user else ""}
-        #SBATCH --output            {batch.script_file}.%j.out
-        #SBATCH --job-name          eldorado-basecalling-{batch.run.metadata.library_pool_id}-{batch.batch_id}
+        {f"#SBATCH --array             1-{array_size}" if array_size else ""}
+        {f"#SBATCH --comment           {comment}" if comment else ""}
+        #SBATCH --output            {output_file}
+        #SBATCH --job-name          {job_name}
         
         set -eu
-        # Trap all lock files
-        LOCK_FILES_LIST=({lock_files_str})
-        trap 'for LOCK_FILE in ${{LOCK_FILES_LIST[@]}}; do rm -f $LOCK_FILE; done' EXIT
 
         # Log start time
         START=$(date '+%Y-%m-%d %H:%M:%S')
         START_S=$(date '+%s')
         
         # Create working directory
-        OUTDIR="{batch.working_dir}"
+        {outdir_setup}
         mkdir -p "$OUTDIR"
 
+        # Batch files
+        POD5_MANIFEST="$OUTDIR/{BATCH_MANIFEST}"
+        OUTPUT_BAM="$OUTDIR/{BATCH_BAM}"
+        LOG_FILE="$OUTDIR/{BATCH_LOG}"
+        DONE_FILE="$OUTDIR/{BATCH_DONE}"
+
         # Create temp bam on scratch
         TEMP_BAM_FILE="$OUTDIR/tmp.bam.$SLURM_JOB_ID"
 
@@ -255,22 +694,22 @@ def submit_basecalling_batch_to_slurm(
         mkdir -p $POD5_DIR_TEMP
         
         # Link pod5 files to scratch
-        POD5_FILES_LIST=({pod5_files_str})
-        for POD5_FILE in ${{POD5_FILES_LIST[@]}}
+        while read -r POD5_FILE
         do
-            ln -s $POD5_FILE $POD5_DIR_TEMP
-        done
+            ln -sf $POD5_FILE $POD5_DIR_TEMP
+        done < $POD5_MANIFEST
 
         # Run basecaller
         {dorado_executable} basecaller \\
             --no-trim \\
+            {device_arg} \\
             {modified_bases_models_arg} \\
             {basecalling_model} \\
             $POD5_DIR_TEMP \\
         > ${{TEMP_BAM_FILE}}
 
         # Move temp file to output 
-        mv ${{TEMP_BAM_FILE}} {batch.output_bam}
+        mv ${{TEMP_BAM_FILE}} $OUTPUT_BAM
 
         # Log end time
         END=$(date '+%Y-%m-%d %H:%M:%S')
@@ -279,16 +718,17 @@ def submit_basecalling_batch_to_slurm(
 
         # Get size of input and output
         POD5_SIZE=$(du -sL $POD5_DIR_TEMP | cut -f1)
-        POD5_FILE_COUNT={len(batch.pod5_files)}
-        OUTPUT_BAM_SIZE=$(du -sL {batch.output_bam} | cut -f1)
-        BAM_READ_COUNT=$(samtools view -c {batch.output_bam})
+        POD5_FILE_COUNT=$(wc -l < $POD5_MANIFEST)
+        OUTPUT_BAM_SIZE=$(du -sL $OUTPUT_BAM | cut -f1)
+        BAM_READ_COUNT=$(samtools view -c $OUTPUT_BAM)
 
         # Write log file
-        LOG_FILE={batch.log_file}
         echo "slurm_job_id=$SLURM_JOB_ID" >> ${{LOG_FILE}}
+        echo "partition={target.label}" >> ${{LOG_FILE}}
+        echo "gpus={gpus}" >> ${{LOG_FILE}}
         echo "pod5_size=$POD5_SIZE" >> ${{LOG_FILE}}
         echo "pod5_file_count=$POD5_FILE_COUNT" >> ${{LOG_FILE}}
-        echo "output_bam={batch.output_bam}" >> ${{LOG_FILE}}
+        echo "output_bam=$OUTPUT_BAM" >> ${{LOG_FILE}}
         echo "output_bam_size=$OUTPUT_BAM_SIZE" >> ${{LOG_FILE}}
         echo "bam_read_count=$BAM_READ_COUNT" >> ${{LOG_FILE}}
         echo "start=$START" >> ${{LOG_FILE}}
@@ -298,16 +738,8 @@ def submit_basecalling_batch_to_slurm(
         echo "basecalling_model={basecalling_model}" >> ${{LOG_FILE}}
         echo "modified_bases_models={modified_bases_models_str}" >> ${{LOG_FILE}}
 
-        # Touch done files
-        mkdir -p $(dirname {batch.done_file})
-        touch {batch.done_file}
-        
-        DONE_FILES_LIST=({done_files_str})
-        for DONE_FILE in ${{DONE_FILES_LIST[@]}}
-        do
-            mkdir -p $(dirname $DONE_FILE)
-            touch $DONE_FILE
-        done    
+        # Touch done file
+        touch $DONE_FILE
 
     """
 
@@ -315,22 +747,5 @@ def submit_basecalling_batch_to_slurm(
     slurm_script = textwrap.dedent(slurm_script)
 
     # Write Slurm script to a file
-    logger.info("Writing script to %s", str(batch.script_file))
-    write_to_file(batch.script_file, slurm_script)
-
-    if dry_run:
-        logger.info("Dry run. Skipping submission of basecalling job.")
-        return
-
-    # Submit the job using Slurm
-    std_out = subprocess.run(
-        ["sbatch", "--parsable", str(batch.script_file)],
-        capture_output=True,
-        check=True,
-    )
-
-    # Write job ID to file
-    job_id = std_out.stdout.decode("utf-8").strip()
-    write_to_file(batch.slurm_id_file, job_id)
-
-    logger.info("Submitted basecalling job to SLURM with job ID %s", job_id)
+    logger.info("Writing script to %s", str(script_file))
+    write_to_file(script_file, slurm_script)
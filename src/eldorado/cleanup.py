@@ -4,19 +4,21 @@ import textwrap
 from pathlib import Path
 from typing import Generator, List
 
-from eldorado.filenames import BATCH_LOG
+from eldorado.filenames import BATCH_LOG, DEMUX_DONE, RUN_LOCK
 from eldorado.logging_config import logger
 from eldorado.merging import get_done_batch_dirs
 from eldorado.pod5_handling import SequencingRun
+from eldorado.tombstones import add_tombstone
 
 
 def needs_cleanup(run: SequencingRun) -> bool:
-    return run.demux_done_file.exists()
+    return DEMUX_DONE in run.snapshot.demux_dir_files and not run.is_finalized()
 
 
 def cleanup_output_dir(
     run: SequencingRun,
     mail_user: List[str],
+    tombstone_file: Path | None = None,
 ) -> None:
     # Move demultiplexed bam files to output directory
     demuxed_bam_files = run.demux_working_dir.glob("*.bam")
@@ -41,6 +43,17 @@ def cleanup_output_dir(
     subprocess.run(["rm", "-rf", str(run.demux_working_dir)], check=True)
     logger.info("Removed working directories")
 
+    # Remove the internal files of Eldorado, so the output directory only holds the results
+    # The run lock is still held by this worker, which is fine since the finalized run is not processed again
+    run.state.close()
+    for internal_file in [run.run_state_file, run.metadata_file, run.output_dir / RUN_LOCK]:
+        internal_file.unlink(missing_ok=True)
+    logger.info("Removed run state and metadata")
+
+    # Skip the finalized run in later scans
+    if tombstone_file is not None:
+        add_tombstone(tombstone_file, run.input_pod5_dir)
+
     # Send email
     send_email(
         recipients=mail_user,
@@ -0,0 +1,199 @@
+import csv
+import math
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+from eldorado.constants import BASECALLING_PARTITION, GPU_PARTITION_FIELDS, UNKNOWN_QUEUE_WAIT_SECONDS
+from eldorado.logging_config import logger
+from eldorado.throughput import ThroughputModel
+
+
+@dataclass(frozen=True)
+class GpuTarget:
+    # Partition and GPU type a basecalling job is submitted to. None: Any GPU type of the partition
+    partition: str = BASECALLING_PARTITION
+    gpu_type: str | None = None
+    gpus_per_node: int = 1
+
+    @property
+    def label(self) -> str:
+        # Key of the target in the throughput history
+        return f"{self.partition}:{self.gpu_type}" if self.gpu_type else self.partition
+
+    def get_gres(self, gpus: int = 1) -> str:
+        return f"gpu:{self.gpu_type}:{gpus}" if self.gpu_type else f"gpu:{gpus}"
+
+
+def read_gpu_targets(csv_file: Path) -> List[GpuTarget]:
+    # Candidate partitions and GPU types for basecalling, in order of preference
+    with open(csv_file, "r", encoding="utf-8") as f:
+        dict_reader = csv.DictReader(f, delimiter=",")
+        row_dicts = [{key.strip(): value.strip() if value else "" for key, value in d.items()} for d in dict_reader]
+
+    targets = []
+    for row in row_dicts:
+        if not row.get("partition"):
+            logger.error("Skipping GPU partition without a partition name: %s", row)
+            continue
+        gpus_per_node = row.get("gpus_per_node") or "1"
+        if not gpus_per_node.isdigit() or int(gpus_per_node) < 1:
+            logger.error("Skipping GPU partition %s. Field gpus_per_node must be a positive integer (not %s)", row["partition"], gpus_per_node)
+            continue
+        targets.append(GpuTarget(partition=row["partition"], gpu_type=row.get("gpu_type") or None, gpus_per_node=int(gpus_per_node)))
+
+    if not targets:
+        logger.error("No GPU partitions found in %s. Fields: %s", str(csv_file), GPU_PARTITION_FIELDS)
+    return targets
+
+
+def parse_gres(gres: str) -> List[tuple[str | None, int]]:
+    # GPU type and count of a gres string, e.g. gpu:a100:4(S:0-1),gpu:2 or gres/gpu:a100=1
+    gpus = []
+    for entry in gres.split(","):
+        entry = entry.split("(")[0].removeprefix("gres/").replace("=", ":")
+        parts = entry.split(":")
+        if parts[0] != "gpu":
+            continue
+        if len(parts) == 2 and parts[1].isdigit():
+            gpus.append((None, int(parts[1])))
+        elif len(parts) >= 3 and parts[2].isdigit():
+            gpus.append((parts[1], int(parts[2])))
+        elif len(parts) == 2:
+            gpus.append((parts[1], 1))
+        else:
+            gpus.append((None, 1))
+    return gpus
+
+
+def parse_sinfo_output(output: str) -> dict[GpuTarget, int]:
+    # Free GPUs per partition and GPU type from `sinfo --format "%P|%G|%t|%D"`
+    # Only GPUs of idle nodes are counted as free. Busy partitions are kept with zero free GPUs
+    free_gpus: dict[GpuTarget, int] = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        partition, gres, state, node_count = line.strip().split("|")[:4]
+        partition = partition.rstrip("*")
+        is_idle = state.rstrip("*~#!%$@^-") == "idle"
+        for gpu_type, count in parse_gres(gres):
+            for target in {GpuTarget(partition, gpu_type), GpuTarget(partition, None)}:
+                free_gpus[target] = free_gpus.get(target, 0) + (count * int(node_count) if is_idle else 0)
+    return free_gpus
+
+
+def parse_squeue_start_output(output: str, now: float) -> dict[GpuTarget, float]:
+    # Expected wait in seconds per partition and GPU type from `squeue --start --format "%P|%S|%b"`
+    # A new job is expected to start after the last pending job with a start estimate
+    waits: dict[GpuTarget, float] = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        partitions, start_time, gres = line.strip().split("|")[:3]
+        try:
+            start = datetime.fromisoformat(start_time).timestamp()
+        except ValueError:
+            continue
+        gpus = parse_gres(gres)
+        if not gpus:
+            continue
+        for partition in partitions.split(","):
+            # Jobs without a GPU type wait for any GPU type of the partition
+            gpu_types = {gpu_type for gpu_type, _ in gpus}
+            targets = [GpuTarget(partition, None)] if None in gpu_types else []
+            targets += [GpuTarget(partition, gpu_type) for gpu_type in gpu_types if gpu_type is not None]
+            for target in targets:
+                waits[target] = max(waits.get(target, 0.0), start - now)
+    return waits
+
+
+@dataclass
+class ClusterLoad:
+    # Sample of the GPU partitions, taken once per tick and shared by all runs
+    targets: List[GpuTarget]
+    throughput_model: ThroughputModel | None = None
+    free_gpus: dict[GpuTarget, int] = field(default_factory=dict)
+    waits: dict[GpuTarget, float] = field(default_factory=dict)
+    timestamp: float | None = None
+    is_sampled: bool = False
+
+    # Runs are planned by concurrent workers
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def sample(self) -> None:
+        partitions = ",".join(dict.fromkeys(target.partition for target in self.targets))
+        self.timestamp = time.time()
+        try:
+            sinfo = subprocess.run(
+                ["sinfo", "--noheader", "--partition", partitions, "--format", "%P|%G|%t|%D"],
+                check=True,
+                capture_output=True,
+            )
+            squeue = subprocess.run(
+                ["squeue", "--noheader", "--start", "--states", "PENDING", "--partition", partitions, "--format", "%P|%S|%b"],
+                check=True,
+                capture_output=True,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning("Could not sample GPU partitions %s: %s", partitions, e)
+            return
+        self.free_gpus = parse_sinfo_output(sinfo.stdout.decode("utf-8"))
+        self.waits = parse_squeue_start_output(squeue.stdout.decode("utf-8"), self.timestamp)
+        self.is_sampled = True
+
+    def get_wait(self, target: GpuTarget, gpus: int = 1) -> float:
+        # Without a sample, all targets are ranked by runtime and the order in the config
+        if not self.is_sampled:
+            return 0.0
+        # Targets that sinfo does not report have no nodes to run on
+        key = GpuTarget(target.partition, target.gpu_type)
+        if key not in self.free_gpus:
+            return math.inf
+        if self.free_gpus[key] >= gpus:
+            return 0.0
+
+        # Pending jobs without a GPU type also delay jobs for a specific GPU type
+        waits = [self.waits[x] for x in {key, GpuTarget(target.partition, None)} if x in self.waits]
+        if waits:
+            return max(waits)
+
+        # Targets without free GPUs or start estimates wait for running jobs to finish
+        return UNKNOWN_QUEUE_WAIT_SECONDS
+
+    def take_gpus(self, target: GpuTarget, gpus: int = 1) -> None:
+        # Later batches of this tick can not use the GPUs that are taken by this batch
+        for x in {GpuTarget(target.partition, target.gpu_type), GpuTarget(target.partition, None)}:
+            if x in self.free_gpus:
+                self.free_gpus[x] = max(self.free_gpus[x] - gpus, 0)
+
+    def get_runtime(self, target: GpuTarget, basecalling_model: str, unit: str, cost: int, gpus: int = 1) -> float:
+        # Targets without throughput history are assumed as slow as the slowest known target
+        if self.throughput_model is None:
+            return 0.0
+        rates = {x: self.throughput_model.get_rate(basecalling_model, x.label, unit) for x in self.targets}
+        known_rates = [rate for rate in rates.values() if rate]
+        if not known_rates:
+            return 0.0
+        return cost / ((rates[target] or min(known_rates)) * gpus)
+
+    @property
+    def max_gpus_per_node(self) -> int:
+        return max(target.gpus_per_node for target in self.targets)
+
+    def choose_target(self, basecalling_model: str, unit: str, cost: int, gpus: int = 1) -> GpuTarget:
+        # Lowest expected completion time, i.e. queue wait plus predicted runtime. Ties go to the first target in the config
+        # Multi-GPU batches only go to targets with enough GPUs per node
+        with self.lock:
+            if self.timestamp is None:
+                self.sample()
+            target = min(
+                [x for x in self.targets if x.gpus_per_node >= gpus] or self.targets,
+                key=lambda x: self.get_wait(x, gpus) + self.get_runtime(x, basecalling_model, unit, cost, gpus),
+            )
+
+            self.take_gpus(target, gpus)
+            return target
@@ -1,24 +1,30 @@
 import csv
 import json
 import re
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
 from typing import List, Tuple
 
-import pod5
-
 from eldorado.constants import (
     ACCOUNT,
     BASECALLING_MODEL,
+    BATCH_PACKING,
+    BATCH_PACKING_MODES,
+    BATCH_PACKING_SEQUENTIAL,
     DEFAULT_PROJECT_NAME,
     DORADO_EXECUTABLE,
+    MAX_GPU_JOBS_PER_TICK,
+    MAX_INFLIGHT_BYTES,
+    MAX_INFLIGHT_GPU_JOBS,
     MOD_5MCG_5HMCG,
     MOD_6MA,
+    PRIORITY,
     PROJECT_ID,
     REQUIRED_PROJECT_CONFIG_FIELDS,
 )
 from eldorado.logging_config import logger
-from eldorado.utils import is_complete_pod5_file, write_to_file
+from eldorado.resources import DEFAULT_RESOURCES, SlurmResources, is_resource_row_valid, parse_resource_profiles
+from eldorado.utils import iter_complete_pod5_files, write_to_file
 
 
 @dataclass
@@ -30,6 +36,17 @@ class Metadata:
     flow_cell_product_code: str
     sequencing_kit: str
 
+    def save(self, path: Path):
+        content = json.dumps(asdict(self), indent=4)
+        write_to_file(path, content)
+
+    @classmethod
+    def load(cls, path: Path):
+        with open(path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+
+        return cls(**metadata)
+
 
 @dataclass
 class ProjectConfig:
@@ -39,6 +56,12 @@ class ProjectConfig:
     basecalling_model: Path | None  # None: Auto select model
     mod_5mcg_5hmcg: bool
     mod_6ma: bool
+    batch_packing: str = BATCH_PACKING_SEQUENTIAL
+    priority: int = 0
+    max_gpu_jobs_per_tick: int | None = None  # None: No limit
+    max_inflight_gpu_jobs: int | None = None  # None: No limit
+    max_inflight_bytes: int | None = None  # None: No limit
+    resource_profiles: dict[str, SlurmResources] = field(default_factory=lambda: dict(DEFAULT_RESOURCES))
 
 
 @dataclass
@@ -75,14 +98,21 @@ def get_metadata(pod5_dir: Path) -> Metadata:
     pod5_files = pod5_dir.glob("*.pod5")
 
     # Get first complete pod5 file
-    first_complete_pod5_file = next((pod5 for pod5 in pod5_files if is_complete_pod5_file(pod5)), None)
+    first_complete_pod5_file = next(iter_complete_pod5_files(pod5_files), None)
 
     # If no pod5 files are found raise error
     if first_complete_pod5_file is None:
         raise FileNotFoundError(f"No pod5 files found in directory {pod5_dir}")
 
+    return read_metadata(first_complete_pod5_file)
+
+
+def read_metadata(pod5_file: Path) -> Metadata:
+    # Import pod5 (and pyarrow/numpy) on first use to keep start up of the scheduler fast
+    import pod5
+
     # Get first read from file
-    first_pod5_read = next(pod5.Reader(first_complete_pod5_file).reads())
+    first_pod5_read = next(pod5.Reader(pod5_file).reads())
 
     # Unpack run info
     run_info = first_pod5_read.run_info
@@ -115,6 +145,12 @@ def get_default_project_config(row_dicts: List[dict]) -> ProjectConfig:
                 basecalling_model=basecalling_model,
                 mod_5mcg_5hmcg=bool(int(mod_5mcg_5hmcg)),
                 mod_6ma=bool(int(mod_6ma)),
+                batch_packing=row.get(BATCH_PACKING) or BATCH_PACKING_SEQUENTIAL,
+                priority=int(row.get(PRIORITY) or 0),
+                max_gpu_jobs_per_tick=parse_optional_int(row.get(MAX_GPU_JOBS_PER_TICK)),
+                max_inflight_gpu_jobs=parse_optional_int(row.get(MAX_INFLIGHT_GPU_JOBS)),
+                max_inflight_bytes=parse_optional_int(row.get(MAX_INFLIGHT_BYTES)),
+                resource_profiles=parse_resource_profiles(row, DEFAULT_RESOURCES),
             )
 
     logger.error("Default project %s not found in project configs file!", DEFAULT_PROJECT_NAME)
@@ -194,6 +230,16 @@ def get_config_from_row(row: dict, project_defaults: ProjectConfig) -> ProjectCo
     dorado_executable = Path(dorado_executable_input) if dorado_executable_input else project_defaults.dorado_executable
     mod_5mcg_5hmcg = bool(int(mod_5mcg_5hmcg_input)) if mod_5mcg_5hmcg_input else project_defaults.mod_5mcg_5hmcg
     mod_6ma = bool(int(mod_6ma_input)) if mod_6ma_input else project_defaults.mod_6ma
+    batch_packing = row.get(BATCH_PACKING) or project_defaults.batch_packing
+    priority = int(row[PRIORITY]) if row.get(PRIORITY) else project_defaults.priority
+    max_gpu_jobs_per_tick = (
+        parse_optional_int(row[MAX_GPU_JOBS_PER_TICK]) if row.get(MAX_GPU_JOBS_PER_TICK) else project_defaults.max_gpu_jobs_per_tick
+    )
+    max_inflight_gpu_jobs = (
+        parse_optional_int(row[MAX_INFLIGHT_GPU_JOBS]) if row.get(MAX_INFLIGHT_GPU_JOBS) else project_defaults.max_inflight_gpu_jobs
+    )
+    max_inflight_bytes = parse_optional_int(row[MAX_INFLIGHT_BYTES]) if row.get(MAX_INFLIGHT_BYTES) else project_defaults.max_inflight_bytes
+    resource_profiles = parse_resource_profiles(row, project_defaults.resource_profiles)
 
     # Basecalling model: Set to None if "auto". This will be resolved later per metadata
     basecalling_model = (
@@ -212,6 +258,12 @@ def get_config_from_row(row: dict, project_defaults: ProjectConfig) -> ProjectCo
         basecalling_model,
         mod_5mcg_5hmcg,
         mod_6ma,
+        batch_packing,
+        priority,
+        max_gpu_jobs_per_tick,
+        max_inflight_gpu_jobs,
+        max_inflight_bytes,
+        resource_profiles,
     )
 
 
@@ -242,9 +294,32 @@ def is_row_inputs_valid(
             logger.error("Field %s must be either 0 or 1 (not %s) for project %s", field_name, field, project_id_input)
             return False
 
+    batch_packing_input = row.get(BATCH_PACKING)
+    if batch_packing_input and batch_packing_input not in BATCH_PACKING_MODES:
+        logger.error("Field %s must be one of %s (not %s) for project %s", BATCH_PACKING, BATCH_PACKING_MODES, batch_packing_input, project_id_input)
+        return False
+
+    priority_input = row.get(PRIORITY)
+    if priority_input and not re.fullmatch(r"-?\d+", priority_input):
+        logger.error("Field %s must be an integer (not %s) for project %s", PRIORITY, priority_input, project_id_input)
+        return False
+
+    for field_name in [MAX_GPU_JOBS_PER_TICK, MAX_INFLIGHT_GPU_JOBS, MAX_INFLIGHT_BYTES]:
+        field = row.get(field_name)
+        if field and not field.isdigit():
+            logger.error("Field %s must be a non-negative integer (not %s) for project %s", field_name, field, project_id_input)
+            return False
+
+    if not is_resource_row_valid(row, project_id_input):
+        return False
+
     return True
 
 
+def parse_optional_int(value: str | None) -> int | None:
+    return int(value) if value else None
+
+
 def is_basecalling_model_path_valid(basecalling_model_path: Path):
     return basecalling_model_path.is_dir()
 
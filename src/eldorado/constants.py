@@ -15,8 +15,68 @@ REQUIRED_PROJECT_CONFIG_FIELDS = [
     MOD_6MA,
 ]
 
+# Optional fields. Empty or missing values use the default project
+BATCH_PACKING = "batch_packing"
+PRIORITY = "priority"  # Higher priority projects get GPU jobs first
+MAX_GPU_JOBS_PER_TICK = "max_gpu_jobs_per_tick"
+MAX_INFLIGHT_GPU_JOBS = "max_inflight_gpu_jobs"
+MAX_INFLIGHT_BYTES = "max_inflight_bytes"
+
+# Slurm resources per stage, e.g. merging_cpus. Empty or missing values use the default project
+RESOURCE_FIELDS = ["cpus", "mem_gb", "walltime", "partition"]
+
 DEFAULT_PROJECT_NAME = "default"
 
+# Batch packing modes
+BATCH_PACKING_SEQUENTIAL = "sequential"  # Fill batches in file order
+BATCH_PACKING_BALANCED = "balanced"  # Spread files over the fewest batches of nearly equal size
+BATCH_PACKING_MODES = [BATCH_PACKING_SEQUENTIAL, BATCH_PACKING_BALANCED]
+
+# Runs with at least this many files are packed with NumPy
+BALANCED_PACKING_NUMPY_THRESHOLD = 50_000
+
+# Stages of a sequencing run
+STAGE_BASECALLING = "basecalling"
+STAGE_MERGING = "merging"
+STAGE_DEMULTIPLEXING = "demultiplexing"
+STAGE_CLEANUP = "cleanup"
+STAGES = [STAGE_BASECALLING, STAGE_MERGING, STAGE_DEMULTIPLEXING, STAGE_CLEANUP]
+
+# Slurm
+JOB_NAME_PREFIX = "eldorado-"
+BASECALLING_JOB_NAME_PREFIX = f"{JOB_NAME_PREFIX}basecalling-"
+SLURM_QUEUE_TTL_SECONDS = 120
+BASECALLING_PARTITION = "gpu"
+
+# GPU partitions
+GPU_PARTITION_FIELDS = ["partition", "gpu_type", "gpus_per_node"]
+UNKNOWN_QUEUE_WAIT_SECONDS = 60 * 60  # Assumed wait for a busy partition without start estimates
+
+# Basecalling throughput model. Rates are fitted from the most recent batches of each basecalling model and partition
+THROUGHPUT_HISTORY_SIZE = 50
+THROUGHPUT_MIN_RECORDS = 3
+
+# Walltime of basecalling jobs predicted by the throughput model
+WALLTIME_SAFETY_FACTOR = 1.5
+WALLTIME_OVERHEAD_SECONDS = 15 * 60  # Loading the model and staging files
+WALLTIME_MIN_SECONDS = 30 * 60
+
+# Memory and CPUs of merging and demultiplexing jobs predicted from the resource history
+RESOURCE_HISTORY_SIZE = 50
+RESOURCE_MIN_RECORDS = 3
+RESOURCE_HEADROOM_FACTOR = 1.5
+RESOURCE_MEM_TIERS_GB = [4, 8, 16, 32, 64, 128, 256, 512]
+
+# Number of pod5 files checked for a shared protocol run ID and sample rate when extracting metadata
+METADATA_SAMPLE_SIZE = 8
+
+# Recheck interval for runs that are idle and unchanged since the last scan (doubled for each unchanged recheck)
+SCAN_BACKOFF_BASE_SECONDS = 15 * 60
+SCAN_BACKOFF_MAX_SECONDS = 24 * 60 * 60
+
+# Number of pod5 files probed concurrently for completeness
+POD5_PROBE_WORKERS = 16
+
 BARCODING_KITS = [
     "EXP-NBD103",
     "EXP-NBD104",
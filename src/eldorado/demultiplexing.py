@@ -1,12 +1,13 @@
-import subprocess
 import textwrap
 from pathlib import Path
 from typing import List
 
-from eldorado.constants import BARCODING_KITS
+from eldorado.constants import BARCODING_KITS, STAGE_DEMULTIPLEXING
+from eldorado.filenames import DEMUX_DONE, DEMUX_LOCK, DORADO_CONFIG, MERGE_BAM, MERGE_DONE
 from eldorado.logging_config import logger
 from eldorado.pod5_handling import SequencingRun
-from eldorado.utils import is_in_queue, write_to_file
+from eldorado.resources import DEFAULT_RESOURCES, SlurmResources
+from eldorado.utils import is_in_queue, submit_slurm_script, write_to_file
 
 
 def submit_demux_to_slurm(
@@ -15,7 +16,9 @@ def submit_demux_to_slurm(
     dry_run: bool,
     slrum_account: str,
     mail_user: List[str],
-):
+    dependency: List[str] | None = None,
+    resources: SlurmResources = DEFAULT_RESOURCES[STAGE_DEMULTIPLEXING],
+) -> str | None:
     # Handle sample sheet without alias and barcode
     if sample_sheet_is_valid(sample_sheet):
         sample_sheet_option = f"--sample-sheet {sample_sheet}"
@@ -26,9 +29,10 @@ def submit_demux_to_slurm(
     slurm_script = f"""\
         #!/bin/bash
         #SBATCH --account           {slrum_account}
-        #SBATCH --time              12:00:00
-        #SBATCH --cpus-per-task     16
-        #SBATCH --mem               128g
+        #SBATCH --time              {resources.walltime}
+        #SBATCH --cpus-per-task     {resources.cpus}
+        #SBATCH --mem               {resources.mem_gb}g
+        {resources.get_partition_directive()}
         #SBATCH --mail-type         FAIL
         #SBATCH --mail-user         {mail_user[0]}
         #SBATCH --output            {run.demux_script_file}.%j.out
@@ -73,33 +77,65 @@ def submit_demux_to_slurm(
 
     if dry_run:
         logger.info("Dry run. Skipping submission of job to Slurm.")
-        return
+        return None
 
     # Submit the job using Slurm
-    std_out = subprocess.run(
-        ["sbatch", "--parsable", str(run.demux_script_file)],
-        capture_output=True,
-        check=True,
-    )
+    job_id = submit_slurm_script(run.demux_script_file, dependency=dependency)
 
     # Create .lock file
     run.demux_lock_file.parent.mkdir(parents=True, exist_ok=True)
     run.demux_lock_file.touch()
 
     # Write job ID to file
-    job_id = std_out.stdout.decode().strip()
     write_to_file(run.demux_job_id_file, job_id)
 
     logger.info("Submitted job to Slurm with ID %s", job_id)
+    return job_id
 
 
 def demultiplexing_is_pending(run: SequencingRun) -> bool:
     return (
-        not run.demux_done_file.exists()
-        and not run.demux_lock_file.exists()
-        and run.dorado_config_file.exists()
-        and run.merge_done_file.exists()
-        and run.merged_bam.exists()
+        DEMUX_DONE not in run.snapshot.demux_dir_files
+        and DEMUX_LOCK not in run.snapshot.demux_dir_files
+        and not run.is_finalized()
+        and DORADO_CONFIG in run.snapshot.output_dir_files
+        and MERGE_DONE in run.snapshot.merging_dir_files
+        and MERGE_BAM in run.snapshot.merging_dir_files
+    )
+
+
+def demultiplexing_can_be_chained(run: SequencingRun) -> bool:
+    # Only demultiplexing of barcoded runs runs as a Slurm job that can wait for merging
+    return (
+        DEMUX_DONE not in run.snapshot.demux_dir_files
+        and DEMUX_LOCK not in run.snapshot.demux_dir_files
+        and not run.is_finalized()
+        and DORADO_CONFIG in run.snapshot.output_dir_files
+        and run.metadata.sequencing_kit in BARCODING_KITS
+        and run.get_sample_sheet() is not None
+    )
+
+
+def submit_chained_demux_to_slurm(
+    run: SequencingRun,
+    merge_job_id: str,
+    mail_user: List[str],
+    slurm_account: str,
+    dry_run: bool,
+    resources: SlurmResources = DEFAULT_RESOURCES[STAGE_DEMULTIPLEXING],
+) -> str | None:
+    sample_sheet = run.get_sample_sheet()
+    if sample_sheet is None:
+        return None
+
+    return submit_demux_to_slurm(
+        run=run,
+        sample_sheet=sample_sheet,
+        dry_run=dry_run,
+        mail_user=mail_user,
+        slrum_account=slurm_account,
+        dependency=[merge_job_id],
+        resources=resources,
     )
 
 
@@ -108,7 +144,10 @@ def process_demultiplexing(
     mail_user: List[str],
     slurm_account: str,
     dry_run: bool,
-):
+    resources: SlurmResources = DEFAULT_RESOURCES[STAGE_DEMULTIPLEXING],
+) -> bool:
+    # Return True if demultiplexing completed without a Slurm job
+
     # Skip demultiplexing if sequencing kit is not a barcoding kit
     if run.metadata.sequencing_kit not in BARCODING_KITS:
         logger.info("Kit %s is not a barcoding kit.", run.metadata.sequencing_kit)
@@ -121,13 +160,13 @@ def process_demultiplexing(
         # Create done file
         run.demux_done_file.parent.mkdir(parents=True, exist_ok=True)
         run.demux_done_file.touch()
-        return
+        return True
 
     # Get sample sheet
     sample_sheet = run.get_sample_sheet()
     if sample_sheet is None:
         logger.error("Sample sheet not found for %s. Waiting for sample sheet to be uploaded.", run.metadata.library_pool_id)
-        return
+        return False
 
     # Submit job to Slurm
     submit_demux_to_slurm(
@@ -136,7 +175,9 @@ def process_demultiplexing(
         dry_run=dry_run,
         mail_user=mail_user,
         slrum_account=slurm_account,
+        resources=resources,
     )
+    return False
 
 
 def sample_sheet_is_valid(sample_sheet: Path) -> bool:
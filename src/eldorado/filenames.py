@@ -1,5 +1,10 @@
 # Description: Filenames used in the Eldorado project.
 
+# Root directory
+TOMBSTONES = "eldorado_tombstones.txt"
+THROUGHPUT_HISTORY = "eldorado_throughput.csv"
+RESOURCE_HISTORY = "eldorado_resources.csv"
+
 # Sequencing run
 # General
 OUTPUT_DIR_SUFFIX = "_eldorado"
@@ -8,9 +13,17 @@ BASECALLING_SUMMARY = "basecalling_summary.csv"
 # Dorado config
 DORADO_CONFIG = "dorado_config.json"
 
+# Metadata
+METADATA = "metadata.json"
+
+# Run state
+RUN_STATE = "run_state.sqlite3"
+RUN_LOCK = "eldorado.lock"
+
 # Basecalling
 BC_DIR = "basecalling"
 BC_BATCHES_DIR = "batches"
+# Marker directories used before the run state store (only read by reindex)
 BC_POD5_DIR = "transferred_pod5_files"
 BC_LOCK_DIR = "lock_files"
 BC_DONE_DIR = "done_files"
@@ -23,6 +36,12 @@ BATCH_JOB_ID = "batch_job_id.txt"
 BATCH_MANIFEST = "pod5_manifest.txt"
 BATCH_SCRIPT = "run_basecaller.sh"
 
+# Job arrays
+BC_ARRAYS_DIR = "arrays"
+ARRAY_SCRIPT = "run_basecaller_array.sh"
+ARRAY_MANIFEST = "batch_manifest.txt"
+ARRAY_JOB_ID = "array_job_id.txt"
+
 # Merging
 MERGE_DIR = "merging"
 MERGE_BAM = "merged.bam"
@@ -1,12 +1,35 @@
 import logging
 import logging.handlers
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
+from typing import Generator
 
 # Formatting
-FORMAT = "%(levelname)s\t[%(asctime)s]\t[%(filename)s:%(lineno)d]\t%(message)s"
+FORMAT = "%(levelname)s\t[%(asctime)s]\t[%(filename)s:%(lineno)d]\t[%(run)s]\t%(message)s"
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 formatter = logging.Formatter(FORMAT, DATE_FORMAT)
 
+# Sequencing run that is processed in the current thread
+run_context: ContextVar[str] = ContextVar("run_context", default="-")
+
+
+class RunContextFilter(logging.Filter):
+    # Add the sequencing run to each record, so interleaved log lines of concurrent runs stay attributable
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run = run_context.get()
+        return True
+
+
+@contextmanager
+def run_log_context(run: str) -> Generator[None, None, None]:
+    token = run_context.set(run)
+    try:
+        yield
+    finally:
+        run_context.reset(token)
+
+
 # Configure logger
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -17,4 +40,5 @@ def set_log_file_handler(ll: logging.Logger, log_file: Path) -> None:
     # Create new log file every monday
     file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when="W0", backupCount=8)
     file_handler.setFormatter(formatter)
+    file_handler.addFilter(RunContextFilter())
     ll.addHandler(file_handler)
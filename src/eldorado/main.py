@@ -1,20 +1,112 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from functools import partial
 from pathlib import Path
 
 import typer
 from typing_extensions import Annotated, List, Optional
 
-from eldorado.basecalling import SequencingRun, basecalling_is_pending, cleanup_basecalling_lock_files, process_unbasecalled_pod5_files
+from eldorado.basecalling import (
+    PlannedBatch,
+    SequencingRun,
+    basecalling_is_pending,
+    cleanup_basecalling_lock_files,
+    get_basecalling_job_ids,
+    get_batch_deadline,
+    plan_basecalling_batches,
+    process_unbasecalled_pod5_files,
+    submit_basecalling_batches,
+)
 from eldorado.cleanup import cleanup_output_dir, needs_cleanup
-from eldorado.configuration import get_dorado_config, get_project_configs
-from eldorado.demultiplexing import cleanup_demultiplexing_lock_files, demultiplexing_is_pending, process_demultiplexing
-from eldorado.logging_config import logger, set_log_file_handler
-from eldorado.merging import cleanup_merge_lock_files, merging_is_pending, submit_merging_to_slurm
-from eldorado.pod5_handling import contains_pod5_files, find_sequencning_runs_for_processing, needs_basecalling, update_transferred_pod5_files
+from eldorado.cluster import ClusterLoad, read_gpu_targets
+from eldorado.configuration import ProjectConfig, get_dorado_config, get_project_configs
+from eldorado.constants import (
+    BASECALLING_JOB_NAME_PREFIX,
+    BATCH_PACKING_MODES,
+    BATCH_PACKING_SEQUENTIAL,
+    DEFAULT_PROJECT_NAME,
+    STAGE_BASECALLING,
+    STAGE_CLEANUP,
+    STAGE_DEMULTIPLEXING,
+    STAGE_MERGING,
+    STAGES,
+)
+from eldorado.demultiplexing import (
+    cleanup_demultiplexing_lock_files,
+    demultiplexing_can_be_chained,
+    demultiplexing_is_pending,
+    process_demultiplexing,
+    submit_chained_demux_to_slurm,
+)
+from eldorado.filenames import RESOURCE_HISTORY, RUN_LOCK, THROUGHPUT_HISTORY, TOMBSTONES
+from eldorado.logging_config import logger, run_log_context, set_log_file_handler
+from eldorado.merging import cleanup_merge_lock_files, merging_can_be_chained, merging_is_pending, submit_merging_to_slurm
+from eldorado.planning import GpuPlanner, ProjectUsage, RunPlan, get_inflight_usage
+from eldorado.pod5_handling import (
+    contains_pod5_files,
+    discover_pod5_dirs,
+    find_sequencing_runs_for_processing,
+    needs_basecalling,
+    update_scan_cursor,
+    update_transferred_pod5_files,
+)
+from eldorado.resource_history import ResourceModel, collect_job_resources, load_resource_model, right_size_resource_profiles
+from eldorado.resources import get_resources
+from eldorado.run_state import TRANSFERRED
+from eldorado.throughput import ThroughputModel, load_throughput_model
+from eldorado.tombstones import add_tombstone, read_tombstones, remove_tombstone
+from eldorado.utils import parse_walltime, slurm_queue, try_lock_file
 
 # Set up the CLI
 app = typer.Typer()
 
 
+@dataclass
+class RunOptions:
+    # Options of a scheduler or manual run, shared by all sequencing runs. Project settings are read from the ProjectConfig
+    models_dir: Path
+    mail_users: List[str]
+    walltime: str = "12:00:00"
+    job_array: bool = False
+    min_batch_size: int = 1 * 1024**3
+    max_batch_size: int = 10 * 1024**3
+    min_batch_samples: int | None = None
+    max_batch_samples: int | None = None
+    max_batch_wait: str | None = None
+    target_runtime: str | None = None
+    multi_gpu_threshold: int | None = None
+    run_basecalling: bool = True
+    run_merging: bool = True
+    run_demultiplexing: bool = True
+    run_cleanup: bool = True
+    dry_run: bool = False
+
+    # Files and models shared by the runs of a tick
+    tombstone_file: Path | None = None
+    history_file: Path | None = None
+    throughput_model: ThroughputModel | None = None
+    resource_history_file: Path | None = None
+    resource_model: ResourceModel | None = None
+    cluster_load: ClusterLoad | None = None
+    gpu_planner: GpuPlanner | None = None
+
+
+def validate_batch_packing(value: str) -> str:
+    if value not in BATCH_PACKING_MODES:
+        raise typer.BadParameter(f"Must be one of {BATCH_PACKING_MODES}")
+    return value
+
+
+def validate_walltime(value: str | None) -> str | None:
+    if value is not None:
+        try:
+            parse_walltime(value)
+        except ValueError as e:
+            raise typer.BadParameter("Must be in the format [D-]HH:MM:SS") from e
+    return value
+
+
 @app.command()
 def scheduler(
     root_dir: Annotated[
@@ -83,6 +175,66 @@ def scheduler(
             help="Basecalling walltime for SLURM. Default: 12 hours",
         ),
     ] = "12:00:00",
+    job_array: Annotated[
+        bool,
+        typer.Option(
+            "--job-array",
+            help="Submit basecalling batches as a single Slurm job array",
+        ),
+    ] = False,
+    target_runtime: Annotated[
+        Optional[str],
+        typer.Option(
+            "--target-runtime",
+            help="Limit basecalling batches to the size predicted to finish within this time (HH:MM:SS), based on earlier batches",
+            callback=validate_walltime,
+        ),
+    ] = None,
+    gpu_partitions_csv: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--gpu-partitions",
+            help="Path to a file (.csv) with the candidate partitions and GPU types for basecalling. Each batch goes to the one where it is expected to finish first",
+            file_okay=True,
+            dir_okay=False,
+            readable=True,
+            resolve_path=True,
+        ),
+    ] = None,
+    multi_gpu_threshold: Annotated[
+        Optional[int],
+        typer.Option(
+            "--multi-gpu-threshold",
+            help="Basecalling batches above this size in bytes (B) request several GPUs on one node, up to gpus_per_node of the GPU partitions",
+            min=1,
+        ),
+    ] = None,
+    max_gpu_jobs_per_tick: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-gpu-jobs-per-tick",
+            help="Maximum number of basecalling jobs submitted per run of the scheduler",
+            min=0,
+        ),
+    ] = None,
+    max_inflight_gpu_jobs: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-inflight-gpu-jobs",
+            help="Maximum number of basecalling jobs in the Slurm queue",
+            min=0,
+        ),
+    ] = None,
+    # Concurrency
+    workers: Annotated[
+        int,
+        typer.Option(
+            "--workers",
+            "-n",
+            help="Number of sequencing runs processed concurrently. Default: 1",
+            min=1,
+        ),
+    ] = 1,
     # Batching options
     min_batch_size: Annotated[
         int,
@@ -100,6 +252,28 @@ def scheduler(
             help="Maximum batch size in  bytes (B). Default: 10 GB",
         ),
     ] = (10 * 1024**3),
+    min_batch_samples: Annotated[
+        Optional[int],
+        typer.Option(
+            "--min-batch-samples",
+            help="Minimum batch size in signal samples. Batches are sized by signal samples instead of bytes if set",
+        ),
+    ] = None,
+    max_batch_samples: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-batch-samples",
+            help="Maximum batch size in signal samples. Batches are sized by signal samples instead of bytes if set",
+        ),
+    ] = None,
+    max_batch_wait: Annotated[
+        Optional[str],
+        typer.Option(
+            "--max-batch-wait",
+            help="Submit a batch smaller than the minimum batch size once the oldest unbasecalled file has waited this long (HH:MM:SS)",
+            callback=validate_walltime,
+        ),
+    ] = None,
     # Dry run
     dry_run: Annotated[
         bool,
@@ -120,41 +294,74 @@ def scheduler(
     logger.info("Loading project configs from %s", str(configs_csv))
     project_configs = get_project_configs(configs_csv)
 
-    # Process sequencing runs for each project
-    for project_config in project_configs:
-        # Find pod5 dirs that needs processing (pattern: [project_id]/[sample_id]/[run_id]/pod5*)
-        pattern = f"{project_config.project_id}/*/*/pod5*"
-        runs = find_sequencning_runs_for_processing(root_dir, pattern)
+    # Load finalized runs
+    tombstone_file = root_dir / TOMBSTONES
+    tombstones = read_tombstones(tombstone_file)
 
-        # Skip if no runs found
-        if not runs:
-            continue
+    # Fit basecalling throughput from earlier batches
+    history_file = root_dir / THROUGHPUT_HISTORY
+    throughput_model = load_throughput_model(history_file)
 
-        # Process each run
-        logger.info("Processing project %s", project_config.project_id)
-        logger.info("Found %d pod5 dir(s) that needs processing", len(runs))
+    # Load the memory and CPU usage of earlier merging and demultiplexing jobs
+    resource_history_file = root_dir / RESOURCE_HISTORY
+    resource_model = load_resource_model(resource_history_file)
 
-        for run in runs:
-            process_sequencing_run(
-                run=run,
-                # Project config
-                dorado_executable=project_config.dorado_executable,
-                basecalling_model=project_config.basecalling_model,
-                mod_5mcg_5hmcg=project_config.mod_5mcg_5hmcg,
-                mod_6ma=project_config.mod_6ma,
-                slurm_account=project_config.account,
-                # Other options
-                models_dir=models_dir,
-                run_basecalling=True,
-                run_merging=True,
-                run_demultiplexing=True,
-                run_cleanup=True,
-                mail_users=mail_user,
-                walltime=walltime,
-                min_batch_size=min_batch_size,
-                max_batch_size=max_batch_size,
-                dry_run=dry_run,
-            )
+    # Sample the load of the candidate GPU partitions once for all runs
+    cluster_load = None
+    if gpu_partitions_csv is not None:
+        logger.info("Loading GPU partitions from %s", str(gpu_partitions_csv))
+        gpu_targets = read_gpu_targets(gpu_partitions_csv)
+        cluster_load = ClusterLoad(gpu_targets, throughput_model) if gpu_targets else None
+
+    # Process runs concurrently, while the root directory is walked once for all projects
+    project_configs_by_id = {project_config.project_id: project_config for project_config in project_configs}
+    gpu_planner = GpuPlanner(
+        project_configs_by_id=project_configs_by_id,
+        max_jobs_per_tick=max_gpu_jobs_per_tick,
+        max_inflight_jobs=max_inflight_gpu_jobs,
+    )
+    options = RunOptions(
+        models_dir=models_dir,
+        mail_users=mail_user,
+        walltime=walltime,
+        job_array=job_array,
+        min_batch_size=min_batch_size,
+        max_batch_size=max_batch_size,
+        min_batch_samples=min_batch_samples,
+        max_batch_samples=max_batch_samples,
+        max_batch_wait=max_batch_wait,
+        target_runtime=target_runtime,
+        multi_gpu_threshold=multi_gpu_threshold,
+        dry_run=dry_run,
+        tombstone_file=tombstone_file,
+        history_file=history_file,
+        throughput_model=throughput_model,
+        resource_history_file=resource_history_file,
+        resource_model=resource_model,
+        cluster_load=cluster_load,
+        gpu_planner=gpu_planner,
+    )
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for project_id, run in find_sequencing_runs_for_processing(root_dir, project_configs_by_id, tombstones):
+            logger.info("Found pod5 dir that needs processing in project %s: %s", project_id, str(run.input_pod5_dir))
+            future = executor.submit(process_sequencing_run_exclusively, run=run, project_config=project_configs_by_id[project_id], options=options)
+            futures[future] = run
+
+        # A failing run does not stop the other runs
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception:
+                logger.exception("Failed to process %s", str(futures[future].input_pod5_dir))
+
+    # Submit the basecalling batches of all runs by rank within the GPU job budget. Queued jobs are read from a single squeue call
+    inflight_jobs = 0
+    inflight_by_project = {}
+    if gpu_planner.plans and gpu_planner.has_inflight_caps():
+        inflight_jobs = slurm_queue.count_jobs(BASECALLING_JOB_NAME_PREFIX)
+        inflight_by_project = get_inflight_usage(slurm_queue.get_comments(BASECALLING_JOB_NAME_PREFIX))
+    submit_planned_batches(gpu_planner, inflight_jobs, inflight_by_project)
 
 
 @app.command()
@@ -233,6 +440,13 @@ def manual_run(
             help="Basecalling walltime for SLURM. Default: 12 hours",
         ),
     ] = "12:00:00",
+    job_array: Annotated[
+        bool,
+        typer.Option(
+            "--job-array",
+            help="Submit basecalling batches as a single Slurm job array",
+        ),
+    ] = False,
     basecalling_model: Annotated[
         Optional[Path],
         typer.Option(
@@ -276,6 +490,36 @@ def manual_run(
             help="Maximum batch size in B. Default: 10 GB",
         ),
     ] = (10 * 1024**3),
+    min_batch_samples: Annotated[
+        Optional[int],
+        typer.Option(
+            "--min-batch-samples",
+            help="Minimum batch size in signal samples. Batches are sized by signal samples instead of bytes if set",
+        ),
+    ] = None,
+    max_batch_samples: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-batch-samples",
+            help="Maximum batch size in signal samples. Batches are sized by signal samples instead of bytes if set",
+        ),
+    ] = None,
+    max_batch_wait: Annotated[
+        Optional[str],
+        typer.Option(
+            "--max-batch-wait",
+            help="Submit a batch smaller than the minimum batch size once the oldest unbasecalled file has waited this long (HH:MM:SS)",
+            callback=validate_walltime,
+        ),
+    ] = None,
+    batch_packing: Annotated[
+        str,
+        typer.Option(
+            "--batch-packing",
+            help="Fill batches in file order (sequential) or spread files over batches of nearly equal size (balanced)",
+            callback=validate_batch_packing,
+        ),
+    ] = BATCH_PACKING_SEQUENTIAL,
     # Eldorado step options
     run_basecalling: Annotated[
         bool,
@@ -337,110 +581,402 @@ def manual_run(
 
     run = SequencingRun(pod5_dir)
 
-    # Process sequencing runs
-    process_sequencing_run(
-        run=run,
+    # Process sequencing runs with the options given on the command line
+    project_config = ProjectConfig(
+        project_id=DEFAULT_PROJECT_NAME,
+        account=slurm_account,
         dorado_executable=dorado_executable,
         basecalling_model=basecalling_model,
-        models_dir=models_dir,
         mod_5mcg_5hmcg=mod_5mcg_5hmcg,
         mod_6ma=mod_6ma,
+        batch_packing=batch_packing,
+    )
+    options = RunOptions(
+        models_dir=models_dir,
+        mail_users=mail_user,
+        walltime=walltime,
+        job_array=job_array,
         min_batch_size=min_batch_size,
         max_batch_size=max_batch_size,
+        min_batch_samples=min_batch_samples,
+        max_batch_samples=max_batch_samples,
+        max_batch_wait=max_batch_wait,
         run_basecalling=run_basecalling,
         run_merging=run_merging,
         run_demultiplexing=run_demultiplexing,
         run_cleanup=run_cleanup,
-        mail_users=mail_user,
-        slurm_account=slurm_account,
-        walltime=walltime,
         dry_run=dry_run,
     )
+    process_sequencing_run_exclusively(run=run, project_config=project_config, options=options)
 
 
-def process_sequencing_run(
-    run: SequencingRun,
-    dorado_executable: Path,
-    basecalling_model: Path | None,
-    models_dir: Path,
-    mod_5mcg_5hmcg: bool,
-    mod_6ma: bool,
-    min_batch_size: int,
-    max_batch_size: int,
-    walltime: str,
-    run_basecalling: bool,
-    run_merging: bool,
-    run_demultiplexing: bool,
-    run_cleanup: bool,
-    mail_users: List[str],
-    slurm_account: str,
-    dry_run: bool,
-):
+@app.command()
+def reindex(
+    pod5_dirs: Annotated[
+        List[Path],
+        typer.Option(
+            "--pod5-dir",
+            "-i",
+            help="Pod5 directory of the sequencing run. This can be used multiple times.",
+            exists=True,
+            file_okay=False,
+            dir_okay=True,
+            readable=True,
+            resolve_path=True,
+        ),
+    ],
+) -> None:
+    # Rebuild the run state of each sequencing run from existing marker files
+    for pod5_dir in pod5_dirs:
+        run = SequencingRun(pod5_dir)
+        logger.info("Rebuilding run state %s", str(run.run_state_file))
+        run.reindex_state()
+
+
+@app.command()
+def backfill_tombstones(
+    root_dir: Annotated[
+        Path,
+        typer.Option(
+            "--root-dir",
+            "-r",
+            help="Root directory",
+            exists=True,
+            file_okay=False,
+            dir_okay=True,
+            readable=True,
+            resolve_path=True,
+        ),
+    ],
+) -> None:
+    # Add tombstones for runs that are already basecalled
+    tombstone_file = root_dir / TOMBSTONES
+    tombstones = read_tombstones(tombstone_file)
+    for _, pod5_dir, run_dir_files in discover_pod5_dirs(root_dir, None, tombstones):
+        if not needs_basecalling(pod5_dir, run_dir_files):
+            add_tombstone(tombstone_file, pod5_dir)
+
+
+@app.command()
+def untombstone(
+    root_dir: Annotated[
+        Path,
+        typer.Option(
+            "--root-dir",
+            "-r",
+            help="Root directory",
+            exists=True,
+            file_okay=False,
+            dir_okay=True,
+            readable=True,
+            resolve_path=True,
+        ),
+    ],
+    pod5_dirs: Annotated[
+        List[Path],
+        typer.Option(
+            "--pod5-dir",
+            "-i",
+            help="Pod5 directory of the sequencing run. This can be used multiple times. Move or remove the output directory of the run first to process it again.",
+            file_okay=False,
+            dir_okay=True,
+            resolve_path=True,
+        ),
+    ],
+) -> None:
+    # Remove tombstones, so the runs are scanned again
+    tombstone_file = root_dir / TOMBSTONES
+    for pod5_dir in pod5_dirs:
+        if not remove_tombstone(tombstone_file, pod5_dir):
+            logger.warning("No tombstone found for %s", str(pod5_dir))
+
+        # The output of the run is not removed. Runs with basecalled output are not processed again until it is moved or removed
+        if pod5_dir.parent.exists() and not needs_basecalling(pod5_dir):
+            logger.warning("%s still has basecalled output. Move or remove the output directory to process it again", str(pod5_dir))
+
+
+def process_sequencing_run_exclusively(run: SequencingRun, project_config: ProjectConfig, options: RunOptions) -> None:
+    # Process the run with its log context. Skip it if another worker or scheduler is processing it
+    with run_log_context(get_run_label(run)), try_lock_file(run.output_dir / RUN_LOCK) as is_locked:
+        if not is_locked:
+            logger.info("Skipping %s. It is being processed by another worker.", str(run.input_pod5_dir))
+            return
+        process_sequencing_run(run=run, project_config=project_config, options=options)
+
+
+def get_run_label(run: SequencingRun) -> str:
+    # [project_id]/[sample_id]/[run_id]/pod5*
+    return "/".join(run.input_pod5_dir.parts[-4:-1])
+
+
+def process_sequencing_run(run: SequencingRun, project_config: ProjectConfig, options: RunOptions) -> None:
     logger.info("Processing %s", str(run.input_pod5_dir))
 
     # Setup output directory
     run.output_dir.mkdir(parents=True, exist_ok=True)
 
+    # Migrate the state of runs started with an earlier version of Eldorado
+    if run.has_legacy_markers():
+        logger.info("Rebuilding run state %s from marker files", str(run.run_state_file))
+        run.reindex_state()
+
+    # Stat input directories before listing them, so changes during this tick are seen by the next scan
+    dir_stats = run.get_dir_stats()
+
     # Update transffered pod5 files
-    update_transferred_pod5_files(run)
+    pod5_file_count = update_transferred_pod5_files(run)
 
     # Clean up lock files before processing
-    cleanup_basecalling_lock_files(run)
+    cleanup_basecalling_lock_files(run, options.history_file)
     cleanup_merge_lock_files(run)
     cleanup_demultiplexing_lock_files(run)
 
+    # Record the usage of finished merging and demultiplexing jobs, and size the next jobs of the run from it
+    pending_accounting_stages = set()
+    if options.resource_model is not None and options.resource_history_file is not None:
+        pending_accounting_stages = collect_job_resources(run, options.resource_model, options.resource_history_file)
+        resource_profiles = right_size_resource_profiles(run, options.resource_model, project_config.resource_profiles)
+        project_config = replace(project_config, resource_profiles=resource_profiles)
+
+    # Resubmit a stage once the accounting of its last job is final, so a job that ran out of memory is retried with more memory
+    if pending_accounting_stages:
+        logger.info("Waiting for the job accounting of %s", ", ".join(sorted(pending_accounting_stages)))
+        options = replace(
+            options,
+            run_merging=options.run_merging and STAGE_MERGING not in pending_accounting_stages,
+            run_demultiplexing=options.run_demultiplexing and STAGE_DEMULTIPLEXING not in pending_accounting_stages,
+        )
+
+    # Skip runs where metadata can not be read, e.g. unreadable pod5 files or files from different runs
+    try:
+        metadata = run.metadata
+    except Exception as e:
+        logger.error("Skipping %s. Could not read metadata: %s", str(run.input_pod5_dir), e)
+        return
+
     # Setup Dorado config
     if not run.dorado_config_file.exists():
         logger.info("Setting up Dorado config (%s)", str(run.dorado_config_file))
         dorado_config = get_dorado_config(
-            metadata=run.metadata,
-            dorado_executable=dorado_executable,
-            basecalling_model=basecalling_model,
-            mod_5mcg_5hmcg=mod_5mcg_5hmcg,
-            mod_6ma=mod_6ma,
-            models_dir=models_dir,
+            metadata=metadata,
+            dorado_executable=project_config.dorado_executable,
+            basecalling_model=project_config.basecalling_model,
+            mod_5mcg_5hmcg=project_config.mod_5mcg_5hmcg,
+            mod_6ma=project_config.mod_6ma,
+            models_dir=options.models_dir,
         )
         dorado_config.save(run.dorado_config_file)
 
+    # Advance the run through every ready stage. Stop when a stage hands off to Slurm, the run is finalized or no stage is ready
+    stages_run = []
+    for _ in range(len(STAGES)):
+        # Refresh snapshot after the updates above and after each stage. The stage predicates share it
+        run.invalidate_snapshot()
+
+        stage, is_complete = run_ready_stage(run=run, project_config=project_config, options=options)
+        if stage is None:
+            break
+        stages_run.append(stage)
+        if not is_complete:
+            break
+
+    if not stages_run:
+        logger.info("Nothing to do...")
+
+    # Finalized runs are tombstoned and not scanned again
+    if STAGE_CLEANUP in stages_run:
+        return
+
+    # Remember the state of the input directories, so unchanged runs can be skipped
+    now = time.time()
+    recheck_by = get_batch_deadline(run, options.max_batch_wait) if options.run_basecalling else None
+
+    # Recheck runs with planned batches or pending job accounting on the next tick, since they may be held back
+    if (options.gpu_planner is not None and options.gpu_planner.has_plan(run)) or pending_accounting_stages:
+        recheck_by = now
+
+    update_scan_cursor(run, dir_stats, pod5_file_count, now, took_action=bool(stages_run), recheck_by=recheck_by)
+
+
+def run_ready_stage(run: SequencingRun, project_config: ProjectConfig, options: RunOptions) -> tuple[str | None, bool]:
+    # Run the first ready stage. Return the stage and whether the next stage can run in the same tick
+
     # Basecalling
-    if run_basecalling and basecalling_is_pending(run):
+    if options.run_basecalling and basecalling_is_pending(run):
+        # Plan batches to be submitted by rank together with the batches of the other runs
+        if options.gpu_planner is not None:
+            logger.info("Planning basecalling...")
+            planned_batches = plan_basecalling_batches(
+                run=run,
+                min_batch_size=options.min_batch_size,
+                max_batch_size=options.max_batch_size,
+                walltime=options.walltime,
+                batch_packing=project_config.batch_packing,
+                min_batch_samples=options.min_batch_samples,
+                max_batch_samples=options.max_batch_samples,
+                throughput_model=options.throughput_model,
+                cluster_load=options.cluster_load,
+                multi_gpu_threshold=options.multi_gpu_threshold,
+                target_runtime=options.target_runtime,
+                max_batch_wait=options.max_batch_wait,
+                resources=get_resources(project_config.resource_profiles, STAGE_BASECALLING),
+            )
+            # Nothing is planned while the batches are too small, so the run is rechecked with backoff
+            if not planned_batches:
+                return None, False
+
+            options.gpu_planner.add_plan(
+                RunPlan(
+                    run=run,
+                    project_id=project_config.project_id,
+                    sequencing_done=run.all_pod5_files_are_transferred(),
+                    batches=planned_batches,
+                    submit=partial(submit_admitted_batches, run=run, project_config=project_config, options=options),
+                )
+            )
+            return STAGE_BASECALLING, False
+
         logger.info("Running basecalling...")
         process_unbasecalled_pod5_files(
             run=run,
-            min_batch_size=min_batch_size,
-            max_batch_size=max_batch_size,
-            walltime=walltime,
-            mail_user=mail_users[0],
-            slurm_account=slurm_account,
-            dry_run=dry_run,
+            min_batch_size=options.min_batch_size,
+            max_batch_size=options.max_batch_size,
+            walltime=options.walltime,
+            mail_user=options.mail_users[0],
+            slurm_account=project_config.account,
+            dry_run=options.dry_run,
+            job_array=options.job_array,
+            batch_packing=project_config.batch_packing,
+            min_batch_samples=options.min_batch_samples,
+            max_batch_samples=options.max_batch_samples,
+            throughput_model=options.throughput_model,
+            cluster_load=options.cluster_load,
+            multi_gpu_threshold=options.multi_gpu_threshold,
+            target_runtime=options.target_runtime,
+            max_batch_wait=options.max_batch_wait,
+            resources=get_resources(project_config.resource_profiles, STAGE_BASECALLING),
         )
+        chain_after_basecalling(run=run, project_config=project_config, options=options)
+        return STAGE_BASECALLING, False
+
     # Merging
-    elif run_merging and merging_is_pending(run):
+    if options.run_merging and merging_is_pending(run):
         logger.info("Running merging...")
         submit_merging_to_slurm(
             run,
-            mail_user=mail_users,
-            slurm_account=slurm_account,
-            dry_run=dry_run,
+            mail_user=options.mail_users,
+            slurm_account=project_config.account,
+            dry_run=options.dry_run,
+            resources=get_resources(project_config.resource_profiles, STAGE_MERGING),
         )
+        return STAGE_MERGING, False
+
     # Demultiplexing
-    elif run_demultiplexing and demultiplexing_is_pending(run):
+    if options.run_demultiplexing and demultiplexing_is_pending(run):
         logger.info("Running demultiplexing...")
-        process_demultiplexing(
+        is_complete = process_demultiplexing(
             run=run,
-            mail_user=mail_users,
-            slurm_account=slurm_account,
-            dry_run=dry_run,
+            mail_user=options.mail_users,
+            slurm_account=project_config.account,
+            dry_run=options.dry_run,
+            resources=get_resources(project_config.resource_profiles, STAGE_DEMULTIPLEXING),
         )
+        return STAGE_DEMULTIPLEXING, is_complete
+
     # Cleanup
-    elif run_cleanup and needs_cleanup(run):
+    if options.run_cleanup and needs_cleanup(run):
         logger.info("Finalizing output...")
         cleanup_output_dir(
             run=run,
-            mail_user=mail_users,
+            mail_user=options.mail_users,
+            tombstone_file=options.tombstone_file,
+        )
+        # Cleanup is the last stage. No stage runs again in the same tick once the run is finalized
+        return STAGE_CLEANUP, False
+
+    return None, False
+
+
+def submit_planned_batches(
+    gpu_planner: GpuPlanner,
+    inflight_jobs: int,
+    inflight_by_project: dict[str, ProjectUsage] | None = None,
+) -> None:
+    for plan, planned_batches in gpu_planner.admit(inflight_jobs, inflight_by_project):
+        with run_log_context(get_run_label(plan.run)), try_lock_file(plan.run.output_dir / RUN_LOCK) as is_locked:
+            if not is_locked:
+                logger.info("Skipping submission for %s. It is being processed by another worker.", str(plan.run.input_pod5_dir))
+                continue
+            try:
+                plan.submit(planned_batches)
+            except Exception:
+                logger.exception("Failed to submit basecalling batches of %s", str(plan.run.input_pod5_dir))
+
+
+def submit_admitted_batches(
+    planned_batches: List[PlannedBatch],
+    run: SequencingRun,
+    project_config: ProjectConfig,
+    options: RunOptions,
+) -> None:
+    # Drop batches with files that were locked since planning, e.g. by a manual run
+    unbasecalled_pod5_file_names = {x.name for x in run.state.get_pod5_files(TRANSFERRED)}
+    planned_batches = [b for b in planned_batches if all(x.name in unbasecalled_pod5_file_names for x in b.pod5_files)]
+    if not planned_batches:
+        return
+
+    logger.info("Running basecalling...")
+    submit_basecalling_batches(
+        run=run,
+        planned_batches=planned_batches,
+        walltime=options.walltime,
+        mail_user=options.mail_users[0],
+        slurm_account=project_config.account,
+        dry_run=options.dry_run,
+        job_array=options.job_array,
+        project_id=project_config.project_id,
+        resources=get_resources(project_config.resource_profiles, STAGE_BASECALLING),
+    )
+    chain_after_basecalling(run=run, project_config=project_config, options=options)
+
+
+def chain_after_basecalling(run: SequencingRun, project_config: ProjectConfig, options: RunOptions) -> None:
+    # Chain merging and demultiplexing to the final basecalling jobs
+    run.invalidate_snapshot()
+    if options.run_merging and merging_can_be_chained(run):
+        submit_chained_jobs(run=run, project_config=project_config, options=options)
+
+
+def submit_chained_jobs(run: SequencingRun, project_config: ProjectConfig, options: RunOptions) -> None:
+    # Depend on all unfinished basecalling jobs. Wait for a later tick if any of them is not in the queue
+    basecalling_job_ids = get_basecalling_job_ids(run)
+    if basecalling_job_ids is None:
+        return
+
+    logger.info("Submitting merging job that waits for %d basecalling job(s)...", len(basecalling_job_ids))
+    merge_job_id = submit_merging_to_slurm(
+        run,
+        mail_user=options.mail_users,
+        slurm_account=project_config.account,
+        dry_run=options.dry_run,
+        dependency=basecalling_job_ids,
+        resources=get_resources(project_config.resource_profiles, STAGE_MERGING),
+    )
+    if merge_job_id is None:
+        return
+
+    # Chain demultiplexing to the merging job
+    run.invalidate_snapshot()
+    if options.run_demultiplexing and demultiplexing_can_be_chained(run):
+        logger.info("Submitting demultiplexing job that waits for merging job %s...", merge_job_id)
+        submit_chained_demux_to_slurm(
+            run=run,
+            merge_job_id=merge_job_id,
+            mail_user=options.mail_users,
+            slurm_account=project_config.account,
+            dry_run=options.dry_run,
+            resources=get_resources(project_config.resource_profiles, STAGE_DEMULTIPLEXING),
         )
-    else:
-        logger.info("Nothing to do...")
 
 
 if __name__ == "__main__":
@@ -1,14 +1,15 @@
-import subprocess
 import textwrap
 
 from typing import List
 
 from pathlib import Path
 
+from eldorado.constants import STAGE_MERGING
+from eldorado.filenames import BATCH_BAM, MERGE_DONE, MERGE_LOCK
 from eldorado.logging_config import logger
 from eldorado.pod5_handling import SequencingRun
-from eldorado.utils import is_in_queue, write_to_file
-from eldorado.filenames import BATCH_DONE, BATCH_BAM
+from eldorado.resources import DEFAULT_RESOURCES, SlurmResources
+from eldorado.utils import is_in_queue, submit_slurm_script, write_to_file
 
 
 def cleanup_merge_lock_files(pod5_dir: SequencingRun):
@@ -30,20 +31,24 @@ def submit_merging_to_slurm(
     mail_user: List[str],
     slurm_account: str,
     dry_run: bool,
-) -> None:
+    dependency: List[str] | None = None,
+    resources: SlurmResources = DEFAULT_RESOURCES[STAGE_MERGING],
+) -> str | None:
 
-    batch_dirs = get_done_batch_dirs(run)
-    bam_files = [bam_file for batch_dir in batch_dirs for bam_file in batch_dir.glob(BATCH_BAM)]
+    # Include output of active batches, when the job waits for them to finish
+    batch_dirs = get_done_batch_dirs(run) + [working_dir for _, working_dir, _ in run.state.get_active_batches()]
+    bam_files = [batch_dir / BATCH_BAM for batch_dir in batch_dirs]
     bam_files_str = " ".join([str(x) for x in bam_files])
 
     # Construct SLURM job script
-    cores = 4
+    cores = resources.cpus
     slurm_script = f"""\
         #!/bin/bash
         #SBATCH --account           {slurm_account}
-        #SBATCH --time              12:00:00
+        #SBATCH --time              {resources.walltime}
         #SBATCH --cpus-per-task     {cores}
-        #SBATCH --mem               32g
+        #SBATCH --mem               {resources.mem_gb}g
+        {resources.get_partition_directive()}
         #SBATCH --mail-type         FAIL
         #SBATCH --mail-user         {mail_user[0]}
         #SBATCH --output            {run.merge_script_file}.%j.out
@@ -84,44 +89,47 @@ def submit_merging_to_slurm(
 
     if dry_run:
         logger.info("Dry run. Skipping submission of merging job.")
-        return
+        return None
 
     # Submit the job using Slurm
-    std_out = subprocess.run(
-        ["sbatch", "--parsable", str(run.merge_script_file)],
-        capture_output=True,
-        check=True,
-    )
+    job_id = submit_slurm_script(run.merge_script_file, dependency=dependency)
 
     # Create .lock files
     run.merge_lock_file.parent.mkdir(exist_ok=True, parents=True)
     run.merge_lock_file.touch()
 
     # Write job ID to file
-    job_id = std_out.stdout.decode().strip()
     write_to_file(run.merge_job_id_file, job_id)
 
     logger.info("Submitted merging job to SLURM with job ID %s", job_id)
+    return job_id
 
 
 def merging_is_pending(run: SequencingRun) -> bool:
 
     return (
-        not run.merge_done_file.exists()
-        and not run.merge_lock_file.exists()
+        MERGE_DONE not in run.snapshot.merging_dir_files
+        and MERGE_LOCK not in run.snapshot.merging_dir_files
+        and not run.is_finalized()
         and run.all_pod5_files_are_transferred()
         and all_pod5_files_are_basecalled(run)
     )
 
 
+def merging_can_be_chained(run: SequencingRun) -> bool:
+    # Merging can wait for the basecalling jobs when all pod5 files are transferred and submitted
+    return (
+        MERGE_DONE not in run.snapshot.merging_dir_files
+        and MERGE_LOCK not in run.snapshot.merging_dir_files
+        and not run.is_finalized()
+        and run.all_pod5_files_are_transferred()
+        and not run.snapshot.unbasecalled
+    )
+
+
 def all_pod5_files_are_basecalled(pod5_dir: SequencingRun) -> bool:
-    done_files = [x.name for x in pod5_dir.get_done_files()]
-    return all(f"{x.name}.done" in done_files for x in pod5_dir.get_transferred_pod5_files())
+    return pod5_dir.snapshot.done == pod5_dir.snapshot.transferred
 
 
 def get_done_batch_dirs(run: SequencingRun) -> list[Path]:
-    # Batch dirs
-    batch_dirs = [d for d in run.basecalling_batches_dir.glob("*") if d.is_dir()]
-
-    # Filter out batch dirs that do not have a done file
-    return [d for d in batch_dirs if (d / BATCH_DONE).exists()]
+    return run.state.get_done_batch_dirs()
@@ -0,0 +1,141 @@
+import math
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+from eldorado.basecalling import PlannedBatch, parse_basecalling_job_comment
+from eldorado.configuration import ProjectConfig
+from eldorado.logging_config import logger
+from eldorado.pod5_handling import SequencingRun
+
+
+@dataclass
+class RunPlan:
+    # Basecalling batches of a sequencing run that wait for the GPU job budget
+    run: SequencingRun
+    project_id: str | None
+    sequencing_done: bool
+    batches: List[PlannedBatch]
+
+    # Set up and submit the admitted batches
+    submit: Callable[[List[PlannedBatch]], None]
+
+
+@dataclass
+class ProjectUsage:
+    # Basecalling jobs of a project in the Slurm queue
+    jobs: int = 0
+    pod5_bytes: int = 0
+
+
+def get_inflight_usage(comments: List[str]) -> dict[str, ProjectUsage]:
+    # Sum the jobs and input size of each project from the comments of queued basecalling jobs
+    usage: dict[str, ProjectUsage] = {}
+    for comment in comments:
+        parsed = parse_basecalling_job_comment(comment)
+        if parsed is None:
+            continue
+        project_id, pod5_bytes = parsed
+        project_usage = usage.setdefault(project_id, ProjectUsage())
+        project_usage.jobs += 1
+        project_usage.pod5_bytes += pod5_bytes
+    return usage
+
+
+@dataclass
+class GpuPlanner:
+    # Collects the basecalling batches of all runs in a tick and admits them by rank within the GPU job budget
+    project_configs_by_id: dict[str, ProjectConfig] = field(default_factory=dict)
+    max_jobs_per_tick: int | None = None  # None: No limit
+    max_inflight_jobs: int | None = None  # None: No limit
+    plans: List[RunPlan] = field(default_factory=list)
+
+    # Runs are planned by concurrent workers
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add_plan(self, plan: RunPlan) -> None:
+        with self.lock:
+            self.plans.append(plan)
+
+    def has_plan(self, run: SequencingRun) -> bool:
+        with self.lock:
+            return any(plan.run is run for plan in self.plans)
+
+    def has_inflight_caps(self) -> bool:
+        # Whether admission depends on the jobs in the Slurm queue
+        return self.max_inflight_jobs is not None or any(
+            x.max_inflight_gpu_jobs is not None or x.max_inflight_bytes is not None for x in self.project_configs_by_id.values()
+        )
+
+    def get_priority(self, project_id: str | None) -> int:
+        project_config = self.project_configs_by_id.get(project_id)
+        return project_config.priority if project_config is not None else 0
+
+    def get_quota(self, project_id: str | None) -> int | None:
+        project_config = self.project_configs_by_id.get(project_id)
+        return project_config.max_gpu_jobs_per_tick if project_config is not None else None
+
+    def is_over_inflight_caps(self, project_id: str | None, usage: ProjectUsage, batch: PlannedBatch) -> bool:
+        project_config = self.project_configs_by_id.get(project_id)
+        if project_config is None:
+            return False
+        if project_config.max_inflight_gpu_jobs is not None and usage.jobs >= project_config.max_inflight_gpu_jobs:
+            return True
+
+        # A batch larger than the cap is still admitted once nothing else of the project is in flight
+        max_bytes = project_config.max_inflight_bytes
+        return max_bytes is not None and usage.jobs > 0 and usage.pod5_bytes + batch.pod5_bytes > max_bytes
+
+    def rank(self) -> List[tuple[RunPlan, PlannedBatch]]:
+        # Higher project priority first, then runs that finished sequencing, then the oldest data
+        def rank_key(item: tuple[RunPlan, PlannedBatch]) -> tuple[int, bool, float]:
+            plan, batch = item
+            oldest_added_at = batch.oldest_added_at if batch.oldest_added_at is not None else math.inf
+            return -self.get_priority(plan.project_id), not plan.sequencing_done, oldest_added_at
+
+        return sorted(((plan, batch) for plan in self.plans for batch in plan.batches), key=rank_key)
+
+    def admit(
+        self,
+        inflight_jobs: int = 0,
+        inflight_by_project: dict[str, ProjectUsage] | None = None,
+    ) -> List[tuple[RunPlan, List[PlannedBatch]]]:
+        # Admit batches in rank order. Batches that are held back stay unbasecalled for later ticks
+        admitted: dict[int, tuple[RunPlan, List[PlannedBatch]]] = {}
+        admitted_jobs = 0
+        admitted_jobs_by_project = Counter()
+        usage_by_project = {
+            project_id: ProjectUsage(usage.jobs, usage.pod5_bytes) for project_id, usage in (inflight_by_project or {}).items()
+        }
+        ranked_batches = self.rank()
+        for plan, batch in ranked_batches:
+            if self.max_jobs_per_tick is not None and admitted_jobs >= self.max_jobs_per_tick:
+                break
+            if self.max_inflight_jobs is not None and inflight_jobs + admitted_jobs >= self.max_inflight_jobs:
+                break
+
+            quota = self.get_quota(plan.project_id)
+            if quota is not None and admitted_jobs_by_project[plan.project_id] >= quota:
+                continue
+
+            # Hold back projects that already fill their share of the queue
+            usage = usage_by_project.setdefault(plan.project_id, ProjectUsage())
+            if self.is_over_inflight_caps(plan.project_id, usage, batch):
+                continue
+
+            admitted.setdefault(id(plan), (plan, []))[1].append(batch)
+            admitted_jobs += 1
+            admitted_jobs_by_project[plan.project_id] += 1
+            usage.jobs += 1
+            usage.pod5_bytes += batch.pod5_bytes
+
+        if admitted_jobs < len(ranked_batches):
+            logger.info(
+                "Holding back %d of %d basecalling batches (GPU jobs in flight: %d)",
+                len(ranked_batches) - admitted_jobs,
+                len(ranked_batches),
+                inflight_jobs,
+            )
+
+        return list(admitted.values())
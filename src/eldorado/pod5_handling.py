@@ -1,11 +1,55 @@
+import fnmatch
+import os
 import re
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Generator, List
+from typing import TYPE_CHECKING, Container, Generator, List
 
 import eldorado.filenames as fn
-from eldorado.configuration import DoradoConfig, Metadata, get_metadata
-from eldorado.utils import is_complete_pod5_file
+from eldorado.configuration import DoradoConfig, Metadata, get_metadata, read_metadata
+from eldorado.constants import METADATA_SAMPLE_SIZE, POD5_PROBE_WORKERS, SCAN_BACKOFF_BASE_SECONDS, SCAN_BACKOFF_MAX_SECONDS
+from eldorado.logging_config import logger
+from eldorado.run_state import (
+    DONE,
+    LOCKED,
+    PROBE_COMPLETE,
+    PROBE_GROWING,
+    PROBE_INCOMPLETE,
+    TRANSFERRED,
+    DirStats,
+    Pod5Probe,
+    Pod5SignalSamples,
+    RunState,
+    ScanCursor,
+)
+from eldorado.utils import iter_complete_pod5_files, probe_pod5_files
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+
+@dataclass
+class RunSnapshot:
+    # Pod5 files from the run state
+    pod5_files: dict[str, Path]
+    transferred: set[str]
+    locked: set[str]
+    done: set[str]
+    unbasecalled: set[str]
+
+    # Directory listings
+    run_dir_files: set[str]
+    output_dir_files: set[str]
+    merging_dir_files: set[str]
+    demux_dir_files: set[str]
+
+    # Run files
+    final_summary: Path | None
+    final_summary_text: str | None
+    sample_sheet: Path | None
 
 
 @dataclass
@@ -17,6 +61,13 @@ class SequencingRun:
     # Dorado config
     dorado_config_file: Path = field(init=False)
 
+    # Metadata
+    metadata_file: Path = field(init=False)
+
+    # Run state
+    run_state_file: Path = field(init=False)
+    state: RunState = field(init=False)
+
     # General
     output_dir: Path = field(init=False)
     basecalling_summary: Path = field(init=False)
@@ -24,6 +75,7 @@ class SequencingRun:
     # Basecalling
     basecalling_working_dir: Path = field(init=False)
     basecalling_batches_dir: Path = field(init=False)
+    basecalling_arrays_dir: Path = field(init=False)
     basecalling_transferred_pod5_files_dir: Path = field(init=False)
     basecalling_lock_files_dir: Path = field(init=False)
     basecalling_done_files_dir: Path = field(init=False)
@@ -49,9 +101,44 @@ class SequencingRun:
     @property
     def metadata(self) -> Metadata:
         if not hasattr(self, "_metadata"):
-            self._metadata = get_metadata(self.input_pod5_dir)
+            self._metadata = self.load_metadata()
         return self._metadata
 
+    def load_metadata(self) -> Metadata:
+        # Use metadata saved on a previous tick. Check it once against a final summary written after it
+        final_summary = self.snapshot.final_summary
+        protocol_run_id = get_protocol_run_id(self.snapshot.final_summary_text)
+        if self.metadata_file.exists():
+            metadata = Metadata.load(self.metadata_file)
+            is_checked = final_summary is None or final_summary.stat().st_mtime_ns <= self.metadata_file.stat().st_mtime_ns
+            if is_checked or protocol_run_id is None or protocol_run_id == metadata.protocol_run_id:
+                return metadata
+            logger.warning("Protocol run ID in %s does not match final summary. Extracting metadata again.", self.metadata_file)
+
+        # Extract metadata from transferred pod5 files, which are known to be complete
+        transferred_pod5_files = self.state.get_pod5_files() if self.run_state_file.exists() else []
+        metadata = get_shared_metadata(transferred_pod5_files) if transferred_pod5_files else get_metadata(self.input_pod5_dir)
+        if protocol_run_id is not None and protocol_run_id != metadata.protocol_run_id:
+            logger.error("Protocol run ID of pod5 files in %s does not match final summary", str(self.input_pod5_dir))
+
+        # Save metadata for later ticks. This also marks the final summary as checked
+        if self.output_dir.exists():
+            metadata.save(self.metadata_file)
+
+        return metadata
+
+    # Snapshot of the run state and directories, shared by all predicates in a tick
+    _snapshot: RunSnapshot | None = field(init=False, default=None)
+
+    @property
+    def snapshot(self) -> RunSnapshot:
+        if self._snapshot is None:
+            self._snapshot = take_run_snapshot(self)
+        return self._snapshot
+
+    def invalidate_snapshot(self) -> None:
+        self._snapshot = None
+
     # Dorado config
     _dorado_config: DoradoConfig = field(init=False)
 
@@ -69,9 +156,17 @@ class SequencingRun:
         # Dorado config
         self.dorado_config_file = self.output_dir / fn.DORADO_CONFIG
 
+        # Metadata
+        self.metadata_file = self.output_dir / fn.METADATA
+
+        # Run state
+        self.run_state_file = self.output_dir / fn.RUN_STATE
+        self.state = RunState(self.run_state_file)
+
         # Basecalling
         self.basecalling_working_dir = self.output_dir / fn.BC_DIR
         self.basecalling_batches_dir = self.basecalling_working_dir / fn.BC_BATCHES_DIR
+        self.basecalling_arrays_dir = self.basecalling_working_dir / fn.BC_ARRAYS_DIR
         self.basecalling_transferred_pod5_files_dir = self.basecalling_working_dir / fn.BC_POD5_DIR
         self.basecalling_lock_files_dir = self.basecalling_working_dir / fn.BC_LOCK_DIR
         self.basecalling_done_files_dir = self.basecalling_working_dir / fn.BC_DONE_DIR
@@ -91,33 +186,23 @@ class SequencingRun:
         self.demux_lock_file = self.demux_working_dir / fn.DEMUX_LOCK
         self.demux_done_file = self.demux_working_dir / fn.DEMUX_DONE
 
-    def get_transferred_pod5_files(self) -> Generator[Path, None, None]:
-        return self.basecalling_transferred_pod5_files_dir.glob("*.pod5")
-
-    def get_lock_files(self) -> List[Path]:
-        return list(self.basecalling_lock_files_dir.glob("*.lock"))
-
-    def get_done_files(self) -> List[Path]:
-        return list(self.basecalling_done_files_dir.glob("*.done"))
+    def get_transferred_pod5_files(self) -> List[Path]:
+        return self.state.get_pod5_files()
 
     def get_final_summary(self) -> Path | None:
-        return next(self.input_pod5_dir.parent.glob("final_summary*.txt"), None)
+        return self.snapshot.final_summary
 
     def get_sample_sheet(self) -> Path | None:
-        return next(self.input_pod5_dir.parent.glob("sample_sheet*.csv"), None)
+        return self.snapshot.sample_sheet
 
     def all_pod5_files_are_transferred(self) -> bool:
         # Get final summary
-        final_summary = self.get_final_summary()
+        file_content = self.snapshot.final_summary_text
 
         # If final summary does not exist basecalling is not done
-        if final_summary is None:
+        if file_content is None:
             return False
 
-        # Read final summary
-        with open(final_summary, "r", encoding="utf-8") as file:
-            file_content = file.read()
-
         # Get number of pod5 files
         matches = re.search(r"pod5_files_in_final_dest=(\d+)", file_content)
 
@@ -129,73 +214,468 @@ class SequencingRun:
         n_pod5_files_expected = int(matches[1])
 
         # Count the number of pod5 files
-        pod5_files = self.get_transferred_pod5_files()
-        n_pod5_files_count = len(list(pod5_files))
+        n_pod5_files_count = len(self.snapshot.transferred)
 
         # If number of pod5 files is euqal to expected number of pod5 files basecalling is done
         return n_pod5_files_expected == n_pod5_files_count
 
-    def get_unbasecalled_pod5_files(self):
-        pod5_files = self.get_transferred_pod5_files()
-
-        lock_files_names = [lock_file.name for lock_file in self.get_lock_files()]
-        done_files_names = [done_file.name for done_file in self.get_done_files()]
-
-        return [pod5 for pod5 in pod5_files if f"{pod5.name}.lock" not in lock_files_names and f"{pod5.name}.done" not in done_files_names]
-
-
-def update_transferred_pod5_files(run: SequencingRun) -> None:
+    def get_unbasecalled_pod5_files(self) -> List[Path]:
+        return [self.snapshot.pod5_files[name] for name in sorted(self.snapshot.unbasecalled)]
+
+    def contains_complete_pod5_files(self) -> bool:
+        # Use the run state if the run has been processed before
+        if self.run_state_file.exists():
+            return self.state.count_pod5_files() > 0 or bool(filter_complete_pod5_files(self, list(self.input_pod5_dir.glob("*.pod5"))))
+        return contains_pod5_files(self.input_pod5_dir)
+
+    def is_finalized(self) -> bool:
+        # Cleanup writes the basecalling summary to the output directory when the run is finalized
+        return fn.BASECALLING_SUMMARY in self.snapshot.output_dir_files
+
+    def has_jobs_in_flight(self) -> bool:
+        return bool(self.state.get_active_batches()) or self.merge_lock_file.exists() or self.demux_lock_file.exists()
+
+    def get_dir_stats(self) -> DirStats:
+        pod5_dir_stat = self.input_pod5_dir.stat()
+        run_dir_stat = self.input_pod5_dir.parent.stat()
+        return DirStats(
+            pod5_dir_mtime_ns=pod5_dir_stat.st_mtime_ns,
+            pod5_dir_inode=pod5_dir_stat.st_ino,
+            run_dir_mtime_ns=run_dir_stat.st_mtime_ns,
+        )
+
+    def has_legacy_markers(self) -> bool:
+        # Runs started with an earlier version of Eldorado keep their state in marker directories
+        if self.run_state_file.exists():
+            return False
+        marker_dirs = [self.basecalling_transferred_pod5_files_dir, self.basecalling_lock_files_dir, self.basecalling_done_files_dir]
+        return any(x.exists() for x in marker_dirs)
+
+    def reindex_state(self) -> None:
+        self.state.reindex(
+            transferred_pod5_files_dir=self.basecalling_transferred_pod5_files_dir,
+            lock_files_dir=self.basecalling_lock_files_dir,
+            done_files_dir=self.basecalling_done_files_dir,
+            batches_dir=self.basecalling_batches_dir,
+        )
+
+
+def get_protocol_run_id(final_summary_text: str | None) -> str | None:
+    if final_summary_text is None:
+        return None
+    matches = re.search(r"protocol_run_id=(\S+)", final_summary_text)
+    return matches[1] if matches else None
+
+
+# Pod5 footer layout: [footer magic][footer flatbuffer][footer length: int64][section marker: 16 B][signature: 8 B]
+# See: https://pod5-file-format.readthedocs.io/en/latest/SPECIFICATION.html#combined-file-layout
+POD5_FOOTER_TAIL_LENGTH = 8 + 16 + 8
+POD5_CONTENT_TYPE_READS_TABLE = 0
+POD5_CONTENT_TYPE_RUN_INFO_TABLE = 4
+
+
+def read_footer_table_location(fd: int, file_size: int, content_type: int) -> tuple[int, int]:
+    # Read footer length and footer flatbuffer
+    tail = os.pread(fd, POD5_FOOTER_TAIL_LENGTH, file_size - POD5_FOOTER_TAIL_LENGTH)
+    (footer_length,) = struct.unpack_from("<q", tail, 0)
+    if footer_length <= 0 or footer_length > file_size - POD5_FOOTER_TAIL_LENGTH:
+        raise ValueError("Invalid pod5 footer length")
+    footer = os.pread(fd, footer_length, file_size - POD5_FOOTER_TAIL_LENGTH - footer_length)
+
+    # Field offsets of a flatbuffer table (0 if the field is not set)
+    def table_fields(table_pos: int) -> List[int]:
+        vtable_pos = table_pos - struct.unpack_from("<i", footer, table_pos)[0]
+        vtable_size = struct.unpack_from("<H", footer, vtable_pos)[0]
+        n_fields = (vtable_size - 4) // 2
+        return list(struct.unpack_from(f"<{n_fields}H", footer, vtable_pos + 4))
+
+    # Footer table: file_identifier, software, pod5_version, contents
+    footer_pos = struct.unpack_from("<I", footer, 0)[0]
+    footer_fields = table_fields(footer_pos)
+    if len(footer_fields) < 4 or footer_fields[3] == 0:
+        raise ValueError("Pod5 footer has no contents")
+    contents_pos = footer_pos + footer_fields[3]
+    contents_pos += struct.unpack_from("<I", footer, contents_pos)[0]
+    (n_contents,) = struct.unpack_from("<I", footer, contents_pos)
+
+    # Embedded file tables: offset, length, format, content_type
+    for i in range(n_contents):
+        element_pos = contents_pos + 4 + 4 * i
+        embedded_file_pos = element_pos + struct.unpack_from("<I", footer, element_pos)[0]
+        embedded_file_fields = table_fields(embedded_file_pos) + [0, 0, 0, 0]
+        offset_field, length_field, _, content_type_field = embedded_file_fields[:4]
+        embedded_content_type = struct.unpack_from("<h", footer, embedded_file_pos + content_type_field)[0] if content_type_field else 0
+        if embedded_content_type == content_type:
+            offset = struct.unpack_from("<q", footer, embedded_file_pos + offset_field)[0] if offset_field else 0
+            length = struct.unpack_from("<q", footer, embedded_file_pos + length_field)[0] if length_field else 0
+            return offset, length
+
+    raise ValueError(f"Pod5 footer has no table of content type {content_type}")
+
+
+def read_footer_table(pod5_file: Path, content_type: int) -> "pa.Table":
+    # Import pyarrow on first use to keep start up of the scheduler fast
+    import pyarrow as pa
+    import pyarrow.ipc
+
+    # Read only the footer and the embedded table
+    fd = os.open(pod5_file, os.O_RDONLY)
+    try:
+        file_size = os.fstat(fd).st_size
+        if file_size < POD5_FOOTER_TAIL_LENGTH:
+            raise ValueError(f"Pod5 file {pod5_file} is too small to contain a footer")
+        offset, length = read_footer_table_location(fd, file_size, content_type)
+        table_bytes = os.pread(fd, length, offset)
+    except (struct.error, OSError) as e:
+        raise ValueError(f"Invalid pod5 footer in {pod5_file}") from e
+    finally:
+        os.close(fd)
+
+    return pa.ipc.open_file(pa.BufferReader(table_bytes)).read_all()
+
+
+def read_run_info_table(pod5_file: Path) -> "pa.Table":
+    return read_footer_table(pod5_file, POD5_CONTENT_TYPE_RUN_INFO_TABLE)
+
+
+def read_num_samples(pod5_file: Path) -> int:
+    # Sum the signal samples of all reads from the reads table, without reading the signal
+    import pyarrow.compute as pc
+
+    reads = read_footer_table(pod5_file, POD5_CONTENT_TYPE_READS_TABLE)
+    if "num_samples" not in reads.column_names:
+        raise ValueError(f"Reads table in {pod5_file} has no num_samples column")
+    return pc.sum(reads.column("num_samples")).as_py() or 0
+
+
+def get_signal_samples(run: SequencingRun, pod5_files: List[Path]) -> dict[str, int | None]:
+    # Signal samples per pod5 file. None if the reads table can not be read
+    cached_samples = run.state.get_pod5_signal_samples()
+
+    signal_samples = {}
+    new_samples = {}
+    files_to_read = []
+    for pod5_file in pod5_files:
+        file_stat = pod5_file.stat()
+        cached = cached_samples.get(pod5_file.name)
+        if cached is not None and (cached.size, cached.mtime_ns) == (file_stat.st_size, file_stat.st_mtime_ns):
+            signal_samples[pod5_file.name] = cached.num_samples
+            continue
+        files_to_read.append((pod5_file, file_stat))
+
+    def try_read_num_samples(pod5_file: Path) -> int | None:
+        try:
+            return read_num_samples(pod5_file)
+        except ValueError as e:
+            logger.warning("Could not read signal samples: %s", e)
+            return None
+
+    # Read reads tables concurrently
+    if files_to_read:
+        with ThreadPoolExecutor(max_workers=min(POD5_PROBE_WORKERS, len(files_to_read))) as executor:
+            num_samples = list(executor.map(try_read_num_samples, [pod5_file for pod5_file, _ in files_to_read]))
+        for (pod5_file, file_stat), n in zip(files_to_read, num_samples):
+            signal_samples[pod5_file.name] = n
+            if n is not None:
+                new_samples[pod5_file.name] = Pod5SignalSamples(file_stat.st_size, file_stat.st_mtime_ns, n)
+
+    if new_samples:
+        run.state.set_pod5_signal_samples(new_samples)
+
+    return signal_samples
+
+
+def read_metadata_from_footer(pod5_file: Path) -> Metadata:
+    run_info = read_run_info_table(pod5_file).slice(0, 1).to_pylist()
+    if not run_info:
+        raise ValueError(f"Run info table in {pod5_file} is empty")
+    return Metadata(
+        project_id=run_info[0]["experiment_name"],  # We call it project_id
+        library_pool_id=run_info[0]["sample_id"],  # We call it library_id
+        protocol_run_id=run_info[0]["protocol_run_id"],
+        sample_rate=run_info[0]["sample_rate"],
+        flow_cell_product_code=run_info[0]["flow_cell_product_code"].upper(),
+        sequencing_kit=run_info[0]["sequencing_kit"].upper(),
+    )
+
+
+def read_metadata_from_footers(pod5_files: List[Path]) -> dict[Path, Metadata]:
+    return {pod5_file: read_metadata_from_footer(pod5_file) for pod5_file in pod5_files}
+
+
+def read_pod5_metadata(pod5_file: Path) -> Metadata:
+    # Fall back to the pod5 reader if the footer can not be parsed
+    try:
+        return read_metadata_from_footer(pod5_file)
+    except ValueError as e:
+        logger.warning("Could not read metadata from footer (%s). Using pod5 reader.", e)
+        return read_metadata(pod5_file)
+
+
+def sample_pod5_files(pod5_files: List[Path], sample_size: int) -> List[Path]:
+    # Pick evenly spaced files, including the first and the last
+    if len(pod5_files) <= sample_size:
+        return pod5_files
+    step = (len(pod5_files) - 1) / (sample_size - 1)
+    return [pod5_files[round(i * step)] for i in range(sample_size)]
+
+
+def get_shared_metadata(pod5_files: List[Path]) -> Metadata:
+    if not pod5_files:
+        raise FileNotFoundError("No pod5 files to read metadata from")
+
+    # Read metadata of a sample of the files and check that they belong to the same run
+    metadata = [read_pod5_metadata(pod5_file) for pod5_file in sample_pod5_files(pod5_files, METADATA_SAMPLE_SIZE)]
+    protocol_run_ids = {x.protocol_run_id for x in metadata}
+    sample_rates = {x.sample_rate for x in metadata}
+    if len(protocol_run_ids) > 1 or len(sample_rates) > 1:
+        raise ValueError(f"Pod5 files do not share one protocol run ID and sample rate: {sorted(protocol_run_ids)}, {sorted(sample_rates)}")
+
+    return metadata[0]
+
+
+def list_dir(path: Path) -> set[str]:
+    try:
+        with os.scandir(path) as entries:
+            return {entry.name for entry in entries}
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
+
+
+def take_run_snapshot(run: SequencingRun) -> RunSnapshot:
+    # List each directory once
+    run_dir_files = list_dir(run.input_pod5_dir.parent)
+    output_dir_files = list_dir(run.output_dir)
+    merging_dir_files = list_dir(run.merging_working_dir)
+    demux_dir_files = list_dir(run.demux_working_dir)
+
+    # Load pod5 file states in one query. Avoid creating the run state for runs that have not been processed
+    pod5_file_states = run.state.get_pod5_file_states() if fn.RUN_STATE in output_dir_files else {}
+    pod5_files = {name: path for name, (path, _) in pod5_file_states.items()}
+    names_by_state: dict[str, set[str]] = {TRANSFERRED: set(), LOCKED: set(), DONE: set()}
+    for name, (_, state) in pod5_file_states.items():
+        names_by_state[state].add(name)
+
+    # Find final summary and sample sheet
+    final_summary_name = min(fnmatch.filter(run_dir_files, "final_summary*.txt"), default=None)
+    sample_sheet_name = min(fnmatch.filter(run_dir_files, "sample_sheet*.csv"), default=None)
+    final_summary = run.input_pod5_dir.parent / final_summary_name if final_summary_name else None
+    sample_sheet = run.input_pod5_dir.parent / sample_sheet_name if sample_sheet_name else None
+    final_summary_text = final_summary.read_text(encoding="utf-8") if final_summary else None
+
+    return RunSnapshot(
+        pod5_files=pod5_files,
+        transferred=set(pod5_files),
+        locked=names_by_state[LOCKED],
+        done=names_by_state[DONE],
+        unbasecalled=names_by_state[TRANSFERRED],
+        run_dir_files=run_dir_files,
+        output_dir_files=output_dir_files,
+        merging_dir_files=merging_dir_files,
+        demux_dir_files=demux_dir_files,
+        final_summary=final_summary,
+        final_summary_text=final_summary_text,
+        sample_sheet=sample_sheet,
+    )
+
+
+def update_transferred_pod5_files(run: SequencingRun) -> int:
     # All input pod5 files
-    pod5_files = run.input_pod5_dir.glob("*.pod5")
+    pod5_files = list(run.input_pod5_dir.glob("*.pod5"))
 
     # All transferred pod5 files
-    transferred_pod5_file_names = [file.name for file in run.get_transferred_pod5_files()]
+    transferred_pod5_file_names = run.state.get_pod5_file_names()
 
     # Get new pod5 files
     new_pod5_files = [pod5 for pod5 in pod5_files if pod5.name not in transferred_pod5_file_names]
 
     # Filter out pod5 files that are not complete
-    new_pod5_files = [pod5 for pod5 in new_pod5_files if is_complete_pod5_file(pod5)]
-
-    # Create links to new pod5 files
-    for new_pod5 in new_pod5_files:
-        new_pod5_link = run.basecalling_transferred_pod5_files_dir / new_pod5.name
-        # Make directory if it does not exist
-        new_pod5_link.parent.mkdir(exist_ok=True, parents=True)
-        # Create symlink
-        new_pod5_link.symlink_to(new_pod5.resolve())
-
-
-def find_sequencning_runs_for_processing(root_dir: Path, pattern: str) -> List[SequencingRun]:
-    # Get all pod5 directories that match the pattern
-    pod5_dirs = get_pod5_dirs_from_pattern(root_dir, pattern)
-
-    # Keep only pod5 directories that are not already basecalled
-    pod5_dirs = [x for x in pod5_dirs if needs_basecalling(x)]
-
-    # Keep only pod5 directories that has pod5 files
-    pod5_dirs = [x for x in pod5_dirs if contains_pod5_files(x)]
-
-    # Return as Pod5Directory objects
-    return [SequencingRun(p) for p in pod5_dirs]
+    new_pod5_files = filter_complete_pod5_files(run, new_pod5_files)
+
+    # Register new pod5 files in the run state
+    if new_pod5_files:
+        run.state.add_transferred_pod5_files(new_pod5_files)
+        run.state.evict_pod5_probes(new_pod5_files)
+
+    # Return number of input pod5 files
+    return len(pod5_files)
+
+
+def filter_complete_pod5_files(run: SequencingRun, pod5_files: List[Path]) -> List[Path]:
+    # Verdicts from previous ticks
+    cached_probes = run.state.get_pod5_probes()
+
+    complete_pod5_files = set()
+    new_probes = {}
+    files_to_probe = []
+    for pod5_file in pod5_files:
+        file_stat = pod5_file.stat()
+        cached_probe = cached_probes.get(pod5_file.name)
+        is_unchanged = cached_probe is not None and (cached_probe.size, cached_probe.mtime_ns) == (file_stat.st_size, file_stat.st_mtime_ns)
+
+        # Reuse verdict if file is unchanged since it was probed
+        if is_unchanged and cached_probe.verdict == PROBE_COMPLETE:
+            complete_pod5_files.add(pod5_file)
+            continue
+        if is_unchanged and cached_probe.verdict == PROBE_INCOMPLETE:
+            continue
+
+        # Wait for the size to stop changing before probing a file that is still being written
+        if cached_probe is not None and not is_unchanged:
+            new_probes[pod5_file.name] = Pod5Probe(file_stat.st_size, file_stat.st_mtime_ns, PROBE_GROWING)
+            continue
+
+        # Probe new files and files that stopped growing
+        files_to_probe.append((pod5_file, file_stat))
+
+    # Probe all files at once
+    verdicts = probe_pod5_files([pod5_file for pod5_file, _ in files_to_probe])
+    for (pod5_file, file_stat), is_complete in zip(files_to_probe, verdicts):
+        verdict = PROBE_COMPLETE if is_complete else PROBE_INCOMPLETE
+        new_probes[pod5_file.name] = Pod5Probe(file_stat.st_size, file_stat.st_mtime_ns, verdict)
+        if is_complete:
+            complete_pod5_files.add(pod5_file)
+
+    if new_probes:
+        run.state.set_pod5_probes(new_probes)
+
+    # Keep the input order
+    return [pod5_file for pod5_file in pod5_files if pod5_file in complete_pod5_files]
+
+
+def update_scan_cursor(
+    run: SequencingRun,
+    dir_stats: DirStats,
+    pod5_file_count: int,
+    now: float,
+    took_action: bool = False,
+    recheck_by: float | None = None,
+) -> None:
+    # Count consecutive idle checks where nothing changed. Ticks with jobs in flight or a stage action do not count,
+    # since progress in the output directory is not tracked by the directory stats
+    previous_cursor = run.state.get_scan_cursor()
+    is_unchanged = (
+        previous_cursor is not None
+        and previous_cursor.idle
+        and not took_action
+        and previous_cursor.dir_stats == dir_stats
+        and previous_cursor.pod5_file_count == pod5_file_count
+    )
+    unchanged_checks = previous_cursor.unchanged_checks + 1 if previous_cursor is not None and is_unchanged else 0
+
+    # Double the recheck interval for each unchanged check
+    backoff = min(SCAN_BACKOFF_BASE_SECONDS * 2**unchanged_checks, SCAN_BACKOFF_MAX_SECONDS)
+
+    # Recheck no later than a pending deadline, e.g. the max batch wait of the oldest unbasecalled file
+    next_check = now + backoff if recheck_by is None else min(now + backoff, recheck_by)
+
+    run.state.set_scan_cursor(
+        ScanCursor(
+            dir_stats=dir_stats,
+            pod5_file_count=pod5_file_count,
+            idle=not run.has_jobs_in_flight(),
+            unchanged_checks=unchanged_checks,
+            next_check=next_check,
+        )
+    )
+
+
+def can_skip_scan(run: SequencingRun, now: float) -> bool:
+    # Runs that have not been processed before can not be skipped
+    if not run.run_state_file.exists():
+        return False
+
+    cursor = run.state.get_scan_cursor()
+    if cursor is None:
+        return False
+
+    # Recheck if jobs were in flight or the backoff has expired
+    if not cursor.idle or now >= cursor.next_check:
+        return False
+
+    # Recheck if any pod5 file was not transferred (e.g. incomplete)
+    if cursor.pod5_file_count != run.state.count_pod5_files():
+        return False
+
+    # Skip if input directories are unchanged
+    return cursor.dir_stats == run.get_dir_stats()
+
+
+def find_sequencing_runs_for_processing(
+    root_dir: Path,
+    project_ids: Container[str],
+    tombstones: Container[Path] = frozenset(),
+) -> Generator[tuple[str, SequencingRun], None, None]:
+    # Yield runs as they are discovered, so processing can start before the walk finishes
+    now = time.time()
+    for project_id, pod5_dir, run_dir_files in discover_pod5_dirs(root_dir, project_ids, tombstones):
+        run = SequencingRun(pod5_dir)
+
+        # Skip runs that are idle and unchanged since the last scan
+        if can_skip_scan(run, now):
+            continue
+
+        # Skip pod5 directories that are already basecalled
+        if not needs_basecalling(pod5_dir, run_dir_files):
+            continue
+
+        # Skip pod5 directories without complete pod5 files
+        if not run.contains_complete_pod5_files():
+            continue
+
+        yield project_id, run
+
+
+def discover_pod5_dirs(
+    root_dir: Path,
+    project_ids: Container[str] | None,
+    tombstones: Container[Path] = frozenset(),
+) -> Generator[tuple[str, Path, set[str]], None, None]:
+    # Walk [project_id]/[sample_id]/[run_id]/pod5* in a single pass, listing each directory once. None matches all projects
+    for project_dir in list_subdirs(root_dir):
+        if project_ids is not None and project_dir.name not in project_ids:
+            continue
+        for sample_dir in list_subdirs(project_dir):
+            for run_dir in list_subdirs(sample_dir):
+                run_dir_files = list_dir(run_dir)
+                for name in sorted(fnmatch.filter(run_dir_files, "pod5*")):
+                    # Drop finalized runs before any other check
+                    if run_dir / name in tombstones:
+                        continue
+                    if (run_dir / name).is_dir():
+                        yield project_dir.name, run_dir / name, run_dir_files
+
+
+def list_subdirs(path: Path) -> List[Path]:
+    try:
+        with os.scandir(path) as entries:
+            return sorted(Path(entry.path) for entry in entries if entry.is_dir())
+    except (FileNotFoundError, NotADirectoryError):
+        return []
 
 
 def get_pod5_dirs_from_pattern(root_dir: Path, pattern: str) -> List[Path]:
     return list(root_dir.glob(pattern=pattern))
 
 
-def needs_basecalling(pod5_dir: Path) -> bool:
+def needs_basecalling(pod5_dir: Path, run_dir_files: set[str] | None = None) -> bool:
     # Get the prefix for the bam and fastq directories i.e. pod5_pass -> bam_pass, fastq_pass
     bam_dir_prefix = pod5_dir.name.replace("pod5", "bam")
     fastq_dir_prefix = pod5_dir.name.replace("pod5", "fastq")
 
+    # Reuse the listing of the run directory if it is known
+    if run_dir_files is None:
+        run_dir_files = list_dir(pod5_dir.parent)
+
     # Check if any bam or fastq files already exist
-    any_existing_bam_files = any(pod5_dir.parent.glob(f"{bam_dir_prefix}*/*.bam"))
-    any_existing_fastq_files = any(pod5_dir.parent.glob(f"{fastq_dir_prefix}*/*.fastq*"))
+    bam_dirs = [x for x in run_dir_files if x.startswith(bam_dir_prefix)]
+    fastq_dirs = [x for x in run_dir_files if x.startswith(fastq_dir_prefix)]
+    any_existing_bam_files = any(fnmatch.filter(list_dir(pod5_dir.parent / x), "*.bam") for x in bam_dirs)
+    any_existing_fastq_files = any(fnmatch.filter(list_dir(pod5_dir.parent / x), "*.fastq*") for x in fastq_dirs)
 
     return not any_existing_bam_files and not any_existing_fastq_files
 
 
 def contains_pod5_files(x: Path) -> bool:
     pod5_files = x.glob("*.pod5")
-    return any(pod5_file for pod5_file in pod5_files if is_complete_pod5_file(pod5_file))
+    return any(iter_complete_pod5_files(pod5_files))
@@ -0,0 +1,291 @@
+import csv
+import math
+import subprocess
+import threading
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import List
+
+from eldorado.constants import (
+    RESOURCE_HEADROOM_FACTOR,
+    RESOURCE_HISTORY_SIZE,
+    RESOURCE_MEM_TIERS_GB,
+    RESOURCE_MIN_RECORDS,
+    STAGE_DEMULTIPLEXING,
+    STAGE_MERGING,
+)
+from eldorado.logging_config import logger
+from eldorado.pod5_handling import SequencingRun
+from eldorado.resources import SlurmResources, get_resources
+from eldorado.utils import is_in_queue
+
+RESOURCE_HISTORY_FIELDS = [
+    "job_id",
+    "stage",
+    "input_bytes",
+    "state",
+    "req_mem_mb",
+    "max_rss_mb",
+    "alloc_cpus",
+    "total_cpu_seconds",
+    "elapsed_seconds",
+]
+
+COMPLETED = "COMPLETED"
+OUT_OF_MEMORY = "OUT_OF_MEMORY"
+FINISHED_STATES = {COMPLETED, OUT_OF_MEMORY, "FAILED", "TIMEOUT", "CANCELLED", "NODE_FAIL", "PREEMPTED", "BOOT_FAIL", "DEADLINE"}
+
+MEMORY_UNITS_MB = {"K": 1 / 1024, "M": 1, "G": 1024, "T": 1024**2}
+
+
+@dataclass
+class SacctJob:
+    state: str
+    req_mem_mb: int
+    alloc_cpus: int
+    max_rss_mb: int
+    total_cpu_seconds: int
+    elapsed_seconds: int
+
+
+@dataclass
+class ResourceRecord:
+    job_id: str
+    stage: str
+    input_bytes: int
+    state: str
+    req_mem_mb: int
+    max_rss_mb: int
+    alloc_cpus: int
+    total_cpu_seconds: int
+    elapsed_seconds: int
+
+    @property
+    def used_cpus(self) -> float:
+        # Average number of busy CPUs over the runtime of the job
+        return self.total_cpu_seconds / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+
+@dataclass
+class ResourceModel:
+    # Finished merging and demultiplexing jobs, shared by all runs of a tick
+    records: List[ResourceRecord] = field(default_factory=list)
+
+    # Jobs are recorded by concurrent workers
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def get_record(self, job_id: str) -> ResourceRecord | None:
+        with self.lock:
+            return next((record for record in self.records if record.job_id == job_id), None)
+
+    def add_record(self, record: ResourceRecord) -> None:
+        with self.lock:
+            self.records.append(record)
+
+    def predict(self, stage: str, resources: SlurmResources, input_bytes: int, previous_job_id: str | None = None) -> SlurmResources:
+        # Retry a job of the run that ran out of memory at the next memory tier above its request
+        previous_record = self.get_record(previous_job_id) if previous_job_id else None
+        if previous_record is not None and previous_record.state == OUT_OF_MEMORY:
+            mem_gb = next((x for x in RESOURCE_MEM_TIERS_GB if x * 1024 > previous_record.req_mem_mb), RESOURCE_MEM_TIERS_GB[-1])
+            logger.info("Job %s ran out of memory. Retrying %s with %d GB", previous_job_id, stage, mem_gb)
+            return replace(resources, mem_gb=mem_gb)
+
+        # Usage grows with the input, so completed jobs with at least as much input bound the usage of this job
+        with self.lock:
+            stage_records = [record for record in self.records if record.stage == stage and record.state == COMPLETED]
+        records = [record for record in stage_records[-RESOURCE_HISTORY_SIZE:] if record.input_bytes >= input_bytes]
+        if len(records) < RESOURCE_MIN_RECORDS:
+            return resources
+
+        # Add headroom and round memory up to a tier. The resource profile is the upper limit
+        max_rss_gb = max(record.max_rss_mb for record in records) / 1024 * RESOURCE_HEADROOM_FACTOR
+        mem_gb = next((x for x in RESOURCE_MEM_TIERS_GB if x >= max_rss_gb), RESOURCE_MEM_TIERS_GB[-1])
+        cpus = math.ceil(max(record.used_cpus for record in records) * RESOURCE_HEADROOM_FACTOR)
+        return replace(resources, cpus=min(max(cpus, 1), resources.cpus), mem_gb=min(mem_gb, resources.mem_gb))
+
+
+def parse_memory_mb(memory: str, alloc_cpus: int = 1) -> int:
+    # Slurm memory, e.g. 1234K, 32G, or 32Gn and 4000Mc per node or per CPU in older versions of sacct
+    memory = memory.strip()
+    if memory.endswith(("n", "c")):
+        per_cpu = memory.endswith("c")
+        memory = memory[:-1]
+    else:
+        per_cpu = False
+    if not memory:
+        return 0
+    unit = memory[-1].upper()
+    value = float(memory[:-1]) * MEMORY_UNITS_MB[unit] if unit in MEMORY_UNITS_MB else float(memory) / 1024**2
+    return math.ceil(value * alloc_cpus if per_cpu else value)
+
+
+def parse_sacct_duration(duration: str) -> int:
+    # Slurm time format [D-][HH:]MM:SS[.mmm] to seconds
+    days, _, time_str = duration.strip().rpartition("-")
+    parts = [float(x) for x in time_str.split(":")]
+    hours, minutes, seconds = [0.0] * (3 - len(parts)) + parts
+    return round(int(days or 0) * 24 * 60 * 60 + hours * 60 * 60 + minutes * 60 + seconds)
+
+
+def parse_sacct_output(output: str) -> dict[str, SacctJob]:
+    # Jobs from `sacct --parsable2 --format JobID,State,ReqMem,AllocCPUS,MaxRSS,TotalCPU,Elapsed`
+    # The peak memory is reported by the steps of a job, e.g. 1234.batch
+    jobs: dict[str, SacctJob] = {}
+    max_rss_by_job_id: dict[str, int] = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        job_id, state, req_mem, alloc_cpus, max_rss, total_cpu, elapsed = line.strip().split("|")[:7]
+        base_job_id, _, step = job_id.partition(".")
+        try:
+            max_rss_by_job_id[base_job_id] = max(max_rss_by_job_id.get(base_job_id, 0), parse_memory_mb(max_rss))
+            if not step:
+                jobs[base_job_id] = SacctJob(
+                    state=state.split()[0] if state else "",
+                    req_mem_mb=parse_memory_mb(req_mem, int(alloc_cpus or 1)),
+                    alloc_cpus=int(alloc_cpus or 0),
+                    max_rss_mb=0,
+                    total_cpu_seconds=parse_sacct_duration(total_cpu),
+                    elapsed_seconds=parse_sacct_duration(elapsed),
+                )
+        except (KeyError, ValueError):
+            logger.warning("Skipping invalid line in sacct output: %s", line)
+
+    for job_id, job in jobs.items():
+        job.max_rss_mb = max_rss_by_job_id.get(job_id, 0)
+    return jobs
+
+
+def read_sacct_jobs(job_ids: List[str]) -> dict[str, SacctJob]:
+    try:
+        sacct = subprocess.run(
+            [
+                "sacct",
+                "--noheader",
+                "--parsable2",
+                "--jobs",
+                ",".join(job_ids),
+                "--format",
+                "JobID,State,ReqMem,AllocCPUS,MaxRSS,TotalCPU,Elapsed",
+            ],
+            check=True,
+            capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning("Could not read job accounting for jobs %s: %s", ",".join(job_ids), e)
+        return {}
+    return parse_sacct_output(sacct.stdout.decode("utf-8"))
+
+
+def read_resource_history(history_file: Path) -> List[ResourceRecord]:
+    if not history_file.exists():
+        return []
+
+    records = []
+    with open(history_file, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f, fieldnames=RESOURCE_HISTORY_FIELDS):
+            try:
+                records.append(
+                    ResourceRecord(
+                        job_id=row["job_id"],
+                        stage=row["stage"],
+                        input_bytes=int(row["input_bytes"]),
+                        state=row["state"],
+                        req_mem_mb=int(row["req_mem_mb"]),
+                        max_rss_mb=int(row["max_rss_mb"]),
+                        alloc_cpus=int(row["alloc_cpus"]),
+                        total_cpu_seconds=int(row["total_cpu_seconds"]),
+                        elapsed_seconds=int(row["elapsed_seconds"]),
+                    )
+                )
+            except (TypeError, ValueError):
+                logger.warning("Skipping invalid line in resource history %s: %s", str(history_file), row)
+    return records
+
+
+def load_resource_model(history_file: Path) -> ResourceModel:
+    return ResourceModel(read_resource_history(history_file))
+
+
+def get_run_pod5_bytes(run: SequencingRun) -> int:
+    # Input size of the run. Chained jobs are submitted before their input bam files exist
+    pod5_bytes = 0
+    for pod5_file in run.state.get_pod5_files():
+        try:
+            pod5_bytes += pod5_file.stat().st_size
+        except OSError:
+            continue
+    return pod5_bytes
+
+
+def get_stage_job_ids(run: SequencingRun) -> dict[str, str]:
+    # Latest merging and demultiplexing job of the run
+    job_ids = {}
+    for stage, job_id_file in [(STAGE_MERGING, run.merge_job_id_file), (STAGE_DEMULTIPLEXING, run.demux_job_id_file)]:
+        if job_id_file.exists():
+            job_ids[stage] = job_id_file.read_text(encoding="utf-8").strip()
+    return job_ids
+
+
+def collect_job_resources(run: SequencingRun, resource_model: ResourceModel, history_file: Path) -> set[str]:
+    # Record the usage of finished merging and demultiplexing jobs of the run
+    # Return the stages whose last job left the queue, but is not final in the accounting yet
+    stages_by_job_id = {
+        job_id: stage
+        for stage, job_id in get_stage_job_ids(run).items()
+        if job_id and not is_in_queue(job_id) and resource_model.get_record(job_id) is None
+    }
+    if not stages_by_job_id:
+        return set()
+
+    # Jobs that are not final in the accounting yet, e.g. still COMPLETING, are recorded on a later tick
+    jobs = read_sacct_jobs(list(stages_by_job_id))
+    finished_job_ids = [job_id for job_id in stages_by_job_id if job_id in jobs and jobs[job_id].state in FINISHED_STATES]
+    pending_stages = {stages_by_job_id[job_id] for job_id in stages_by_job_id if job_id in jobs and job_id not in finished_job_ids}
+    if not finished_job_ids:
+        return pending_stages
+
+    input_bytes = get_run_pod5_bytes(run)
+    history_file.parent.mkdir(parents=True, exist_ok=True)
+    for job_id in finished_job_ids:
+        job = jobs[job_id]
+        record = ResourceRecord(
+            job_id=job_id,
+            stage=stages_by_job_id[job_id],
+            input_bytes=input_bytes,
+            state=job.state,
+            req_mem_mb=job.req_mem_mb,
+            max_rss_mb=job.max_rss_mb,
+            alloc_cpus=job.alloc_cpus,
+            total_cpu_seconds=job.total_cpu_seconds,
+            elapsed_seconds=job.elapsed_seconds,
+        )
+        resource_model.add_record(record)
+
+        # Append a single line, so concurrent writers do not interleave
+        with open(history_file, "a", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerow([getattr(record, x) for x in RESOURCE_HISTORY_FIELDS])
+
+    return pending_stages
+
+
+def right_size_resource_profiles(
+    run: SequencingRun,
+    resource_model: ResourceModel,
+    resource_profiles: dict[str, SlurmResources] | None,
+) -> dict[str, SlurmResources] | None:
+    # Merging and demultiplexing start once sequencing is done, so the input of the run is final
+    if not resource_model.records or not run.all_pod5_files_are_transferred():
+        return resource_profiles
+
+    input_bytes = get_run_pod5_bytes(run)
+    previous_job_ids = get_stage_job_ids(run)
+    right_sized_profiles = dict(resource_profiles) if resource_profiles is not None else {}
+    for stage in [STAGE_MERGING, STAGE_DEMULTIPLEXING]:
+        right_sized_profiles[stage] = resource_model.predict(
+            stage,
+            get_resources(resource_profiles, stage),
+            input_bytes,
+            previous_job_ids.get(stage),
+        )
+    return right_sized_profiles
@@ -0,0 +1,74 @@
+from dataclasses import dataclass, replace
+
+from eldorado.constants import (
+    BASECALLING_PARTITION,
+    RESOURCE_FIELDS,
+    STAGE_BASECALLING,
+    STAGE_DEMULTIPLEXING,
+    STAGE_MERGING,
+)
+from eldorado.logging_config import logger
+from eldorado.utils import parse_walltime
+
+
+@dataclass(frozen=True)
+class SlurmResources:
+    # Resources requested by the Slurm jobs of a stage. Basecalling CPUs and memory are per GPU
+    cpus: int
+    mem_gb: int
+    walltime: str | None = None  # None: Walltime given by the scheduler
+    partition: str | None = None  # None: Default partition of the cluster
+
+    def get_partition_directive(self) -> str:
+        return f"#SBATCH --partition         {self.partition}" if self.partition else ""
+
+
+DEFAULT_RESOURCES = {
+    STAGE_BASECALLING: SlurmResources(cpus=2, mem_gb=32, partition=BASECALLING_PARTITION),
+    STAGE_MERGING: SlurmResources(cpus=4, mem_gb=32, walltime="12:00:00"),
+    STAGE_DEMULTIPLEXING: SlurmResources(cpus=16, mem_gb=128, walltime="12:00:00"),
+}
+
+
+def get_resources(resource_profiles: dict[str, SlurmResources] | None, stage: str) -> SlurmResources:
+    if resource_profiles is None or stage not in resource_profiles:
+        return DEFAULT_RESOURCES[stage]
+    return resource_profiles[stage]
+
+
+def get_resource_field_name(stage: str, field_name: str) -> str:
+    # Column of a resource in the project config file, e.g. merging_cpus
+    return f"{stage}_{field_name}"
+
+
+def parse_resource_profiles(row: dict[str, str], defaults: dict[str, SlurmResources]) -> dict[str, SlurmResources]:
+    # Override the resources of each stage with the non-empty columns of the row
+    resource_profiles = {}
+    for stage, resources in defaults.items():
+        overrides = {}
+        for field_name in RESOURCE_FIELDS:
+            value = row.get(get_resource_field_name(stage, field_name))
+            if value:
+                overrides[field_name] = int(value) if field_name in ["cpus", "mem_gb"] else value
+        resource_profiles[stage] = replace(resources, **overrides)
+    return resource_profiles
+
+
+def is_resource_row_valid(row: dict[str, str], project_id: str) -> bool:
+    for stage in DEFAULT_RESOURCES:
+        for field_name in ["cpus", "mem_gb"]:
+            column = get_resource_field_name(stage, field_name)
+            value = row.get(column)
+            if value and (not value.isdigit() or int(value) < 1):
+                logger.error("Field %s must be a positive integer (not %s) for project %s", column, value, project_id)
+                return False
+
+        column = get_resource_field_name(stage, "walltime")
+        value = row.get(column)
+        if value:
+            try:
+                parse_walltime(value)
+            except ValueError:
+                logger.error("Field %s must be a walltime ([D-]HH:MM:SS) (not %s) for project %s", column, value, project_id)
+                return False
+    return True
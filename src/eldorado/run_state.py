@@ -0,0 +1,363 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Generator, Iterable, List
+
+import eldorado.filenames as fn
+
+# Pod5 file states
+TRANSFERRED = "transferred"
+LOCKED = "locked"
+DONE = "done"
+
+# Pod5 probe verdicts
+PROBE_COMPLETE = "complete"
+PROBE_INCOMPLETE = "incomplete"
+PROBE_GROWING = "growing"  # Size changed since last seen, not probed
+
+# Batch states
+BATCH_ACTIVE = "active"
+BATCH_DONE = "done"
+BATCH_RELEASED = "released"
+
+# Bump when the schema changes, so existing stores are upgraded on first connect
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pod5_files (
+        name        TEXT PRIMARY KEY,
+        path        TEXT NOT NULL,
+        state       TEXT NOT NULL,
+        batch_id    TEXT,
+        added_at    REAL  -- Time the file was first seen complete
+    );
+    CREATE INDEX IF NOT EXISTS pod5_files_state ON pod5_files (state);
+    CREATE INDEX IF NOT EXISTS pod5_files_batch_id ON pod5_files (batch_id);
+
+    CREATE TABLE IF NOT EXISTS batches (
+        batch_id    TEXT PRIMARY KEY,
+        working_dir TEXT NOT NULL,
+        job_id      TEXT,
+        state       TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS batches_state ON batches (state);
+
+    CREATE TABLE IF NOT EXISTS pod5_probes (
+        name        TEXT PRIMARY KEY,
+        size        INTEGER NOT NULL,
+        mtime_ns    INTEGER NOT NULL,
+        verdict     TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS pod5_signal_samples (
+        name        TEXT PRIMARY KEY,
+        size        INTEGER NOT NULL,
+        mtime_ns    INTEGER NOT NULL,
+        num_samples INTEGER NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS scan_cursor (
+        id                  INTEGER PRIMARY KEY CHECK (id = 0),
+        pod5_dir_mtime_ns   INTEGER NOT NULL,
+        pod5_dir_inode      INTEGER NOT NULL,
+        run_dir_mtime_ns    INTEGER NOT NULL,
+        pod5_file_count     INTEGER NOT NULL,
+        idle                INTEGER NOT NULL,
+        unchanged_checks    INTEGER NOT NULL,
+        next_check          REAL NOT NULL
+    );
+"""
+
+# Upgrades of tables in existing stores by the schema version that introduced them. New tables are created by the schema
+MIGRATIONS = {
+    3: """
+        ALTER TABLE pod5_files ADD COLUMN added_at REAL;
+        UPDATE pod5_files SET added_at = CAST(strftime('%s', 'now') AS REAL);
+    """,
+}
+
+
+@dataclass
+class Pod5Probe:
+    size: int
+    mtime_ns: int
+    verdict: str
+
+
+@dataclass
+class Pod5SignalSamples:
+    size: int
+    mtime_ns: int
+    num_samples: int
+
+
+@dataclass
+class DirStats:
+    pod5_dir_mtime_ns: int
+    pod5_dir_inode: int
+    run_dir_mtime_ns: int
+
+
+@dataclass
+class ScanCursor:
+    dir_stats: DirStats
+    pod5_file_count: int
+    idle: bool  # No jobs in flight when the cursor was written
+    unchanged_checks: int
+    next_check: float
+
+
+class RunState:
+    """Transactional store of the pod5 file and batch state of a sequencing run.
+
+    The store is only written by the scheduler. Slurm jobs signal completion through the
+    done file in their batch directory, which is reconciled into the store on the next tick.
+    """
+
+    def __init__(self, db_file: Path):
+        self.db_file = db_file
+        self._conn: sqlite3.Connection | None = None
+
+    @contextmanager
+    def connect(self) -> Generator[sqlite3.Connection, None, None]:
+        # Open one connection per store and create the schema only if it is missing or outdated
+        if self._conn is None:
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=60, check_same_thread=False)
+            (user_version,) = conn.execute("PRAGMA user_version").fetchone()
+            if user_version < SCHEMA_VERSION:
+                # Existing stores are upgraded before the schema is created, since the schema may index new columns
+                for version, migration in sorted(MIGRATIONS.items()):
+                    if 0 < user_version < version:
+                        conn.executescript(migration)
+                conn.executescript(SCHEMA)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._conn = conn
+
+        # Run each operation in its own transaction
+        with self._conn:
+            yield self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # Pod5 files
+    def add_transferred_pod5_files(self, pod5_files: Iterable[Path], added_at: float | None = None) -> None:
+        added_at = time.time() if added_at is None else added_at
+        with self.connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO pod5_files (name, path, state, added_at) VALUES (?, ?, ?, ?)",
+                [(pod5_file.name, str(pod5_file), TRANSFERRED, added_at) for pod5_file in pod5_files],
+            )
+
+    def get_pod5_files(self, state: str | None = None) -> List[Path]:
+        with self.connect() as conn:
+            if state is None:
+                rows = conn.execute("SELECT path FROM pod5_files ORDER BY name").fetchall()
+            else:
+                rows = conn.execute("SELECT path FROM pod5_files WHERE state = ? ORDER BY name", (state,)).fetchall()
+        return [Path(path) for (path,) in rows]
+
+    def get_pod5_file_states(self) -> dict[str, tuple[Path, str]]:
+        with self.connect() as conn:
+            rows = conn.execute("SELECT name, path, state FROM pod5_files ORDER BY name").fetchall()
+        return {name: (Path(path), state) for name, path, state in rows}
+
+    def get_pod5_file_names(self) -> set[str]:
+        with self.connect() as conn:
+            rows = conn.execute("SELECT name FROM pod5_files").fetchall()
+        return {name for (name,) in rows}
+
+    def get_first_pod5_file(self) -> Path | None:
+        with self.connect() as conn:
+            row = conn.execute("SELECT path FROM pod5_files ORDER BY name LIMIT 1").fetchone()
+        return Path(row[0]) if row is not None else None
+
+    def get_pod5_added_at(self, state: str) -> dict[str, float | None]:
+        with self.connect() as conn:
+            rows = conn.execute("SELECT name, added_at FROM pod5_files WHERE state = ?", (state,)).fetchall()
+        return dict(rows)
+
+    def get_oldest_added_at(self, state: str) -> float | None:
+        with self.connect() as conn:
+            (added_at,) = conn.execute("SELECT MIN(added_at) FROM pod5_files WHERE state = ?", (state,)).fetchone()
+        return added_at
+
+    def count_pod5_files(self, state: str | None = None) -> int:
+        with self.connect() as conn:
+            if state is None:
+                (count,) = conn.execute("SELECT COUNT(*) FROM pod5_files").fetchone()
+            else:
+                (count,) = conn.execute("SELECT COUNT(*) FROM pod5_files WHERE state = ?", (state,)).fetchone()
+        return count
+
+    # Batches
+    def lock_batch(self, batch_id: str, working_dir: Path, pod5_files: List[Path]) -> None:
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO batches (batch_id, working_dir, state) VALUES (?, ?, ?)",
+                (batch_id, str(working_dir), BATCH_ACTIVE),
+            )
+            conn.executemany(
+                "UPDATE pod5_files SET state = ?, batch_id = ? WHERE name = ?",
+                [(LOCKED, batch_id, pod5_file.name) for pod5_file in pod5_files],
+            )
+
+    def set_batch_job_id(self, batch_id: str, job_id: str) -> None:
+        with self.connect() as conn:
+            conn.execute("UPDATE batches SET job_id = ? WHERE batch_id = ?", (job_id, batch_id))
+
+    def get_active_batches(self) -> List[tuple[str, Path, str | None]]:
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT batch_id, working_dir, job_id FROM batches WHERE state = ? ORDER BY batch_id",
+                (BATCH_ACTIVE,),
+            ).fetchall()
+        return [(batch_id, Path(working_dir), job_id) for batch_id, working_dir, job_id in rows]
+
+    def get_done_batch_dirs(self) -> List[Path]:
+        with self.connect() as conn:
+            rows = conn.execute("SELECT working_dir FROM batches WHERE state = ? ORDER BY batch_id", (BATCH_DONE,)).fetchall()
+        return [Path(working_dir) for (working_dir,) in rows]
+
+    def mark_batch_done(self, batch_id: str) -> None:
+        with self.connect() as conn:
+            conn.execute("UPDATE batches SET state = ? WHERE batch_id = ?", (BATCH_DONE, batch_id))
+            conn.execute("UPDATE pod5_files SET state = ? WHERE batch_id = ?", (DONE, batch_id))
+
+    def release_batch(self, batch_id: str) -> None:
+        with self.connect() as conn:
+            conn.execute("UPDATE batches SET state = ? WHERE batch_id = ?", (BATCH_RELEASED, batch_id))
+            conn.execute(
+                "UPDATE pod5_files SET state = ?, batch_id = NULL WHERE batch_id = ? AND state = ?",
+                (TRANSFERRED, batch_id, LOCKED),
+            )
+
+    def release_orphaned_locks(self) -> None:
+        # Release locked pod5 files that do not belong to an active batch
+        with self.connect() as conn:
+            conn.execute(
+                """
+                UPDATE pod5_files SET state = ?, batch_id = NULL
+                WHERE state = ?
+                AND (batch_id IS NULL OR batch_id NOT IN (SELECT batch_id FROM batches WHERE state = ?))
+                """,
+                (TRANSFERRED, LOCKED, BATCH_ACTIVE),
+            )
+
+    # Pod5 probes
+    def get_pod5_probes(self) -> dict[str, Pod5Probe]:
+        with self.connect() as conn:
+            rows = conn.execute("SELECT name, size, mtime_ns, verdict FROM pod5_probes").fetchall()
+        return {name: Pod5Probe(size, mtime_ns, verdict) for name, size, mtime_ns, verdict in rows}
+
+    def set_pod5_probes(self, probes: dict[str, Pod5Probe]) -> None:
+        with self.connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO pod5_probes (name, size, mtime_ns, verdict) VALUES (?, ?, ?, ?)",
+                [(name, probe.size, probe.mtime_ns, probe.verdict) for name, probe in probes.items()],
+            )
+
+    def evict_pod5_probes(self, pod5_files: Iterable[Path]) -> None:
+        # Transferred pod5 files are never probed again
+        with self.connect() as conn:
+            conn.executemany("DELETE FROM pod5_probes WHERE name = ?", [(pod5_file.name,) for pod5_file in pod5_files])
+
+    # Pod5 signal samples
+    def get_pod5_signal_samples(self) -> dict[str, Pod5SignalSamples]:
+        with self.connect() as conn:
+            rows = conn.execute("SELECT name, size, mtime_ns, num_samples FROM pod5_signal_samples").fetchall()
+        return {name: Pod5SignalSamples(size, mtime_ns, num_samples) for name, size, mtime_ns, num_samples in rows}
+
+    def set_pod5_signal_samples(self, signal_samples: dict[str, Pod5SignalSamples]) -> None:
+        with self.connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO pod5_signal_samples (name, size, mtime_ns, num_samples) VALUES (?, ?, ?, ?)",
+                [(name, x.size, x.mtime_ns, x.num_samples) for name, x in signal_samples.items()],
+            )
+
+    # Scan cursor
+    def get_scan_cursor(self) -> ScanCursor | None:
+        with self.connect() as conn:
+            row = conn.execute(
+                """
+                SELECT pod5_dir_mtime_ns, pod5_dir_inode, run_dir_mtime_ns, pod5_file_count, idle, unchanged_checks, next_check
+                FROM scan_cursor
+                """
+            ).fetchone()
+        if row is None:
+            return None
+        return ScanCursor(
+            dir_stats=DirStats(pod5_dir_mtime_ns=row[0], pod5_dir_inode=row[1], run_dir_mtime_ns=row[2]),
+            pod5_file_count=row[3],
+            idle=bool(row[4]),
+            unchanged_checks=row[5],
+            next_check=row[6],
+        )
+
+    def set_scan_cursor(self, cursor: ScanCursor) -> None:
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO scan_cursor VALUES (0, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    cursor.dir_stats.pod5_dir_mtime_ns,
+                    cursor.dir_stats.pod5_dir_inode,
+                    cursor.dir_stats.run_dir_mtime_ns,
+                    cursor.pod5_file_count,
+                    int(cursor.idle),
+                    cursor.unchanged_checks,
+                    cursor.next_check,
+                ),
+            )
+
+    def reindex(
+        self,
+        transferred_pod5_files_dir: Path,
+        lock_files_dir: Path,
+        done_files_dir: Path,
+        batches_dir: Path,
+    ) -> None:
+        """Rebuild the store from the marker files written by earlier versions of Eldorado."""
+        # Collect marker files
+        lock_file_names = {x.name.removesuffix(".lock") for x in lock_files_dir.glob("*.lock")}
+        done_file_names = {x.name.removesuffix(".done") for x in done_files_dir.glob("*.done")}
+
+        # Collect batches and the pod5 files they contain
+        batch_rows = []
+        pod5_batch_ids = {}
+        for batch_dir in sorted(d for d in batches_dir.glob("*") if d.is_dir()):
+            job_id_file = batch_dir / fn.BATCH_JOB_ID
+            job_id = job_id_file.read_text(encoding="utf-8").strip() if job_id_file.exists() else None
+            state = BATCH_DONE if (batch_dir / fn.BATCH_DONE).exists() else BATCH_ACTIVE
+            batch_rows.append((batch_dir.name, str(batch_dir), job_id, state))
+
+            manifest = batch_dir / fn.BATCH_MANIFEST
+            if manifest.exists():
+                for line in manifest.read_text(encoding="utf-8").splitlines():
+                    if line.strip():
+                        pod5_batch_ids[Path(line.strip()).name] = batch_dir.name
+
+        # Collect pod5 files and their state. Arrival times are not known, so files are counted as added now
+        added_at = time.time()
+        pod5_rows = []
+        for pod5_file in transferred_pod5_files_dir.glob("*.pod5"):
+            name = pod5_file.name
+            if name in done_file_names:
+                state = DONE
+            elif name in lock_file_names:
+                state = LOCKED
+            else:
+                state = TRANSFERRED
+            batch_id = pod5_batch_ids.get(name) if state != TRANSFERRED else None
+            pod5_rows.append((name, str(pod5_file.resolve()), state, batch_id, added_at))
+
+        # Replace content of the store
+        with self.connect() as conn:
+            conn.execute("DELETE FROM pod5_files")
+            conn.execute("DELETE FROM batches")
+            conn.executemany("INSERT INTO batches (batch_id, working_dir, job_id, state) VALUES (?, ?, ?, ?)", batch_rows)
+            conn.executemany("INSERT INTO pod5_files (name, path, state, batch_id, added_at) VALUES (?, ?, ?, ?, ?)", pod5_rows)
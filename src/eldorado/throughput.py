@@ -0,0 +1,147 @@
+import csv
+import math
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List
+
+from eldorado.constants import (
+    THROUGHPUT_HISTORY_SIZE,
+    THROUGHPUT_MIN_RECORDS,
+    WALLTIME_MIN_SECONDS,
+    WALLTIME_OVERHEAD_SECONDS,
+    WALLTIME_SAFETY_FACTOR,
+)
+from eldorado.filenames import BATCH_LOG, BATCH_MANIFEST
+from eldorado.logging_config import logger
+from eldorado.pod5_handling import SequencingRun
+from eldorado.utils import format_walltime, parse_walltime
+
+THROUGHPUT_HISTORY_FIELDS = ["basecalling_model", "partition", "pod5_bytes", "signal_samples", "runtime"]
+
+
+@dataclass
+class ThroughputRecord:
+    basecalling_model: str
+    partition: str
+    pod5_bytes: int
+    signal_samples: int | None
+    runtime: int
+
+
+@dataclass
+class ThroughputModel:
+    # Basecalling throughput in units per second by basecalling model, partition and unit (B or samples)
+    rates: dict[tuple[str, str, str], float] = field(default_factory=dict)
+
+    def get_rate(self, basecalling_model: str, partition: str, unit: str) -> float | None:
+        return self.rates.get((basecalling_model, partition, unit))
+
+    def get_walltime(self, basecalling_model: str, partition: str, unit: str, cost: int, default_walltime: str, gpus: int = 1) -> str:
+        # Request the predicted runtime with a safety margin, capped by the default walltime. Rates are per GPU
+        rate = self.get_rate(basecalling_model, partition, unit)
+        if rate is None:
+            return default_walltime
+
+        max_seconds = parse_walltime(default_walltime)
+        seconds = math.ceil(cost / (rate * gpus) * WALLTIME_SAFETY_FACTOR) + WALLTIME_OVERHEAD_SECONDS
+        return format_walltime(min(max(seconds, WALLTIME_MIN_SECONDS), max_seconds))
+
+    def get_max_batch_cost(self, basecalling_model: str, partition: str, unit: str, target_runtime: str) -> int | None:
+        # Largest batch that is predicted to finish within the target runtime
+        rate = self.get_rate(basecalling_model, partition, unit)
+        if rate is None:
+            return None
+        return int(rate * parse_walltime(target_runtime))
+
+
+def read_throughput_history(history_file: Path) -> List[ThroughputRecord]:
+    if not history_file.exists():
+        return []
+
+    records = []
+    with open(history_file, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f, fieldnames=THROUGHPUT_HISTORY_FIELDS):
+            try:
+                records.append(
+                    ThroughputRecord(
+                        basecalling_model=row["basecalling_model"],
+                        partition=row["partition"],
+                        pod5_bytes=int(row["pod5_bytes"]),
+                        signal_samples=int(row["signal_samples"]) if row["signal_samples"] else None,
+                        runtime=int(row["runtime"]),
+                    )
+                )
+            except (TypeError, ValueError):
+                logger.warning("Skipping invalid line in throughput history %s: %s", str(history_file), row)
+    return records
+
+
+def fit_throughput_model(records: List[ThroughputRecord]) -> ThroughputModel:
+    # Group the most recent records by basecalling model and partition
+    records_by_key = defaultdict(list)
+    for record in records:
+        if record.runtime > 0:
+            records_by_key[(record.basecalling_model, record.partition)].append(record)
+
+    rates = {}
+    for (basecalling_model, partition), key_records in records_by_key.items():
+        recent_records = key_records[-THROUGHPUT_HISTORY_SIZE:]
+
+        # Total units over total runtime, so large batches weigh more than small ones
+        for unit, units in [
+            ("B", [record.pod5_bytes for record in recent_records]),
+            ("samples", [record.signal_samples for record in recent_records]),
+        ]:
+            pairs = [(n, record.runtime) for n, record in zip(units, recent_records) if n is not None]
+            if len(pairs) >= THROUGHPUT_MIN_RECORDS:
+                rates[(basecalling_model, partition, unit)] = sum(n for n, _ in pairs) / sum(runtime for _, runtime in pairs)
+
+    return ThroughputModel(rates)
+
+
+def load_throughput_model(history_file: Path) -> ThroughputModel:
+    return fit_throughput_model(read_throughput_history(history_file))
+
+
+def read_batch_log(log_file: Path) -> dict[str, str]:
+    log_dict = {}
+    for line in log_file.read_text(encoding="utf-8").splitlines():
+        key, _, value = line.partition("=")
+        log_dict[key] = value
+    return log_dict
+
+
+def record_batch_throughput(run: SequencingRun, working_dir: Path, history_file: Path) -> None:
+    log_file = working_dir / BATCH_LOG
+    manifest = working_dir / BATCH_MANIFEST
+    if not log_file.exists() or not manifest.exists():
+        return
+
+    # Count input of the batch from the pod5 files, since the log holds disk usage in blocks
+    log = read_batch_log(log_file)
+    pod5_files = [Path(line.strip()) for line in manifest.read_text(encoding="utf-8").splitlines() if line.strip()]
+    try:
+        pod5_bytes = sum(pod5_file.stat().st_size for pod5_file in pod5_files)
+        # Record GPU seconds, so multi-GPU batches give the throughput per GPU
+        runtime = int(log["runtime"]) * int(log.get("gpus") or 1)
+    except (KeyError, ValueError, OSError) as e:
+        logger.warning("Could not record throughput of batch %s: %s", str(working_dir), e)
+        return
+
+    # Signal samples are only known if all files were sized by signal samples
+    cached_samples = run.state.get_pod5_signal_samples()
+    samples = [cached_samples.get(pod5_file.name) for pod5_file in pod5_files]
+    signal_samples = sum(x.num_samples for x in samples) if all(x is not None for x in samples) else None
+
+    # Append a single line, so concurrent writers do not interleave
+    row = [
+        Path(log.get("basecalling_model", "")).name,
+        log.get("partition", ""),
+        pod5_bytes,
+        signal_samples if signal_samples is not None else "",
+        runtime,
+    ]
+    history_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(history_file, "a", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerow(row)
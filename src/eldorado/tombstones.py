@@ -0,0 +1,33 @@
+import os
+from pathlib import Path
+
+from eldorado.logging_config import logger
+
+
+def read_tombstones(tombstone_file: Path) -> set[Path]:
+    # Pod5 directories of finalized runs, one per line
+    if not tombstone_file.exists():
+        return set()
+    with open(tombstone_file, "r", encoding="utf-8") as f:
+        return {Path(line.strip()) for line in f if line.strip()}
+
+
+def add_tombstone(tombstone_file: Path, pod5_dir: Path) -> None:
+    # Append a single line, so concurrent writers do not interleave
+    tombstone_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(tombstone_file, "a", encoding="utf-8") as f:
+        f.write(f"{pod5_dir}\n")
+    logger.info("Added tombstone for %s to %s", str(pod5_dir), str(tombstone_file))
+
+
+def remove_tombstone(tombstone_file: Path, pod5_dir: Path) -> bool:
+    tombstones = read_tombstones(tombstone_file)
+    if pod5_dir not in tombstones:
+        return False
+
+    # Replace the file atomically
+    tmp_file = tombstone_file.with_name(f"{tombstone_file.name}.tmp")
+    tmp_file.write_text("".join(f"{x}\n" for x in sorted(tombstones - {pod5_dir})), encoding="utf-8")
+    os.replace(tmp_file, tombstone_file)
+    logger.info("Removed tombstone for %s from %s", str(pod5_dir), str(tombstone_file))
+    return True
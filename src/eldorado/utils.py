@@ -1,18 +1,215 @@
-import subprocess
+import fcntl
 import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from itertools import islice
 from pathlib import Path
+from typing import Generator, Iterable, List
+
+from eldorado.constants import JOB_NAME_PREFIX, POD5_PROBE_WORKERS, SLURM_QUEUE_TTL_SECONDS
+from eldorado.logging_config import logger
+
+
+@dataclass
+class SlurmQueueSnapshot:
+    # Cached result of a single squeue call, shared by all queue lookups in a tick
+    ttl: float = SLURM_QUEUE_TTL_SECONDS
+    jobs: dict[str, str] = field(default_factory=dict)
+    names: dict[str, str] = field(default_factory=dict)
+    comments: dict[str, str] = field(default_factory=dict)
+    timestamp: float | None = None
+
+    # Runs are processed by concurrent workers
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False, compare=False)
+
+    def refresh(self) -> None:
+        try:
+            res = subprocess.run(
+                ["squeue", "--me", "--array", "--noheader", "--format", "%i|%T|%j|%k"],
+                check=True,
+                capture_output=True,
+            )
+        except subprocess.CalledProcessError as e:
+            # Keep the last snapshot when Slurm is briefly unavailable, e.g. when slurmctld times out. Retried after the TTL
+            logger.warning("Could not query the Slurm queue. Keeping the last snapshot: %s", (e.stderr or b"").decode("utf-8", errors="replace").strip())
+            self.timestamp = time.monotonic()
+            return
+        output = res.stdout.decode("utf-8")
+        self.jobs = parse_squeue_output(output)
+        self.names = parse_squeue_job_names(output)
+        self.comments = parse_squeue_job_comments(output)
+        self.timestamp = time.monotonic()
+
+    def get_jobs(self) -> dict[str, str]:
+        with self.lock:
+            if self.timestamp is None or time.monotonic() - self.timestamp > self.ttl:
+                self.refresh()
+            return self.jobs
+
+    def add_job(self, job_id: str, name: str = "", comment: str = "", array_task_ids: List[str] | None = None, state: str = "PENDING") -> None:
+        # Register a submitted job, so it is seen as queued and counted before the next refresh
+        with self.lock:
+            jobs = self.get_jobs()
+            jobs[job_id] = state
+
+            # Array tasks are listed one by one, like in the output of squeue --array
+            for queued_job_id in [f"{job_id}_{x}" for x in array_task_ids] if array_task_ids else [job_id]:
+                jobs[queued_job_id] = state
+                if name.startswith(JOB_NAME_PREFIX):
+                    self.names[queued_job_id] = name
+                    if comment:
+                        self.comments[queued_job_id] = comment
+
+    def is_in_queue(self, job_id: str) -> bool:
+        return job_id in self.get_jobs()
+
+    def count_jobs(self, name_prefix: str) -> int:
+        # Count queued jobs and array tasks by name
+        with self.lock:
+            self.get_jobs()
+            return sum(1 for name in self.names.values() if name.startswith(name_prefix))
+
+    def get_comments(self, name_prefix: str) -> List[str]:
+        # Comments of queued jobs and array tasks by name
+        with self.lock:
+            self.get_jobs()
+            return [self.comments[job_id] for job_id, name in self.names.items() if name.startswith(name_prefix) and job_id in self.comments]
+
+
+def parse_squeue_output(output: str) -> dict[str, str]:
+    jobs = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        job_id, state, name = line.strip().split("|")[:3]
+
+        # Only keep Eldorado jobs
+        if not name.startswith(JOB_NAME_PREFIX):
+            continue
+
+        jobs[job_id] = state
+
+        # Array tasks (e.g. 1234_5) also mark the array job as queued
+        array_job_id = job_id.split("_")[0]
+        jobs.setdefault(array_job_id, state)
+    return jobs
+
+
+def parse_squeue_job_names(output: str) -> dict[str, str]:
+    names = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        job_id, _, name = line.strip().split("|")[:3]
+        if name.startswith(JOB_NAME_PREFIX):
+            names[job_id] = name
+    return names
+
+
+def parse_squeue_job_comments(output: str) -> dict[str, str]:
+    comments = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        job_id, _, name, *rest = line.strip().split("|", maxsplit=3)
+
+        # squeue shows (null) for jobs without a comment
+        comment = rest[0] if rest else ""
+        if name.startswith(JOB_NAME_PREFIX) and comment and comment != "(null)":
+            comments[job_id] = comment
+    return comments
+
+
+def parse_array_task_ids(array: str) -> List[str]:
+    # Slurm array specification, e.g. 1-4, 1,3,5 or 1-10%2 with a limit of concurrent tasks
+    task_ids = []
+    for part in array.split("%")[0].split(","):
+        start, _, end = part.strip().partition("-")
+        if start.isdigit() and (not end or end.isdigit()):
+            task_ids.extend(str(x) for x in range(int(start), int(end or start) + 1))
+    return task_ids
+
+
+def read_sbatch_options(script_file: Path) -> dict[str, str]:
+    # Options of the #SBATCH lines of a Slurm script, e.g. {"--job-name": "eldorado-merge-lib"}
+    try:
+        lines = script_file.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return {}
+
+    options = {}
+    for line in lines:
+        parts = line.strip().split(maxsplit=2)
+        if len(parts) == 3 and parts[0] == "#SBATCH":
+            options[parts[1]] = parts[2].strip()
+    return options
+
+
+slurm_queue = SlurmQueueSnapshot()
 
 
 def is_in_queue(job_id: str):
     if not job_id:
         return False
 
-    res = subprocess.run(
-        ["squeue", "--job", job_id],
-        check=False,
+    return slurm_queue.is_in_queue(job_id)
+
+
+def submit_slurm_script(script_file: Path, dependency: List[str] | None = None) -> str:
+    # Start the job when all dependencies have completed successfully. Slurm removes the job if a dependency fails
+    dependency_args = [f"--dependency=afterok:{':'.join(dependency)}", "--kill-on-invalid-dep=yes"] if dependency else []
+
+    # Submit the job using Slurm
+    std_out = subprocess.run(
+        ["sbatch", "--parsable", *dependency_args, str(script_file)],
         capture_output=True,
+        check=True,
+    )
+
+    # Register job in the queue snapshot with its name and comment, so it counts towards the queue limits right away
+    job_id = std_out.stdout.decode("utf-8").strip()
+    options = read_sbatch_options(script_file)
+    slurm_queue.add_job(
+        job_id,
+        name=options.get("--job-name", ""),
+        comment=options.get("--comment", ""),
+        array_task_ids=parse_array_task_ids(options.get("--array", "")),
     )
-    return res.returncode == 0
+
+    return job_id
+
+
+@contextmanager
+def try_lock_file(lock_file: Path) -> Generator[bool, None, None]:
+    # Take an exclusive lock without waiting. Yield whether the lock was taken
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_file, "a", encoding="utf-8") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def parse_walltime(walltime: str) -> int:
+    # Slurm time format [D-]HH:MM:SS to seconds
+    days, _, time_str = walltime.rpartition("-")
+    hours, minutes, seconds = (int(x) for x in time_str.split(":"))
+    return int(days or 0) * 24 * 60 * 60 + hours * 60 * 60 + minutes * 60 + seconds
+
+
+def format_walltime(seconds: int) -> str:
+    hours, remainder = divmod(seconds, 60 * 60)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
 
 def write_to_file(file_path: Path, content: str):
@@ -29,13 +226,31 @@ def is_complete_pod5_file(path: Path) -> bool:
     fd = os.open(path, os.O_RDONLY)
     try:
         # Check if the file starts with the pattern
-        header = os.read(fd, pattern_len)
+        header = os.pread(fd, pattern_len, 0)
         if header != pattern:
             return False
 
-        # Check if the file ends with the pattern
-        os.lseek(fd, -pattern_len, os.SEEK_END)
-        footer = os.read(fd, pattern_len)
+        # Check if the file ends with the pattern. pread seeks and reads in a single call
+        file_size = os.fstat(fd).st_size
+        footer = os.pread(fd, pattern_len, file_size - pattern_len)
         return footer == pattern
     finally:
         os.close(fd)
+
+
+def probe_pod5_files(paths: List[Path], max_workers: int = POD5_PROBE_WORKERS) -> List[bool]:
+    # Probes mostly wait on storage round trips, so concurrent probes overlap the latency
+    if len(paths) <= 1:
+        return [is_complete_pod5_file(path) for path in paths]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+        return list(executor.map(is_complete_pod5_file, paths))
+
+
+def iter_complete_pod5_files(paths: Iterable[Path], max_workers: int = POD5_PROBE_WORKERS) -> Generator[Path, None, None]:
+    # Probe in chunks of one file per worker, so callers that need a single complete file can stop early
+    paths = iter(paths)
+    while chunk := list(islice(paths, max_workers)):
+        for path, is_complete in zip(chunk, probe_pod5_files(chunk, max_workers)):
+            if is_complete:
+                yield path
@@ -1,4 +1,55 @@
+import datetime
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pod5
+
+
 def create_files(files):
     for file in files:
         file.parent.mkdir(parents=True, exist_ok=True)
         file.touch()
+
+
+def create_pod5_file(path: Path, protocol_run_id: str = "1234", sample_rate: int = 5000, n_reads: int = 1, n_samples: int = 100):
+    run_info = pod5.RunInfo(
+        acquisition_id="acquisition",
+        acquisition_start_time=datetime.datetime(2024, 1, 1),
+        adc_max=4095,
+        adc_min=-4096,
+        context_tags={},
+        experiment_name="project",
+        flow_cell_id="PAK00000",
+        flow_cell_product_code="flo-pro114m",
+        protocol_name="protocol",
+        protocol_run_id=protocol_run_id,
+        protocol_start_time=datetime.datetime(2024, 1, 1),
+        sample_id="library",
+        sample_rate=sample_rate,
+        sequencing_kit="sqk-lsk114",
+        sequencer_position="1A",
+        sequencer_position_type="promethion",
+        software="software",
+        system_name="system",
+        system_type="system",
+        tracking_id={},
+    )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(0)
+    with pod5.Writer(path) as writer:
+        for i in range(n_reads):
+            writer.add_read(
+                pod5.Read(
+                    read_id=uuid.uuid4(),
+                    pore=pod5.Pore(channel=1, well=1, pore_type="pore"),
+                    calibration=pod5.Calibration(offset=0.0, scale=1.0),
+                    read_number=i,
+                    start_sample=0,
+                    median_before=0.0,
+                    end_reason=pod5.EndReason.from_reason_with_default_forced(pod5.EndReasonEnum.UNKNOWN),
+                    run_info=run_info,
+                    signal=rng.integers(-4096, 4095, n_samples, dtype=np.int16),
+                )
+            )
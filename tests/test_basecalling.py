@@ -1,3 +1,7 @@
+import random
+import time
+from pathlib import Path
+
 import pytest
 
 import eldorado.basecalling as basecalling
@@ -5,9 +9,24 @@ from eldorado.basecalling import (
     BasecallingBatch,
     cleanup_basecalling_lock_files,
     file_size,
+    get_basecalling_job_ids,
+    get_batch_costs,
+    get_batch_deadline,
+    pack_balanced,
+    pack_sequential,
+    parse_basecalling_job_comment,
+    plan_basecalling_batches,
+    process_unbasecalled_pod5_files,
     split_files_into_groups,
+    submit_basecalling_batches,
 )
+from eldorado.cluster import ClusterLoad, GpuTarget
+from eldorado.configuration import DoradoConfig, Metadata
+from eldorado.constants import BATCH_PACKING_BALANCED
 from eldorado.pod5_handling import SequencingRun
+from eldorado.resources import SlurmResources
+from eldorado.run_state import DONE, LOCKED, TRANSFERRED
+from eldorado.throughput import ThroughputModel
 from tests.conftest import create_files
 
 
@@ -26,6 +45,7 @@ def test_setup(pod5_files_count, tmp_path):
     create_files(pod5_files)
 
     run = SequencingRun(pod5_dir)
+    run.state.add_transferred_pod5_files(pod5_files)
     batch = BasecallingBatch(run=run, pod5_files=pod5_files)
 
     # Act
@@ -33,7 +53,7 @@ def test_setup(pod5_files_count, tmp_path):
 
     # Assert
     assert batch.working_dir.exists()
-    assert all(lock_file.parent.exists() for lock_file in batch.pod5_lock_files)
+    assert run.state.get_pod5_files(LOCKED) == pod5_files
     assert batch.pod5_manifest.read_text(encoding="utf-8") == "\n".join(str(file) for file in pod5_files) + "\n"
 
 
@@ -97,103 +117,95 @@ def test_file_size(tmp_path, pod5_dir, existing_files, expected):
 
 
 @pytest.mark.parametrize(
-    "pod5_dir, existing_files, pod5_is_in_queue, expected_files_after_cleanup",
+    "job_id, pod5_is_in_queue, batch_is_done, expected_state",
     [
         pytest.param(
-            "pod5",
-            [],
+            "1234",
+            True,
             False,
-            [],
-            id="Empty",
+            LOCKED,
+            id="Pod5 file in queue",
         ),
         pytest.param(
-            "pod5",
-            [
-                "pod5/file.pod5",
-                "bam_eldorado/basecalling/batches/1234/pod5_manifest.txt",
-                "bam_eldorado/basecalling/batches/1234/batch_job_id.txt",
-                "bam_eldorado/basecalling/lock_files/file.pod5.lock",
-            ],
-            True,
-            [
-                "pod5/file.pod5",
-                "bam_eldorado/basecalling/batches/1234/pod5_manifest.txt",
-                "bam_eldorado/basecalling/batches/1234/batch_job_id.txt",
-                "bam_eldorado/basecalling/lock_files/file.pod5.lock",
-            ],
-            id="Pod5 file in queue",
+            "1234",
+            False,
+            False,
+            TRANSFERRED,
+            id="Job not in queue",
         ),
         pytest.param(
-            "pod5",
-            [
-                "pod5/file.pod5",
-                "bam_eldorado/basecalling/batches/1234/pod5_manifest.txt",
-                "bam_eldorado/basecalling/batches/1234/batch_job_id.txt",
-                "bam_eldorado/basecalling/lock_files/file.pod5.lock",
-            ],
+            None,
             False,
-            [
-                "pod5/file.pod5",
-                "bam_eldorado/basecalling/batches/1234/pod5_manifest.txt",
-                "bam_eldorado/basecalling/batches/1234/batch_job_id.txt",
-            ],
-            id="Missing pod5 manifest",
+            False,
+            TRANSFERRED,
+            id="Missing slurm id",
         ),
         pytest.param(
-            "pod5",
-            [
-                "pod5/file.pod5",
-                "bam_eldorado/basecalling/batches/1234/pod5_manifest.txt",
-                "bam_eldorado/basecalling/lock_files/file.pod5.lock",
-            ],
+            "1234",
             False,
-            [
-                "pod5/file.pod5",
-                "bam_eldorado/basecalling/batches/1234/pod5_manifest.txt",
-            ],
-            id="Missing slurm id file",
+            True,
+            DONE,
+            id="Batch done",
+        ),
+        pytest.param(
+            "1234",
+            True,
+            True,
+            DONE,
+            id="Batch done while still in queue",
         ),
     ],
 )
-def test_cleanup_stalled_batch_basecalling_dirs_and_lock_files(
+def test_cleanup_basecalling_lock_files(
     monkeypatch,
     tmp_path,
-    pod5_dir,
-    existing_files,
+    job_id,
     pod5_is_in_queue,
-    expected_files_after_cleanup,
+    batch_is_done,
+    expected_state,
 ):
-    # Mock is_file_inactive
+    # Mock is_in_queue
     def mock_is_in_queue(*args, **kwargs):
         return pod5_is_in_queue
 
     monkeypatch.setattr(basecalling, "is_in_queue", mock_is_in_queue)
 
-    def mock_read_pod5_manifest(*args, **kwargs):
-        return [tmp_path / "pod5" / "file.pod5"]
+    # Arrange
+    pod5_file = tmp_path / "pod5" / "file.pod5"
+    create_files([pod5_file])
+
+    run = SequencingRun(pod5_file.parent)
+    run.state.add_transferred_pod5_files([pod5_file])
+
+    batch_dir = run.basecalling_batches_dir / "1234"
+    run.state.lock_batch("1234", batch_dir, [pod5_file])
+    if job_id:
+        run.state.set_batch_job_id("1234", job_id)
+    if batch_is_done:
+        create_files([batch_dir / "batch.done"])
+
+    # Act
+    cleanup_basecalling_lock_files(run)
+
+    # Assert
+    assert run.state.get_pod5_files(expected_state) == [pod5_file]
 
-    monkeypatch.setattr(basecalling, "read_pod5_manifest", mock_read_pod5_manifest)
 
+def test_cleanup_basecalling_lock_files_releases_orphaned_locks(tmp_path):
     # Arrange
-    # Insert tmp_path
-    pod5_dir = tmp_path / pod5_dir
-    existing_files = [tmp_path / file for file in existing_files]
-    expected_files_after_cleanup = [tmp_path / file for file in expected_files_after_cleanup]
+    pod5_file = tmp_path / "pod5" / "file.pod5"
+    create_files([pod5_file, tmp_path / "bam_eldorado/basecalling/transferred_pod5_files/file.pod5"])
+    create_files([tmp_path / "bam_eldorado/basecalling/lock_files/file.pod5.lock"])
 
-    # Create existing files
-    for file in existing_files:
-        file.parent.mkdir(parents=True, exist_ok=True)
-        file.touch()
+    run = SequencingRun(pod5_file.parent)
+    run.reindex_state()
 
     # Act
-    cleanup_basecalling_lock_files(
-        pod5_dir=SequencingRun(pod5_dir),
-    )
+    cleanup_basecalling_lock_files(run)
 
     # Assert
-    all_files = {x for x in tmp_path.rglob("*") if x.is_file()}
-
-    assert all_files == set(expected_files_after_cleanup)
+    assert run.state.count_pod5_files(LOCKED) == 0
+    assert run.state.count_pod5_files(TRANSFERRED) == 1
 
 
 @pytest.mark.parametrize(
@@ -276,3 +288,409 @@ def test_split_files_into_groups(tmp_path, max_batch_size, unbasecalled_pod5_fil
     # Assert
     observed_groups = [[file.name for file in group] for group in groups]
     assert observed_groups == expected_groups
+
+
+def setup_run_for_submission(tmp_path, n_pod5_files):
+    pod5_files = [tmp_path / "pod5" / f"file{i}.pod5" for i in range(n_pod5_files)]
+    for pod5_file in pod5_files:
+        pod5_file.parent.mkdir(parents=True, exist_ok=True)
+        pod5_file.write_text("a")
+
+    run = SequencingRun(pod5_files[0].parent)
+    run.state.add_transferred_pod5_files(pod5_files)
+    Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114").save(run.metadata_file)
+    DoradoConfig(tmp_path / "dorado", tmp_path / "model", []).save(run.dorado_config_file)
+    return run
+
+
+@pytest.mark.parametrize(
+    "job_array, expected_scripts",
+    [
+        pytest.param(False, 3, id="One job per batch"),
+        pytest.param(True, 1, id="Job array"),
+    ],
+)
+def test_process_unbasecalled_pod5_files(monkeypatch, tmp_path, job_array, expected_scripts):
+    # Mock submission
+    monkeypatch.setattr(basecalling, "submit_slurm_script", lambda script_file: "100")
+
+    # Arrange
+    run = setup_run_for_submission(tmp_path, n_pod5_files=3)
+
+    # Act
+    process_unbasecalled_pod5_files(
+        run=run,
+        min_batch_size=0,
+        max_batch_size=1,
+        walltime="01:00:00",
+        mail_user="",
+        slurm_account="account",
+        dry_run=False,
+        job_array=job_array,
+    )
+
+    # Assert
+    scripts = list(run.basecalling_working_dir.rglob("*.sh"))
+    assert len(scripts) == expected_scripts
+
+    job_ids = sorted(job_id for _, _, job_id in run.state.get_active_batches())
+    assert job_ids == (["100_1", "100_2", "100_3"] if job_array else ["100", "100", "100"])
+    assert run.state.count_pod5_files(LOCKED) == 3
+
+
+def test_submit_basecalling_array_script(tmp_path):
+    # Arrange
+    run = setup_run_for_submission(tmp_path, n_pod5_files=2)
+
+    # Act
+    process_unbasecalled_pod5_files(
+        run=run,
+        min_batch_size=0,
+        max_batch_size=1,
+        walltime="01:00:00",
+        mail_user="",
+        slurm_account="account",
+        dry_run=True,
+        job_array=True,
+    )
+
+    # Assert
+    (script_file,) = run.basecalling_arrays_dir.glob("*/run_basecaller_array.sh")
+    script = script_file.read_text(encoding="utf-8")
+    assert "#SBATCH --array             1-2" in script
+    assert 'OUTDIR=$(sed -n "${SLURM_ARRAY_TASK_ID}p"' in script
+
+    batch_dirs = (script_file.parent / "batch_manifest.txt").read_text(encoding="utf-8").splitlines()
+    assert sorted(batch_dirs) == sorted(str(d) for _, d, _ in run.state.get_active_batches())
+    assert all((run.basecalling_batches_dir / Path(x).name / "pod5_manifest.txt").exists() for x in batch_dirs)
+
+
+def test_process_unbasecalled_pod5_files_chooses_gpu_targets(tmp_path):
+    # Arrange: two idle GPUs of one type and a short queue for the other
+    run = setup_run_for_submission(tmp_path, n_pod5_files=3)
+    l40s, a100 = GpuTarget("gpu", "l40s"), GpuTarget("gpu-a100", "a100")
+    cluster_load = ClusterLoad(
+        targets=[l40s, a100],
+        free_gpus={l40s: 2, a100: 0},
+        waits={a100: 600},
+        timestamp=time.time(),
+        is_sampled=True,
+    )
+
+    # Act
+    process_unbasecalled_pod5_files(
+        run=run,
+        min_batch_size=0,
+        max_batch_size=1,
+        walltime="01:00:00",
+        mail_user="",
+        slurm_account="account",
+        dry_run=True,
+        job_array=True,
+        cluster_load=cluster_load,
+    )
+
+    # Assert: one job array per target
+    scripts = sorted(x.read_text(encoding="utf-8") for x in run.basecalling_arrays_dir.glob("*/run_basecaller_array.sh"))
+    resources = [line.split()[-1] for script in scripts for line in script.splitlines() if "--partition" in line or "--gres" in line]
+    assert len(scripts) == 2
+    assert sorted(resources) == ["gpu", "gpu-a100", "gpu:a100:1", "gpu:l40s:1"]
+    assert "#SBATCH --array             1-2" in "".join(scripts)
+    assert 'echo "partition=gpu:l40s"' in "".join(scripts)
+
+
+def test_process_unbasecalled_pod5_files_multi_gpu(tmp_path):
+    # Arrange: six files of 1 byte, and nodes with four GPUs
+    run = setup_run_for_submission(tmp_path, n_pod5_files=6)
+    a100 = GpuTarget("gpu", "a100", gpus_per_node=4)
+    cluster_load = ClusterLoad(
+        targets=[a100],
+        free_gpus={GpuTarget("gpu", "a100"): 8},
+        timestamp=time.time(),
+        is_sampled=True,
+    )
+
+    # Act
+    process_unbasecalled_pod5_files(
+        run=run,
+        min_batch_size=0,
+        max_batch_size=1,
+        walltime="01:00:00",
+        mail_user="",
+        slurm_account="account",
+        dry_run=True,
+        cluster_load=cluster_load,
+        multi_gpu_threshold=2,
+    )
+
+    # Assert: a full node for the first four files, and single-GPU batches for the rest below the threshold
+    scripts = [x.read_text(encoding="utf-8") for x in run.basecalling_batches_dir.glob("*/run_basecaller.sh")]
+    multi_gpu_scripts = [x for x in scripts if "--device cuda:all" in x]
+    assert len(scripts) == 3
+    assert len(multi_gpu_scripts) == 1
+    assert "#SBATCH --gres              gpu:a100:4" in multi_gpu_scripts[0]
+    assert "#SBATCH --cpus-per-task     8" in multi_gpu_scripts[0]
+    assert "#SBATCH --mem               128g" in multi_gpu_scripts[0]
+    assert 'echo "gpus=4"' in multi_gpu_scripts[0]
+    assert sum("#SBATCH --gres              gpu:a100:1" in x for x in scripts) == 2
+
+
+def test_process_unbasecalled_pod5_files_uses_resource_profile(tmp_path):
+    # Arrange
+    run = setup_run_for_submission(tmp_path, n_pod5_files=1)
+    resources = SlurmResources(cpus=4, mem_gb=48, walltime="02:00:00", partition="gpu-long")
+
+    # Act
+    process_unbasecalled_pod5_files(
+        run=run,
+        min_batch_size=0,
+        max_batch_size=1,
+        walltime="01:00:00",
+        mail_user="",
+        slurm_account="account",
+        dry_run=True,
+        resources=resources,
+    )
+
+    # Assert
+    (script_file,) = run.basecalling_batches_dir.glob("*/run_basecaller.sh")
+    script = script_file.read_text(encoding="utf-8")
+    assert "#SBATCH --partition         gpu-long" in script
+    assert "#SBATCH --time              02:00:00" in script
+    assert "#SBATCH --cpus-per-task     4" in script
+    assert "#SBATCH --mem               48g" in script
+
+
+def test_submit_basecalling_batches_tags_jobs_with_project(tmp_path):
+    # Arrange
+    run = setup_run_for_submission(tmp_path, n_pod5_files=2)
+    planned_batches = plan_basecalling_batches(run=run, min_batch_size=0, max_batch_size=1, walltime="01:00:00")
+
+    # Act
+    submit_basecalling_batches(
+        run=run,
+        planned_batches=planned_batches,
+        walltime="01:00:00",
+        mail_user="",
+        slurm_account="account",
+        dry_run=True,
+        project_id="project",
+    )
+
+    # Assert
+    script_files = list(run.basecalling_batches_dir.glob("*/run_basecaller.sh"))
+    assert len(script_files) == 2
+    for script_file in script_files:
+        (comment,) = [line.split()[-1] for line in script_file.read_text(encoding="utf-8").splitlines() if "--comment" in line]
+        assert parse_basecalling_job_comment(comment) == ("project", 1)
+
+
+@pytest.mark.parametrize(
+    "comment, expected",
+    [
+        pytest.param("project=a;pod5_bytes=10", ("a", 10), id="Valid comment"),
+        pytest.param("project=a", None, id="Missing size"),
+        pytest.param("project=a;pod5_bytes=ten", None, id="Invalid size"),
+        pytest.param("", None, id="Empty comment"),
+    ],
+)
+def test_parse_basecalling_job_comment(comment, expected):
+    assert parse_basecalling_job_comment(comment) == expected
+
+
+@pytest.mark.parametrize(
+    "batches, queued_job_ids, expected",
+    [
+        pytest.param([("batch1", "100", False), ("batch2", "101", False)], {"100", "101"}, ["100", "101"], id="All jobs queued"),
+        pytest.param([("batch1", "100", True), ("batch2", "101", False)], {"101"}, ["101"], id="Finished batch is skipped"),
+        pytest.param([("batch1", "100", False), ("batch2", "101", False)], {"101"}, None, id="Job not in queue"),
+        pytest.param([("batch1", None, False)], set(), None, id="Batch without job"),
+    ],
+)
+def test_get_basecalling_job_ids(monkeypatch, tmp_path, batches, queued_job_ids, expected):
+    # Mock queue
+    monkeypatch.setattr(basecalling, "is_in_queue", lambda job_id: job_id in queued_job_ids)
+
+    # Arrange
+    run = SequencingRun(tmp_path / "pod5")
+    for batch_id, job_id, is_done in batches:
+        working_dir = run.basecalling_batches_dir / batch_id
+        run.state.lock_batch(batch_id, working_dir, [])
+        if job_id is not None:
+            run.state.set_batch_job_id(batch_id, job_id)
+        if is_done:
+            create_files([working_dir / "batch.done"])
+
+    # Act
+    result = get_basecalling_job_ids(run)
+
+    # Assert
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    "sizes, max_batch_size, expected_groups",
+    [
+        pytest.param([], 10, [], id="Empty"),
+        pytest.param([10, 10, 10, 1], 30, [[0, 2], [1, 3]], id="No tiny last batch"),
+        pytest.param([6, 5, 4, 3, 2], 12, [[0, 3, 4], [1, 2]], id="Largest first"),
+        pytest.param([25, 1, 1], 10, [[0], [1], [2]], id="File larger than max batch size"),
+        pytest.param([6, 6, 6], 10, [[0], [1], [2]], id="Batch added when packing does not fit"),
+    ],
+)
+def test_pack_balanced(sizes, max_batch_size, expected_groups):
+    # Act
+    groups = pack_balanced(sizes, max_batch_size)
+
+    # Assert
+    assert groups == expected_groups
+
+
+@pytest.mark.parametrize("n_files", [pytest.param(1_000, id="Heap"), pytest.param(60_000, id="NumPy")])
+def test_pack_balanced_minimises_largest_batch(n_files):
+    # Arrange
+    rng = random.Random(42)
+    sizes = [rng.randint(1, 1000) for _ in range(n_files)]
+    max_batch_size = sum(sizes) // 7
+
+    # Act
+    balanced_groups = pack_balanced(sizes, max_batch_size)
+    sequential_groups = pack_sequential(sizes, max_batch_size)
+
+    # Assert
+    def group_sizes(groups):
+        return [sum(sizes[i] for i in group) for group in groups]
+
+    assert sorted(i for group in balanced_groups for i in group) == list(range(n_files))
+    assert len(balanced_groups) <= len(sequential_groups)
+    assert max(group_sizes(balanced_groups)) <= max_batch_size
+    assert max(group_sizes(balanced_groups)) - min(group_sizes(balanced_groups)) <= 1000
+
+
+def test_split_files_into_groups_balanced(tmp_path):
+    # Arrange
+    pod5_files = [tmp_path / f"file_{i}.pod5" for i in range(4)]
+    for pod5_file, size in zip(pod5_files, [10, 10, 10, 1]):
+        pod5_file.write_bytes(b"a" * size)
+
+    # Act
+    groups = split_files_into_groups(30, pod5_files, BATCH_PACKING_BALANCED)
+
+    # Assert
+    assert groups == [[pod5_files[0], pod5_files[2]], [pod5_files[1], pod5_files[3]]]
+
+
+@pytest.mark.parametrize(
+    "signal_samples, min_batch_samples, max_batch_samples, expected",
+    [
+        pytest.param(
+            {"a.pod5": 1000, "b.pod5": 3000},
+            None,
+            None,
+            ([10, 10], 1, 20, "B"),
+            id="Bytes by default",
+        ),
+        pytest.param(
+            {"a.pod5": 1000, "b.pod5": 3000},
+            500,
+            5000,
+            ([1000, 3000], 500, 5000, "samples"),
+            id="Signal samples",
+        ),
+        pytest.param(
+            {"a.pod5": 1000, "b.pod5": None},
+            None,
+            5000,
+            ([1000, 1000], 100, 5000, "samples"),
+            id="Unreadable file and min batch size estimated from bytes",
+        ),
+        pytest.param(
+            {"a.pod5": None, "b.pod5": None},
+            500,
+            5000,
+            ([10, 10], 1, 20, "B"),
+            id="Fall back to bytes",
+        ),
+    ],
+)
+def test_get_batch_costs(monkeypatch, tmp_path, signal_samples, min_batch_samples, max_batch_samples, expected):
+    # Arrange
+    pod5_files = [tmp_path / "pod5" / name for name in signal_samples]
+    for pod5_file in pod5_files:
+        pod5_file.parent.mkdir(parents=True, exist_ok=True)
+        pod5_file.write_bytes(b"a" * 10)
+    run = SequencingRun(tmp_path / "pod5")
+    monkeypatch.setattr(basecalling, "get_signal_samples", lambda run, pod5_files: signal_samples)
+
+    # Act
+    result = get_batch_costs(run, pod5_files, [10, 10], 1, 20, min_batch_samples, max_batch_samples)
+
+    # Assert
+    assert result == expected
+
+
+def test_process_unbasecalled_pod5_files_with_throughput_model(tmp_path):
+    # Arrange
+    run = setup_run_for_submission(tmp_path, n_pod5_files=4)
+    throughput_model = ThroughputModel({("model", "gpu", "B"): 1 / 3600})
+
+    # Act
+    process_unbasecalled_pod5_files(
+        run=run,
+        min_batch_size=0,
+        max_batch_size=10,
+        walltime="12:00:00",
+        mail_user="",
+        slurm_account="account",
+        dry_run=True,
+        throughput_model=throughput_model,
+        target_runtime="02:00:00",
+    )
+
+    # Assert
+    scripts = [script_file.read_text(encoding="utf-8") for script_file in run.basecalling_batches_dir.glob("*/run_basecaller.sh")]
+    assert len(scripts) == 2
+    assert all("#SBATCH --time              03:15:00" in script for script in scripts)
+
+
+@pytest.mark.parametrize(
+    "max_batch_wait, waited_seconds, expected_batches",
+    [
+        pytest.param(None, 10_000, 0, id="No max batch wait"),
+        pytest.param("01:00:00", 60, 0, id="Below max batch wait"),
+        pytest.param("01:00:00", 3600, 1, id="Max batch wait exceeded"),
+    ],
+)
+def test_process_unbasecalled_pod5_files_max_batch_wait(tmp_path, max_batch_wait, waited_seconds, expected_batches):
+    # Arrange
+    pod5_file = tmp_path / "pod5" / "file.pod5"
+    create_files([pod5_file])
+    run = SequencingRun(pod5_file.parent)
+    run.state.add_transferred_pod5_files([pod5_file], added_at=time.time() - waited_seconds)
+    DoradoConfig(tmp_path / "dorado", tmp_path / "model", []).save(run.dorado_config_file)
+    Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114").save(run.metadata_file)
+
+    # Act
+    process_unbasecalled_pod5_files(
+        run=run,
+        min_batch_size=1024,
+        max_batch_size=2048,
+        walltime="01:00:00",
+        mail_user="",
+        slurm_account="account",
+        dry_run=True,
+        max_batch_wait=max_batch_wait,
+    )
+
+    # Assert
+    assert len(run.state.get_active_batches()) == expected_batches
+
+
+def test_get_batch_deadline(tmp_path):
+    # Arrange
+    run = SequencingRun(tmp_path / "pod5")
+    run.state.add_transferred_pod5_files([tmp_path / "pod5" / "file.pod5"], added_at=100)
+
+    # Act / Assert
+    assert get_batch_deadline(run, "00:01:00") == 160
+    assert get_batch_deadline(run, None) is None
@@ -0,0 +1,218 @@
+import subprocess
+import textwrap
+from datetime import datetime
+
+import pytest
+
+import eldorado.cluster as cluster
+from eldorado.cluster import (
+    ClusterLoad,
+    GpuTarget,
+    parse_gres,
+    parse_sinfo_output,
+    parse_squeue_start_output,
+    read_gpu_targets,
+)
+from eldorado.throughput import ThroughputModel
+
+# Recorded with: sinfo --noheader --partition gpu,gpu-a100 --format "%P|%G|%t|%D"
+SINFO_OUTPUT = """\
+gpu*|gpu:v100:2(S:0-1)|mix|3
+gpu*|gpu:v100:2(S:0-1)|alloc|5
+gpu*|gpu:l40s:4(S:0-1)|idle|1
+gpu*|gpu:l40s:4(S:0-1)|drain|1
+gpu-a100|gpu:a100:4(S:0-1)|alloc|4
+"""
+
+# Recorded with: squeue --noheader --start --states PENDING --partition gpu,gpu-a100 --format "%P|%S|%b"
+SQUEUE_START_OUTPUT = """\
+gpu-a100|2026-10-16T14:00:00|gres/gpu:a100:1
+gpu-a100|2026-10-16T13:00:00|gres/gpu:a100:1
+gpu,gpu-a100|2026-10-16T12:30:00|gres/gpu:1
+gpu|N/A|gres/gpu:v100:1
+gpu|2026-10-16T18:00:00|N/A
+"""
+
+NOW = datetime.fromisoformat("2026-10-16T12:00:00").timestamp()
+
+
+@pytest.mark.parametrize(
+    "gres, expected",
+    [
+        pytest.param("gpu:a100:4(S:0-1)", [("a100", 4)], id="Typed with sockets"),
+        pytest.param("gpu:2", [(None, 2)], id="Untyped"),
+        pytest.param("gres/gpu:a100:1", [("a100", 1)], id="Squeue format"),
+        pytest.param("gres/gpu=1", [(None, 1)], id="TRES format"),
+        pytest.param("gpu:a100:2,gpu:v100:2", [("a100", 2), ("v100", 2)], id="Several types"),
+        pytest.param("(null)", [], id="No gres"),
+        pytest.param("N/A", [], id="Not available"),
+    ],
+)
+def test_parse_gres(gres, expected):
+    assert parse_gres(gres) == expected
+
+
+def test_parse_sinfo_output():
+    # Act
+    free_gpus = parse_sinfo_output(SINFO_OUTPUT)
+
+    # Assert: only idle nodes count, busy targets are kept with zero free GPUs
+    assert free_gpus == {
+        GpuTarget("gpu", None): 4,
+        GpuTarget("gpu", "v100"): 0,
+        GpuTarget("gpu", "l40s"): 4,
+        GpuTarget("gpu-a100", None): 0,
+        GpuTarget("gpu-a100", "a100"): 0,
+    }
+
+
+def test_parse_squeue_start_output():
+    # Act
+    waits = parse_squeue_start_output(SQUEUE_START_OUTPUT, NOW)
+
+    # Assert
+    assert waits == {
+        GpuTarget("gpu-a100", "a100"): 2 * 3600,
+        GpuTarget("gpu-a100", None): 1800,
+        GpuTarget("gpu", None): 1800,
+    }
+
+
+def create_cluster_load(monkeypatch, targets, rates=None):
+    # Mock sinfo and squeue with the recorded output
+    calls = []
+
+    def mock_run(args, **kwargs):
+        calls.append(args[0])
+        output = SINFO_OUTPUT if args[0] == "sinfo" else SQUEUE_START_OUTPUT
+        return subprocess.CompletedProcess(args, 0, stdout=output.encode(), stderr=b"")
+
+    monkeypatch.setattr(cluster.subprocess, "run", mock_run)
+    monkeypatch.setattr(cluster.time, "time", lambda: NOW)
+    return ClusterLoad(targets, ThroughputModel(rates or {})), calls
+
+
+@pytest.mark.parametrize(
+    "targets, rates, cost, expected",
+    [
+        pytest.param(
+            [GpuTarget("gpu-a100", "a100"), GpuTarget("gpu", "l40s")],
+            {},
+            1000,
+            GpuTarget("gpu", "l40s"),
+            id="Idle GPUs beat a queue without throughput history",
+        ),
+        pytest.param(
+            [GpuTarget("gpu-a100", "a100"), GpuTarget("gpu", "v100")],
+            {},
+            1000,
+            GpuTarget("gpu", "v100"),
+            id="Pending jobs without a GPU type delay every GPU type",
+        ),
+        pytest.param(
+            [GpuTarget("gpu-h100", "h100"), GpuTarget("gpu-a100", "a100")],
+            {},
+            1000,
+            GpuTarget("gpu-a100", "a100"),
+            id="Partition without nodes is not used",
+        ),
+        pytest.param(
+            [GpuTarget("gpu", "l40s"), GpuTarget("gpu-a100", "a100")],
+            {("model", "gpu:l40s", "B"): 1.0, ("model", "gpu-a100:a100", "B"): 10.0},
+            100_000,
+            GpuTarget("gpu-a100", "a100"),
+            id="Fast GPU is worth the wait for a large batch",
+        ),
+        pytest.param(
+            [GpuTarget("gpu", "l40s"), GpuTarget("gpu-a100", "a100")],
+            {("model", "gpu:l40s", "B"): 1.0, ("model", "gpu-a100:a100", "B"): 10.0},
+            1000,
+            GpuTarget("gpu", "l40s"),
+            id="Small batch runs on the idle GPU",
+        ),
+    ],
+)
+def test_choose_target(monkeypatch, targets, rates, cost, expected):
+    # Arrange
+    cluster_load, _ = create_cluster_load(monkeypatch, targets, rates)
+
+    # Act
+    target = cluster_load.choose_target("model", "B", cost)
+
+    # Assert
+    assert target == expected
+
+
+def test_choose_target_samples_once_and_takes_free_gpus(monkeypatch):
+    # Arrange
+    targets = [GpuTarget("gpu", "l40s"), GpuTarget("gpu-a100", "a100")]
+    cluster_load, calls = create_cluster_load(monkeypatch, targets)
+
+    # Act: the idle node has 4 GPUs
+    chosen = [cluster_load.choose_target("model", "B", 1000) for _ in range(4)]
+
+    # Assert
+    assert chosen == [GpuTarget("gpu", "l40s")] * 4
+    assert cluster_load.get_wait(GpuTarget("gpu", "l40s")) == 1800
+    assert calls == ["sinfo", "squeue"]
+
+
+def test_choose_target_without_slurm(monkeypatch):
+    # Mock missing Slurm commands
+    def mock_run(args, **kwargs):
+        raise FileNotFoundError(args[0])
+
+    monkeypatch.setattr(cluster.subprocess, "run", mock_run)
+    cluster_load = ClusterLoad([GpuTarget("gpu-a100", "a100"), GpuTarget("gpu", "l40s")])
+
+    # Act / Assert: the first target in the config is used
+    assert cluster_load.choose_target("model", "B", 1000) == GpuTarget("gpu-a100", "a100")
+
+
+def test_read_gpu_targets(tmp_path):
+    # Arrange
+    csv_file = tmp_path / "gpu_partitions.csv"
+    csv_file.write_text(
+        textwrap.dedent(
+            """\
+            partition,gpu_type,gpus_per_node
+            gpu-a100,a100,4
+            gpu,,
+            ,l40s,
+            gpu-h100,h100,0
+            """
+        ),
+        encoding="utf-8",
+    )
+
+    # Act
+    targets = read_gpu_targets(csv_file)
+
+    # Assert
+    assert targets == [GpuTarget("gpu-a100", "a100", gpus_per_node=4), GpuTarget("gpu", None)]
+
+
+@pytest.mark.parametrize(
+    "target, gpus, expected_label, expected_gres",
+    [
+        pytest.param(GpuTarget(), 1, "gpu", "gpu:1", id="Default partition"),
+        pytest.param(GpuTarget("gpu-a100", "a100"), 1, "gpu-a100:a100", "gpu:a100:1", id="GPU type"),
+        pytest.param(GpuTarget("gpu-a100", "a100", gpus_per_node=4), 4, "gpu-a100:a100", "gpu:a100:4", id="Multi-GPU"),
+    ],
+)
+def test_gpu_target(target, gpus, expected_label, expected_gres):
+    assert target.label == expected_label
+    assert target.get_gres(gpus) == expected_gres
+
+
+def test_choose_target_for_multi_gpu_batch(monkeypatch):
+    # Arrange: the idle node of the gpu partition has 4 GPUs
+    targets = [GpuTarget("gpu", "l40s", gpus_per_node=4), GpuTarget("gpu-a100", "a100", gpus_per_node=8)]
+    cluster_load, _ = create_cluster_load(monkeypatch, targets)
+
+    # Act
+    chosen = [cluster_load.choose_target("model", "B", 1000, gpus=4), cluster_load.choose_target("model", "B", 1000, gpus=8)]
+
+    # Assert: only the gpu-a100 partition has nodes with 8 GPUs
+    assert chosen == targets
+    assert cluster_load.free_gpus[GpuTarget("gpu", "l40s")] == 0
@@ -6,6 +6,7 @@ import pytest
 import eldorado.configuration as configuration
 from eldorado.configuration import (
     DoradoConfig,
+    Metadata,
     ProjectConfig,
     get_latest_version,
     get_modification_models,
@@ -17,6 +18,7 @@ from eldorado.configuration import (
     unpack_config_row,
 )
 from eldorado.constants import ACCOUNT, BASECALLING_MODEL, DORADO_EXECUTABLE, MOD_5MCG_5HMCG, MOD_6MA, PROJECT_ID
+from eldorado.resources import SlurmResources
 
 
 # Helper functions
@@ -44,6 +46,26 @@ def test_config_save_and_load(tmp_path):
     assert config_path.exists()
 
 
+def test_metadata_save_and_load(tmp_path):
+    # Arrange
+    metadata = Metadata(
+        project_id="project",
+        library_pool_id="library",
+        protocol_run_id="1234",
+        sample_rate=5000,
+        flow_cell_product_code="FLO-PRO114M",
+        sequencing_kit="SQK-LSK114",
+    )
+    metadata_path = Path(tmp_path / "metadata.json")
+
+    # Act
+    metadata.save(metadata_path)
+    loaded_metadata = Metadata.load(metadata_path)
+
+    # Assert
+    assert metadata == loaded_metadata
+
+
 @pytest.mark.parametrize(
     "current_version, candidate_version, expected",
     [
@@ -357,6 +379,42 @@ def test_unpack_project_config(
             ],
             id="One valid project - Default: Use newest model",
         ),
+        pytest.param(
+            """\
+                project_id,account,dorado_executable,basecalling_model,mod_5mcg_5hmcg,mod_6ma,batch_packing
+                default,my_account,path/to/dorado,path/to/model,1,1,balanced
+                project1,,,,,,
+                project2,,,,,,sequential
+            """,
+            [
+                ProjectConfig("project1", "my_account", Path("path/to/dorado"), Path("path/to/model"), True, True, "balanced"),
+                ProjectConfig("project2", "my_account", Path("path/to/dorado"), Path("path/to/model"), True, True, "sequential"),
+            ],
+            id="Batch packing - Filled out from default",
+        ),
+        pytest.param(
+            """\
+                project_id,account,dorado_executable,basecalling_model,mod_5mcg_5hmcg,mod_6ma,merging_cpus,merging_mem_gb,demultiplexing_partition
+                default,my_account,path/to/dorado,path/to/model,1,1,8,,bigmem
+                project1,,,,,,,64,
+            """,
+            [
+                ProjectConfig(
+                    "project1",
+                    "my_account",
+                    Path("path/to/dorado"),
+                    Path("path/to/model"),
+                    True,
+                    True,
+                    resource_profiles={
+                        "basecalling": SlurmResources(cpus=2, mem_gb=32, partition="gpu"),
+                        "merging": SlurmResources(cpus=8, mem_gb=64, walltime="12:00:00"),
+                        "demultiplexing": SlurmResources(cpus=16, mem_gb=128, walltime="12:00:00", partition="bigmem"),
+                    },
+                ),
+            ],
+            id="Resource profiles - Filled out from default",
+        ),
     ],
 )
 def test_project_config_is_invalid(monkeypatch, tmp_path: Path, csv_body: str, expected: bool):
@@ -501,6 +559,86 @@ def project_defaults():
             False,
             id="Invalid bool values - String",
         ),
+        pytest.param(
+            {
+                "project_id": "4",
+                "account": "my_account",
+                "dorado_executable": "",
+                "basecalling_model": "",
+                "mod_5mcg_5hmcg": "",
+                "mod_6ma": "",
+                "batch_packing": "random",
+            },
+            False,
+            id="Invalid batch packing",
+        ),
+        pytest.param(
+            {
+                "project_id": "5",
+                "account": "my_account",
+                "dorado_executable": "",
+                "basecalling_model": "",
+                "mod_5mcg_5hmcg": "",
+                "mod_6ma": "",
+                "max_inflight_gpu_jobs": "4",
+                "max_inflight_bytes": "1000000000000",
+            },
+            True,
+            id="In flight caps",
+        ),
+        pytest.param(
+            {
+                "project_id": "6",
+                "account": "my_account",
+                "dorado_executable": "",
+                "basecalling_model": "",
+                "mod_5mcg_5hmcg": "",
+                "mod_6ma": "",
+                "max_inflight_bytes": "1TB",
+            },
+            False,
+            id="Invalid in flight bytes",
+        ),
+        pytest.param(
+            {
+                "project_id": "7",
+                "account": "my_account",
+                "dorado_executable": "",
+                "basecalling_model": "",
+                "mod_5mcg_5hmcg": "",
+                "mod_6ma": "",
+                "merging_cpus": "8",
+                "demultiplexing_walltime": "1-00:00:00",
+            },
+            True,
+            id="Resource profiles",
+        ),
+        pytest.param(
+            {
+                "project_id": "8",
+                "account": "my_account",
+                "dorado_executable": "",
+                "basecalling_model": "",
+                "mod_5mcg_5hmcg": "",
+                "mod_6ma": "",
+                "merging_mem_gb": "32g",
+            },
+            False,
+            id="Invalid resource memory",
+        ),
+        pytest.param(
+            {
+                "project_id": "9",
+                "account": "my_account",
+                "dorado_executable": "",
+                "basecalling_model": "",
+                "mod_5mcg_5hmcg": "",
+                "mod_6ma": "",
+                "demultiplexing_walltime": "12 hours",
+            },
+            False,
+            id="Invalid resource walltime",
+        ),
     ],
 )
 def test_is_row_inputs_valid(monkeypatch, row, expected):
@@ -0,0 +1,35 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from eldorado.logging_config import RunContextFilter, run_log_context
+
+
+def make_record() -> logging.LogRecord:
+    record = logging.LogRecord("eldorado", logging.INFO, __file__, 1, "message", None, None)
+    RunContextFilter().filter(record)
+    return record
+
+
+def test_run_log_context():
+    # Act
+    with run_log_context("project/sample/run"):
+        record_in_context = make_record()
+    record_after_context = make_record()
+
+    # Assert
+    assert record_in_context.run == "project/sample/run"
+    assert record_after_context.run == "-"
+
+
+def test_run_log_context_is_per_thread():
+    # Arrange
+    def log_in_context(run):
+        with run_log_context(run):
+            return make_record().run
+
+    # Act
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(log_in_context, [f"run{i}" for i in range(20)]))
+
+    # Assert
+    assert results == [f"run{i}" for i in range(20)]
@@ -1,8 +1,378 @@
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
 from typer.testing import CliRunner
-from eldorado.main import app
+
+import eldorado.basecalling as basecalling
+import eldorado.cleanup as cleanup
+import eldorado.demultiplexing as demultiplexing
+import eldorado.main as main
+import eldorado.merging as merging
+import eldorado.resource_history as resource_history
+from eldorado.configuration import DoradoConfig, Metadata, ProjectConfig
+from eldorado.main import (
+    RunOptions,
+    app,
+    process_sequencing_run,
+    process_sequencing_run_exclusively,
+    run_ready_stage,
+    submit_chained_jobs,
+    submit_planned_batches,
+)
+from eldorado.planning import GpuPlanner
+from eldorado.pod5_handling import SequencingRun, find_sequencing_runs_for_processing, update_scan_cursor, update_transferred_pod5_files
+from eldorado.resource_history import ResourceModel
+from eldorado.run_state import LOCKED, TRANSFERRED
+from eldorado.tombstones import read_tombstones
+from eldorado.utils import try_lock_file
+
+# Modules that should only be imported when pod5 files are read
+HEAVY_MODULES = ["pod5", "lib_pod5", "pyarrow", "numpy", "polars"]
+
+
+def create_project_config(tmp_path) -> ProjectConfig:
+    return ProjectConfig("project", "account", tmp_path / "dorado", None, False, False)
+
+
+def create_run_options(tmp_path, **kwargs) -> RunOptions:
+    defaults = {"walltime": "1:00:00", "min_batch_size": 1, "max_batch_size": 1, "dry_run": True}
+    return RunOptions(models_dir=tmp_path / "models", mail_users=["user@example.com"], **{**defaults, **kwargs})
 
 
 def test_help():
     runner = CliRunner()
     result = runner.invoke(app, ["--help"])
     assert result.exit_code == 0
+
+
+def test_process_sequencing_run_skips_unreadable_metadata(tmp_path):
+    # Arrange
+    pod5_dir = tmp_path / "pod5"
+    pod5_dir.mkdir()
+    (pod5_dir / "file.pod5").write_bytes(b"\x8bPOD\r\n\x1a\n" * 8)
+    run = SequencingRun(pod5_dir)
+
+    # Act
+    process_sequencing_run(run=run, project_config=create_project_config(tmp_path), options=create_run_options(tmp_path))
+
+    # Assert
+    assert not run.dorado_config_file.exists()
+
+
+@pytest.mark.parametrize(
+    "sequencing_kit, expected_submissions",
+    [
+        pytest.param("SQK-NBD114-24", [("merging", ["100_1", "100_2"]), ("demultiplexing", ["200"])], id="Barcoded run"),
+        pytest.param("SQK-LSK114", [("merging", ["100_1", "100_2"])], id="Run without barcodes"),
+    ],
+)
+def test_submit_chained_jobs(monkeypatch, tmp_path, sequencing_kit, expected_submissions):
+    # Mock Slurm
+    submissions = []
+
+    def mock_submit_slurm_script(script_file, dependency=None):
+        submissions.append((script_file.parent.name, dependency))
+        return "200" if script_file.parent.name == "merging" else "300"
+
+    monkeypatch.setattr(basecalling, "is_in_queue", lambda job_id: True)
+    monkeypatch.setattr(merging, "submit_slurm_script", mock_submit_slurm_script)
+    monkeypatch.setattr(demultiplexing, "submit_slurm_script", mock_submit_slurm_script)
+
+    # Arrange
+    pod5_dir = tmp_path / "run" / "pod5"
+    pod5_dir.mkdir(parents=True)
+    (tmp_path / "run" / "sample_sheet.csv").write_text("barcode,alias\nbarcode01,sample\n", encoding="utf-8")
+    run = SequencingRun(pod5_dir)
+    Metadata("project", "library", "1234", 5000, "FLO-PRO114M", sequencing_kit).save(run.metadata_file)
+    DoradoConfig(tmp_path / "dorado", tmp_path / "model", []).save(run.dorado_config_file)
+    for task_id in [1, 2]:
+        run.state.lock_batch(f"batch{task_id}", run.basecalling_batches_dir / f"batch{task_id}", [])
+        run.state.set_batch_job_id(f"batch{task_id}", f"100_{task_id}")
+
+    # Act
+    submit_chained_jobs(run, project_config=create_project_config(tmp_path), options=create_run_options(tmp_path, dry_run=False))
+
+    # Assert
+    assert submissions == expected_submissions
+    assert run.merge_lock_file.exists()
+    assert "batch1/basecalled.bam" in run.merge_script_file.read_text(encoding="utf-8")
+
+
+def test_process_sequencing_run_runs_ready_stages_in_one_tick(monkeypatch, tmp_path):
+    # Mock email
+    monkeypatch.setattr(cleanup, "send_email", lambda recipients, run: None)
+
+    # Arrange: run without barcodes where merging has finished
+    pod5_dir = tmp_path / "pod5"
+    pod5_dir.mkdir()
+    run = SequencingRun(pod5_dir)
+    Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114").save(run.metadata_file)
+    DoradoConfig(tmp_path / "dorado", tmp_path / "model", []).save(run.dorado_config_file)
+    run.merged_bam.parent.mkdir(parents=True)
+    run.merged_bam.write_text("bam", encoding="utf-8")
+    run.merge_done_file.touch()
+
+    # Act
+    options = create_run_options(tmp_path, tombstone_file=tmp_path / "eldorado_tombstones.txt")
+    process_sequencing_run(run=run, project_config=create_project_config(tmp_path), options=options)
+
+    # Assert: demultiplexing and cleanup both ran, and only the results are left in the output directory
+    assert sorted(x.name for x in run.output_dir.iterdir()) == ["basecalling_summary.csv", "dorado_config.json", "library.bam"]
+    assert read_tombstones(tmp_path / "eldorado_tombstones.txt") == {pod5_dir}
+    assert not run.merging_working_dir.exists()
+    assert not run.demux_working_dir.exists()
+
+
+def test_process_sequencing_run_does_not_merge_after_cleanup(monkeypatch, tmp_path):
+    # Mock email
+    monkeypatch.setattr(cleanup, "send_email", lambda recipients, run: None)
+
+    # Arrange: finished run where all pod5 files are basecalled and demultiplexing has finished
+    pod5_dir = tmp_path / "pod5"
+    pod5_dir.mkdir()
+    pod5_file = pod5_dir / "file.pod5"
+    pod5_file.write_text("a", encoding="utf-8")
+    (tmp_path / "final_summary_1234.txt").write_text("pod5_files_in_final_dest=1\n", encoding="utf-8")
+    run = SequencingRun(pod5_dir)
+    run.state.add_transferred_pod5_files([pod5_file])
+    run.state.lock_batch("batch", run.basecalling_batches_dir / "batch", [pod5_file])
+    run.state.mark_batch_done("batch")
+    Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114").save(run.metadata_file)
+    DoradoConfig(tmp_path / "dorado", tmp_path / "model", []).save(run.dorado_config_file)
+    run.merged_bam.parent.mkdir(parents=True)
+    run.merged_bam.write_text("bam", encoding="utf-8")
+    run.merge_done_file.touch()
+    run.demux_working_dir.mkdir(parents=True)
+    (run.demux_working_dir / "library.bam").write_text("bam", encoding="utf-8")
+    run.demux_done_file.touch()
+
+    # Act
+    options = create_run_options(tmp_path, tombstone_file=tmp_path / "eldorado_tombstones.txt")
+    process_sequencing_run(run=run, project_config=create_project_config(tmp_path), options=options)
+    run.invalidate_snapshot()
+
+    # Assert: the run is finalized and no merging job is submitted again
+    assert (run.output_dir / "library.bam").exists()
+    assert not run.merging_working_dir.exists()
+    assert run.is_finalized()
+    assert not merging.merging_is_pending(run)
+
+
+def test_process_sequencing_run_waits_for_job_accounting(monkeypatch, tmp_path):
+    # Mock an empty queue and sacct, where the merging job first finishes and then has run out of memory
+    sacct_outputs = ["102|COMPLETING|40G|4||00:10:00|00:12:00\n", "102|OUT_OF_MEMORY|40G|4||00:10:00|00:12:00\n"]
+
+    def mock_run(args, **kwargs):
+        return subprocess.CompletedProcess(args, 0, stdout=sacct_outputs.pop(0).encode(), stderr=b"")
+
+    monkeypatch.setattr(resource_history.subprocess, "run", mock_run)
+    monkeypatch.setattr(resource_history, "is_in_queue", lambda job_id: False)
+
+    # Arrange: all pod5 files are basecalled and the merging job has left the queue
+    pod5_dir = tmp_path / "pod5"
+    pod5_dir.mkdir()
+    pod5_file = pod5_dir / "file.pod5"
+    pod5_file.write_text("a", encoding="utf-8")
+    (tmp_path / "final_summary_1234.txt").write_text("pod5_files_in_final_dest=1\n", encoding="utf-8")
+    run = SequencingRun(pod5_dir)
+    run.state.add_transferred_pod5_files([pod5_file])
+    run.state.lock_batch("batch", run.basecalling_batches_dir / "batch", [pod5_file])
+    run.state.mark_batch_done("batch")
+    Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114").save(run.metadata_file)
+    DoradoConfig(tmp_path / "dorado", tmp_path / "model", []).save(run.dorado_config_file)
+    run.merge_job_id_file.parent.mkdir(parents=True)
+    run.merge_job_id_file.write_text("102", encoding="utf-8")
+    options = create_run_options(tmp_path, resource_model=ResourceModel(), resource_history_file=tmp_path / "eldorado_resources.csv")
+
+    # Act
+    process_sequencing_run(run=run, project_config=create_project_config(tmp_path), options=options)
+    is_merging_submitted_before_accounting = run.merge_script_file.exists()
+    process_sequencing_run(run=run, project_config=create_project_config(tmp_path), options=options)
+
+    # Assert: merging is retried at the next memory tier once the job is final in the accounting
+    assert not is_merging_submitted_before_accounting
+    assert "#SBATCH --mem               64g" in run.merge_script_file.read_text(encoding="utf-8")
+
+
+def test_process_sequencing_run_exclusively(monkeypatch, tmp_path):
+    # Mock processing
+    processed = []
+    monkeypatch.setattr(main, "process_sequencing_run", lambda run, **kwargs: processed.append(run))
+
+    # Arrange
+    run = SequencingRun(tmp_path / "project" / "sample" / "run" / "pod5")
+
+    # Act
+    project_config = create_project_config(tmp_path)
+    options = create_run_options(tmp_path)
+    with try_lock_file(run.output_dir / "eldorado.lock"):
+        process_sequencing_run_exclusively(run, project_config, options)
+    process_sequencing_run_exclusively(run, project_config, options)
+
+    # Assert
+    assert processed == [run]
+
+
+def test_run_ready_stage_defers_basecalling_to_planner(tmp_path):
+    # Arrange
+    pod5_files = [tmp_path / "pod5" / f"file{i}.pod5" for i in range(3)]
+    for pod5_file in pod5_files:
+        pod5_file.parent.mkdir(parents=True, exist_ok=True)
+        pod5_file.write_text("a")
+    run = SequencingRun(pod5_files[0].parent)
+    run.state.add_transferred_pod5_files(pod5_files)
+    Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114").save(run.metadata_file)
+    DoradoConfig(tmp_path / "dorado", tmp_path / "model", []).save(run.dorado_config_file)
+    gpu_planner = GpuPlanner(max_jobs_per_tick=2)
+
+    # Act
+    options = create_run_options(tmp_path, min_batch_size=0, gpu_planner=gpu_planner)
+    stage, _ = run_ready_stage(run=run, project_config=create_project_config(tmp_path), options=options)
+    planned_pod5_files = run.state.get_pod5_files(TRANSFERRED)
+    submit_planned_batches(gpu_planner, inflight_jobs=0)
+
+    # Assert: nothing is locked until batches are admitted, and only admitted batches are submitted
+    assert stage == "basecalling"
+    assert gpu_planner.has_plan(run)
+    assert planned_pod5_files == pod5_files
+    assert run.state.count_pod5_files(LOCKED) == 2
+    assert run.state.count_pod5_files(TRANSFERRED) == 1
+
+
+def test_run_ready_stage_without_planned_batches(tmp_path):
+    # Arrange: the pod5 files are smaller than the minimum batch size
+    pod5_file = tmp_path / "pod5" / "file.pod5"
+    pod5_file.parent.mkdir(parents=True)
+    pod5_file.write_text("a")
+    run = SequencingRun(pod5_file.parent)
+    run.state.add_transferred_pod5_files([pod5_file])
+    Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114").save(run.metadata_file)
+    DoradoConfig(tmp_path / "dorado", tmp_path / "model", []).save(run.dorado_config_file)
+    gpu_planner = GpuPlanner()
+
+    # Act
+    options = create_run_options(tmp_path, min_batch_size=1024, max_batch_size=2048, gpu_planner=gpu_planner)
+    result = run_ready_stage(run=run, project_config=create_project_config(tmp_path), options=options)
+
+    # Assert: no stage ran, so the scan backs off
+    assert result == (None, False)
+    assert not gpu_planner.has_plan(run)
+
+
+def test_backfill_and_untombstone(tmp_path):
+    # Arrange
+    root_dir = tmp_path / "root"
+    finished_pod5_dir = root_dir / "project" / "sample" / "finished_run" / "pod5"
+    new_pod5_dir = root_dir / "project" / "sample" / "new_run" / "pod5"
+    for pod5_dir in [finished_pod5_dir, new_pod5_dir]:
+        pod5_dir.mkdir(parents=True)
+    (finished_pod5_dir / "file.pod5").write_bytes(b"\x8bPOD\r\n\x1a\n" * 2)
+    (finished_pod5_dir.parent / "bam_eldorado").mkdir()
+    (finished_pod5_dir.parent / "bam_eldorado" / "library.bam").touch()
+    runner = CliRunner()
+
+    # Act: the output is removed before the tombstone, so the run is processed again
+    backfill_result = runner.invoke(app, ["backfill-tombstones", "--root-dir", str(root_dir)])
+    tombstones_after_backfill = read_tombstones(root_dir / "eldorado_tombstones.txt")
+    shutil.rmtree(finished_pod5_dir.parent / "bam_eldorado")
+    untombstone_result = runner.invoke(app, ["untombstone", "--root-dir", str(root_dir), "--pod5-dir", str(finished_pod5_dir)])
+    tombstones = read_tombstones(root_dir / "eldorado_tombstones.txt")
+    runs = find_sequencing_runs_for_processing(root_dir, {"project"}, tombstones)
+
+    # Assert
+    assert backfill_result.exit_code == 0
+    assert untombstone_result.exit_code == 0
+    assert tombstones_after_backfill == {finished_pod5_dir}
+    assert tombstones == set()
+    assert [run.input_pod5_dir for _, run in runs] == [finished_pod5_dir]
+
+
+def get_imported_modules(importtime_output: str) -> dict[str, int]:
+    # Parse output of python -X importtime, e.g. "import time:       240 |      17352 |   numpy.lib"
+    modules = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, module = line.removeprefix("import time:").split("|")
+        modules[module.strip()] = int(cumulative)
+    return modules
+
+
+def test_startup_import_time():
+    # Act
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import eldorado.main"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = get_imported_modules(res.stderr)
+
+    # Assert
+    assert not [x for x in modules if x.split(".")[0] in HEAVY_MODULES]
+    assert modules["eldorado.main"] < 2_000_000  # us, generous bound for loaded machines
+
+
+def test_no_op_tick(tmp_path):
+    # Arrange
+    root_dir = tmp_path / "root"
+    dorado_executable = tmp_path / "bin" / "dorado"
+    dorado_executable.parent.mkdir()
+    dorado_executable.touch()
+
+    # Many projects without any runs
+    project_ids = [f"project_{i}" for i in range(50)]
+    for project_id in project_ids:
+        (root_dir / project_id / "sample" / "run").mkdir(parents=True)
+
+    # One idle run that was processed on an earlier tick
+    pod5_dir = root_dir / project_ids[0] / "sample" / "processed_run" / "pod5"
+    pod5_dir.mkdir(parents=True)
+    (pod5_dir / "file.pod5").write_bytes(b"\x8bPOD\r\n\x1a\n" * 2)
+    run = SequencingRun(pod5_dir)
+    run.output_dir.mkdir()
+    dir_stats = run.get_dir_stats()
+    pod5_file_count = update_transferred_pod5_files(run)
+    update_scan_cursor(run, dir_stats, pod5_file_count, time.time())
+    run.state.close()
+
+    configs_csv = tmp_path / "project_configs.csv"
+    rows = ["project_id,account,dorado_executable,basecalling_model,mod_5mcg_5hmcg,mod_6ma", f"default,account,{dorado_executable},auto,0,0"]
+    rows += [f"{project_id},,,,," for project_id in project_ids]
+    configs_csv.write_text("\n".join(rows) + "\n", encoding="utf-8")
+
+    # Act
+    res = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-m",
+            "eldorado.main",
+            "scheduler",
+            "--root-dir",
+            str(root_dir),
+            "--models-dir",
+            str(tmp_path / "models"),
+            "--project-config",
+            str(configs_csv),
+            "--mail-user",
+            "user@example.com",
+            "--log-file",
+            str(tmp_path / "eldorado.log"),
+            "--workers",
+            "4",
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+    # Assert
+    assert res.returncode == 0, res.stderr
+    modules = get_imported_modules(res.stderr)
+    assert not [x for x in modules if x.split(".")[0] in HEAVY_MODULES]
+    assert "Processing" not in (tmp_path / "eldorado.log").read_text(encoding="utf-8")
@@ -1,7 +1,9 @@
 import pytest
 
-from eldorado.merging import all_pod5_files_are_basecalled, get_done_batch_dirs
+from eldorado.configuration import Metadata
+from eldorado.merging import all_pod5_files_are_basecalled, get_done_batch_dirs, submit_merging_to_slurm
 from eldorado.pod5_handling import SequencingRun
+from eldorado.resources import SlurmResources
 
 
 @pytest.mark.parametrize(
@@ -74,6 +76,7 @@ def test_all_existing_pod5_files_basecalled(
 
     # Act
     pod5_dir = SequencingRun(pod5_dir)
+    pod5_dir.reindex_state()
     result = all_pod5_files_are_basecalled(pod5_dir=pod5_dir)
 
     # Assert
@@ -150,7 +153,27 @@ def test_get_done_batch_dirs(
         file.touch()
 
     # Act
-    result = get_done_batch_dirs(SequencingRun(pod5_dir))
+    run = SequencingRun(pod5_dir)
+    run.reindex_state()
+    result = get_done_batch_dirs(run)
 
     # Assert
     assert result == expected
+
+
+def test_submit_merging_to_slurm_uses_resource_profile(tmp_path):
+    # Arrange
+    run = SequencingRun(tmp_path / "sample" / "pod5")
+    Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114").save(run.metadata_file)
+    resources = SlurmResources(cpus=8, mem_gb=64, walltime="1-00:00:00", partition="bigmem")
+
+    # Act
+    submit_merging_to_slurm(run, mail_user=["user@example.com"], slurm_account="account", dry_run=True, resources=resources)
+
+    # Assert
+    script = run.merge_script_file.read_text(encoding="utf-8")
+    assert "#SBATCH --time              1-00:00:00" in script
+    assert "#SBATCH --cpus-per-task     8" in script
+    assert "#SBATCH --mem               64g" in script
+    assert "#SBATCH --partition         bigmem" in script
+    assert "--threads 8" in script
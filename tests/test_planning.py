@@ -0,0 +1,190 @@
+from pathlib import Path
+
+import pytest
+
+from eldorado.basecalling import PlannedBatch
+from eldorado.configuration import ProjectConfig
+from eldorado.planning import GpuPlanner, ProjectUsage, RunPlan, get_inflight_usage
+from eldorado.pod5_handling import SequencingRun
+
+
+def create_project_config(project_id: str, priority: int = 0, **kwargs) -> ProjectConfig:
+    return ProjectConfig(
+        project_id=project_id,
+        account="account",
+        dorado_executable=Path("dorado"),
+        basecalling_model=None,
+        mod_5mcg_5hmcg=False,
+        mod_6ma=False,
+        priority=priority,
+        **kwargs,
+    )
+
+
+def create_plan(tmp_path, name: str, project_id: str, sequencing_done: bool, added_at: list[float], pod5_bytes: int = 1) -> RunPlan:
+    batches = [PlannedBatch([], cost=1, pod5_bytes=pod5_bytes, walltime="1:00:00", oldest_added_at=x) for x in added_at]
+    return RunPlan(
+        run=SequencingRun(tmp_path / name / "pod5"),
+        project_id=project_id,
+        sequencing_done=sequencing_done,
+        batches=batches,
+        submit=lambda planned_batches: None,
+    )
+
+
+def get_admitted(admitted: list[tuple[RunPlan, list[PlannedBatch]]]) -> list[tuple[str, float]]:
+    return [(plan.run.input_pod5_dir.parent.name, batch.oldest_added_at) for plan, batches in admitted for batch in batches]
+
+
+def test_rank(tmp_path):
+    # Arrange
+    planner = GpuPlanner(
+        project_configs_by_id={
+            "low": create_project_config("low"),
+            "high": create_project_config("high", priority=10),
+        }
+    )
+    planner.add_plan(create_plan(tmp_path, "sequencing", "low", False, [1.0]))
+    planner.add_plan(create_plan(tmp_path, "done", "low", True, [3.0, 2.0]))
+    planner.add_plan(create_plan(tmp_path, "urgent", "high", False, [4.0]))
+
+    # Act
+    ranked = [(plan.run.input_pod5_dir.parent.name, batch.oldest_added_at) for plan, batch in planner.rank()]
+
+    # Assert
+    assert ranked == [("urgent", 4.0), ("done", 2.0), ("done", 3.0), ("sequencing", 1.0)]
+
+
+@pytest.mark.parametrize(
+    "max_jobs_per_tick, max_inflight_jobs, inflight_jobs, quota, expected",
+    [
+        pytest.param(
+            None,
+            None,
+            0,
+            None,
+            [("a", 1.0), ("a", 2.0), ("b", 3.0)],
+            id="No limits",
+        ),
+        pytest.param(
+            2,
+            None,
+            0,
+            None,
+            [("a", 1.0), ("a", 2.0)],
+            id="Per tick limit",
+        ),
+        pytest.param(
+            None,
+            4,
+            3,
+            None,
+            [("a", 1.0)],
+            id="In flight limit",
+        ),
+        pytest.param(
+            None,
+            2,
+            5,
+            None,
+            [],
+            id="Queue is full",
+        ),
+        pytest.param(
+            None,
+            None,
+            0,
+            1,
+            [("a", 1.0), ("b", 3.0)],
+            id="Project quota skips to the next project",
+        ),
+    ],
+)
+def test_admit(tmp_path, max_jobs_per_tick, max_inflight_jobs, inflight_jobs, quota, expected):
+    # Arrange
+    planner = GpuPlanner(
+        project_configs_by_id={
+            "a": create_project_config("a", max_gpu_jobs_per_tick=quota),
+            "b": create_project_config("b"),
+        },
+        max_jobs_per_tick=max_jobs_per_tick,
+        max_inflight_jobs=max_inflight_jobs,
+    )
+    planner.add_plan(create_plan(tmp_path, "a", "a", True, [1.0, 2.0]))
+    planner.add_plan(create_plan(tmp_path, "b", "b", True, [3.0]))
+
+    # Act
+    admitted = planner.admit(inflight_jobs)
+
+    # Assert
+    assert get_admitted(admitted) == expected
+
+
+def test_has_plan(tmp_path):
+    # Arrange
+    planner = GpuPlanner()
+    plan = create_plan(tmp_path, "a", "a", True, [1.0])
+    planner.add_plan(plan)
+
+    # Assert
+    assert planner.has_plan(plan.run)
+    assert not planner.has_plan(SequencingRun(tmp_path / "a" / "pod5"))
+
+
+def test_get_inflight_usage():
+    # Arrange
+    comments = ["project=a;pod5_bytes=10", "project=a;pod5_bytes=20", "project=b;pod5_bytes=5", "other"]
+
+    # Act
+    usage = get_inflight_usage(comments)
+
+    # Assert
+    assert usage == {"a": ProjectUsage(jobs=2, pod5_bytes=30), "b": ProjectUsage(jobs=1, pod5_bytes=5)}
+
+
+@pytest.mark.parametrize(
+    "project_caps, inflight_by_project, expected",
+    [
+        pytest.param(
+            {"max_inflight_gpu_jobs": 3},
+            {"a": ProjectUsage(jobs=1, pod5_bytes=100)},
+            [("a", 1.0), ("a", 2.0), ("b", 3.0)],
+            id="Below job cap",
+        ),
+        pytest.param(
+            {"max_inflight_gpu_jobs": 2},
+            {"a": ProjectUsage(jobs=1, pod5_bytes=100)},
+            [("a", 1.0), ("b", 3.0)],
+            id="Job cap reached",
+        ),
+        pytest.param(
+            {"max_inflight_bytes": 250},
+            {"a": ProjectUsage(jobs=1, pod5_bytes=100)},
+            [("a", 1.0), ("b", 3.0)],
+            id="Byte cap reached",
+        ),
+        pytest.param(
+            {"max_inflight_bytes": 50},
+            {},
+            [("a", 1.0), ("b", 3.0)],
+            id="Batch larger than byte cap is admitted when nothing is in flight",
+        ),
+    ],
+)
+def test_admit_with_inflight_caps(tmp_path, project_caps, inflight_by_project, expected):
+    # Arrange
+    planner = GpuPlanner(
+        project_configs_by_id={
+            "a": create_project_config("a", **project_caps),
+            "b": create_project_config("b"),
+        },
+    )
+    planner.add_plan(create_plan(tmp_path, "a", "a", True, [1.0, 2.0], pod5_bytes=100))
+    planner.add_plan(create_plan(tmp_path, "b", "b", True, [3.0], pod5_bytes=100))
+
+    # Act
+    admitted = planner.admit(inflight_by_project=inflight_by_project)
+
+    # Assert
+    assert planner.has_inflight_caps()
+    assert get_admitted(admitted) == expected
@@ -1,10 +1,33 @@
+import os
+import time
 from pathlib import Path
 from typing import List
 
 import pytest
 
-from eldorado.pod5_handling import SequencingRun, contains_pod5_files, get_pod5_dirs_from_pattern, needs_basecalling, update_transferred_pod5_files
-from tests.conftest import create_files
+import eldorado.pod5_handling as pod5_handling
+from eldorado.configuration import Metadata, read_metadata
+from eldorado.constants import METADATA_SAMPLE_SIZE, SCAN_BACKOFF_BASE_SECONDS
+from eldorado.pod5_handling import (
+    SequencingRun,
+    can_skip_scan,
+    contains_pod5_files,
+    discover_pod5_dirs,
+    filter_complete_pod5_files,
+    get_pod5_dirs_from_pattern,
+    get_shared_metadata,
+    get_signal_samples,
+    needs_basecalling,
+    read_metadata_from_footers,
+    read_num_samples,
+    read_pod5_metadata,
+    sample_pod5_files,
+    take_run_snapshot,
+    update_scan_cursor,
+    update_transferred_pod5_files,
+)
+from eldorado.utils import probe_pod5_files
+from tests.conftest import create_files, create_pod5_file
 
 
 @pytest.mark.parametrize(
@@ -93,10 +116,11 @@ def test_update_transferred_pod5_files(tmp_path, input_pod5_files, transferred_p
 
     # Act
     run = SequencingRun(pod5_dir)
+    run.reindex_state()
     update_transferred_pod5_files(run)
 
     # Assert
-    result = {f.name for f in transferred_pod5_dir.glob("*")}
+    result = {f.name for f in run.get_transferred_pod5_files()}
     assert result == set(transferred_pod5_files_after_update)
 
 
@@ -174,7 +198,9 @@ def test_all_pod5_files_transfered(
         pod5_file.touch()
 
     # Act
-    result = SequencingRun(pod5_dir_path).all_pod5_files_are_transferred()
+    run = SequencingRun(pod5_dir_path)
+    run.reindex_state()
+    result = run.all_pod5_files_are_transferred()
 
     # Assert
     assert result == expected
@@ -261,6 +287,83 @@ def test_get_pod5_dirs_from_pattern(tmp_path, pattern, dirs, expected):
     assert set(result) == set(expected)
 
 
+@pytest.mark.parametrize(
+    "dirs, files, expected",
+    [
+        pytest.param(
+            ["project/sample/run/pod5"],
+            [],
+            [("project", "project/sample/run/pod5")],
+            id="Single run",
+        ),
+        pytest.param(
+            ["project/sample/run/pod5_pass", "project/sample/run/pod5_fail", "other_project/sample/run/pod5"],
+            [],
+            [("project", "project/sample/run/pod5_fail"), ("project", "project/sample/run/pod5_pass")],
+            id="Only configured projects",
+        ),
+        pytest.param(
+            ["project/sample/run/other_dir", "project/sample/pod5"],
+            ["project/sample/run/pod5_report.txt"],
+            [],
+            id="Files and dirs at other levels are ignored",
+        ),
+    ],
+)
+def test_discover_pod5_dirs(tmp_path, dirs, files, expected):
+    # Arrange
+    root_dir = tmp_path / "root"
+    for dd in dirs:
+        (root_dir / dd).mkdir(parents=True)
+    create_files([root_dir / x for x in files])
+
+    # Act
+    result = [(project_id, pod5_dir) for project_id, pod5_dir, _ in discover_pod5_dirs(root_dir, {"project"})]
+
+    # Assert
+    assert result == [(project_id, root_dir / x) for project_id, x in expected]
+
+
+def test_discover_pod5_dirs_drops_tombstoned_runs(tmp_path):
+    # Arrange
+    root_dir = tmp_path / "root"
+    for run_id in ["finished_run", "new_run"]:
+        (root_dir / "project" / "sample" / run_id / "pod5").mkdir(parents=True)
+    tombstones = {root_dir / "project" / "sample" / "finished_run" / "pod5"}
+
+    # Act
+    result = [pod5_dir for _, pod5_dir, _ in discover_pod5_dirs(root_dir, None, tombstones)]
+
+    # Assert
+    assert result == [root_dir / "project" / "sample" / "new_run" / "pod5"]
+
+
+def test_discover_pod5_dirs_lists_each_dir_once(monkeypatch, tmp_path):
+    # Arrange
+    root_dir = tmp_path / "root"
+    project_ids = [f"project_{i}" for i in range(10)]
+    for project_id in project_ids:
+        (root_dir / project_id / "sample" / "run" / "pod5").mkdir(parents=True)
+
+    # Count directory listings
+    listed_dirs = []
+    scandir = os.scandir
+
+    def mock_scandir(path):
+        listed_dirs.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", mock_scandir)
+
+    # Act
+    result = list(discover_pod5_dirs(root_dir, set(project_ids)))
+
+    # Assert: root, then project, sample and run dir of each project
+    assert len(result) == 10
+    assert len(listed_dirs) == 1 + 3 * 10
+    assert len(set(listed_dirs)) == len(listed_dirs)
+
+
 @pytest.mark.parametrize(
     "input_files, write_pod5_bytes, expected",
     [
@@ -421,8 +524,10 @@ def test_needs_basecalling(tmp_path, pod5_files, other_files, expected):
     # Act
     pod5_dir = pod5_files[0].parent
     result = needs_basecalling(pod5_dir)
+    result_with_listing = needs_basecalling(pod5_dir, {x.name for x in pod5_dir.parent.iterdir()})
 
     assert result == expected
+    assert result_with_listing == expected
 
 
 @pytest.mark.parametrize(
@@ -487,6 +592,7 @@ def test_get_unbasecalled_pod5_files(tmp_path, pod5_files, lock_files, done_file
 
     create_files(lock_files)
     create_files(done_files)
+    run.reindex_state()
 
     # Act
     unbasecalled_files = run.get_unbasecalled_pod5_files()
@@ -494,3 +600,502 @@ def test_get_unbasecalled_pod5_files(tmp_path, pod5_files, lock_files, done_file
 
     # Assert
     assert set(unbasecalled_files) == set(expected)
+
+
+@pytest.mark.parametrize(
+    "marker_files, has_run_state, expected",
+    [
+        pytest.param(["lock_files/file.pod5.lock"], False, True, id="Legacy lock files"),
+        pytest.param(["transferred_pod5_files/file.pod5"], False, True, id="Legacy transferred files"),
+        pytest.param(["lock_files/file.pod5.lock"], True, False, id="Run state exists"),
+        pytest.param([], False, False, id="New run"),
+    ],
+)
+def test_has_legacy_markers(tmp_path, marker_files, has_run_state, expected):
+    # Arrange
+    pod5_dir = tmp_path / "pod5"
+    pod5_dir.mkdir()
+    run = SequencingRun(pod5_dir)
+    create_files([run.basecalling_working_dir / x for x in marker_files])
+    if has_run_state:
+        run.state.add_transferred_pod5_files([])
+
+    # Act
+    result = run.has_legacy_markers()
+
+    # Assert
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    "new_files, in_flight, seconds_passed, expected",
+    [
+        pytest.param([], False, 0, True, id="Unchanged and idle"),
+        pytest.param(["pod5/new.pod5"], False, 0, False, id="New pod5 file"),
+        pytest.param(["final_summary.txt"], False, 0, False, id="New file in run dir"),
+        pytest.param([], True, 0, False, id="Jobs in flight"),
+        pytest.param([], False, SCAN_BACKOFF_BASE_SECONDS, False, id="Backoff expired"),
+    ],
+)
+def test_can_skip_scan(tmp_path, new_files, in_flight, seconds_passed, expected):
+    # Arrange
+    pod5_dir = tmp_path / "pod5"
+    pod5_dir.mkdir()
+    (pod5_dir / "file.pod5").write_bytes(b"\x8bPOD\r\n\x1a\n")
+
+    run = SequencingRun(pod5_dir)
+    run.output_dir.mkdir()
+    if in_flight:
+        create_files([run.merge_lock_file])
+
+    dir_stats = run.get_dir_stats()
+    pod5_file_count = update_transferred_pod5_files(run)
+    update_scan_cursor(run, dir_stats, pod5_file_count, now=0)
+
+    create_files([tmp_path / x for x in new_files])
+
+    # Act
+    result = can_skip_scan(SequencingRun(pod5_dir), now=seconds_passed)
+
+    # Assert
+    assert result == expected
+
+
+def test_can_skip_scan_with_incomplete_pod5_file(tmp_path):
+    # Arrange
+    pod5_dir = tmp_path / "pod5"
+    pod5_dir.mkdir()
+    (pod5_dir / "file.pod5").write_bytes(b"\x8bPOD\r\n\x1a")
+
+    run = SequencingRun(pod5_dir)
+    dir_stats = run.get_dir_stats()
+    pod5_file_count = update_transferred_pod5_files(run)
+    update_scan_cursor(run, dir_stats, pod5_file_count, now=0)
+
+    # Act
+    result = can_skip_scan(run, now=0)
+
+    # Assert
+    assert not result
+
+
+def test_update_scan_cursor_backoff(tmp_path):
+    # Arrange
+    pod5_dir = tmp_path / "pod5"
+    pod5_dir.mkdir()
+    run = SequencingRun(pod5_dir)
+    dir_stats = run.get_dir_stats()
+
+    # Act
+    next_checks = []
+    for _ in range(3):
+        update_scan_cursor(run, dir_stats, 0, now=0)
+        next_checks.append(run.state.get_scan_cursor().next_check)
+
+    # Assert
+    assert next_checks == [SCAN_BACKOFF_BASE_SECONDS, 2 * SCAN_BACKOFF_BASE_SECONDS, 4 * SCAN_BACKOFF_BASE_SECONDS]
+
+
+@pytest.mark.parametrize(
+    "recheck_by, expected",
+    [
+        pytest.param(None, SCAN_BACKOFF_BASE_SECONDS, id="Backoff"),
+        pytest.param(60, 60, id="Deadline before backoff"),
+        pytest.param(10 * SCAN_BACKOFF_BASE_SECONDS, SCAN_BACKOFF_BASE_SECONDS, id="Deadline after backoff"),
+    ],
+)
+def test_update_scan_cursor_recheck_by(tmp_path, recheck_by, expected):
+    # Arrange
+    pod5_dir = tmp_path / "pod5"
+    pod5_dir.mkdir()
+    run = SequencingRun(pod5_dir)
+
+    # Act
+    update_scan_cursor(run, run.get_dir_stats(), 0, now=0, recheck_by=recheck_by)
+
+    # Assert
+    assert run.state.get_scan_cursor().next_check == expected
+
+
+@pytest.mark.parametrize(
+    "took_action",
+    [
+        pytest.param(False, id="Jobs finished"),
+        pytest.param(True, id="Stage action after jobs finished"),
+    ],
+)
+def test_update_scan_cursor_after_jobs_in_flight(tmp_path, took_action):
+    # Arrange
+    pod5_dir = tmp_path / "pod5"
+    pod5_dir.mkdir()
+    run = SequencingRun(pod5_dir)
+    run.output_dir.mkdir()
+    dir_stats = run.get_dir_stats()
+
+    # Many ticks while merging is running
+    create_files([run.merge_lock_file])
+    for _ in range(8):
+        update_scan_cursor(run, dir_stats, 0, now=0)
+    run.merge_lock_file.unlink()
+
+    # Act
+    update_scan_cursor(run, dir_stats, 0, now=0, took_action=took_action)
+
+    # Assert
+    cursor = run.state.get_scan_cursor()
+    assert cursor.idle
+    assert cursor.next_check == SCAN_BACKOFF_BASE_SECONDS
+    assert not can_skip_scan(run, now=SCAN_BACKOFF_BASE_SECONDS)
+
+
+def test_update_scan_cursor_resets_after_stage_action(tmp_path):
+    # Arrange
+    pod5_dir = tmp_path / "pod5"
+    pod5_dir.mkdir()
+    run = SequencingRun(pod5_dir)
+    dir_stats = run.get_dir_stats()
+    for _ in range(3):
+        update_scan_cursor(run, dir_stats, 0, now=0)
+
+    # Act
+    update_scan_cursor(run, dir_stats, 0, now=0, took_action=True)
+
+    # Assert
+    assert run.state.get_scan_cursor().next_check == SCAN_BACKOFF_BASE_SECONDS
+
+
+@pytest.mark.parametrize(
+    "contents, expected_probes, expected_complete",
+    [
+        pytest.param(
+            [b"\x8bPOD\r\n\x1a\n", b"\x8bPOD\r\n\x1a\n"],
+            1,
+            True,
+            id="Complete file is only probed once",
+        ),
+        pytest.param(
+            [b"\x8bPOD\r\n\x1a", b"\x8bPOD\r\n\x1a"],
+            1,
+            False,
+            id="Unchanged incomplete file is only probed once",
+        ),
+        pytest.param(
+            [b"\x8bPOD\r\n\x1a", b"\x8bPOD\r\n\x1a\n"],
+            1,
+            False,
+            id="Growing file is not probed",
+        ),
+        pytest.param(
+            [b"\x8bPOD\r\n\x1a", b"\x8bPOD\r\n\x1a\n", b"\x8bPOD\r\n\x1a\n"],
+            2,
+            True,
+            id="File is probed after it stopped growing",
+        ),
+    ],
+)
+def test_filter_complete_pod5_files(monkeypatch, tmp_path, contents, expected_probes, expected_complete):
+    # Count probes
+    probes = []
+
+    def mock_probe_pod5_files(paths):
+        probes.extend(paths)
+        return probe_pod5_files(paths)
+
+    monkeypatch.setattr(pod5_handling, "probe_pod5_files", mock_probe_pod5_files)
+
+    # Arrange
+    pod5_file = tmp_path / "pod5" / "file.pod5"
+    pod5_file.parent.mkdir()
+    run = SequencingRun(pod5_file.parent)
+
+    # Act
+    result = []
+    for i, content in enumerate(contents):
+        # Only write when content changes, to keep mtime of unchanged files
+        if i == 0 or content != contents[i - 1]:
+            pod5_file.write_bytes(content)
+        result = filter_complete_pod5_files(run, [pod5_file])
+
+    # Assert
+    assert len(probes) == expected_probes
+    assert (result == [pod5_file]) == expected_complete
+
+
+def test_take_run_snapshot(tmp_path):
+    # Arrange
+    pod5_dir = tmp_path / "pod5"
+    pod5_files = [pod5_dir / f"file{i}.pod5" for i in range(3)]
+    create_files(pod5_files)
+    (tmp_path / "final_summary_1234.txt").write_text("pod5_files_in_final_dest=3", encoding="utf-8")
+    create_files([tmp_path / "sample_sheet_1234.csv"])
+
+    run = SequencingRun(pod5_dir)
+    run.state.add_transferred_pod5_files(pod5_files)
+    run.state.lock_batch("locked", tmp_path / "locked", pod5_files[:1])
+    run.state.lock_batch("done", tmp_path / "done", pod5_files[1:2])
+    run.state.mark_batch_done("done")
+    create_files([run.merge_lock_file])
+
+    # Act
+    snapshot = take_run_snapshot(run)
+
+    # Assert
+    assert snapshot.transferred == {"file0.pod5", "file1.pod5", "file2.pod5"}
+    assert snapshot.locked == {"file0.pod5"}
+    assert snapshot.done == {"file1.pod5"}
+    assert snapshot.unbasecalled == {"file2.pod5"}
+    assert snapshot.merging_dir_files == {"merge.lock"}
+    assert snapshot.final_summary == tmp_path / "final_summary_1234.txt"
+    assert snapshot.final_summary_text == "pod5_files_in_final_dest=3"
+    assert snapshot.sample_sheet == tmp_path / "sample_sheet_1234.csv"
+
+
+def test_take_run_snapshot_of_unprocessed_run(tmp_path):
+    # Arrange
+    pod5_dir = tmp_path / "pod5"
+    create_files([pod5_dir / "file.pod5"])
+    run = SequencingRun(pod5_dir)
+
+    # Act
+    snapshot = take_run_snapshot(run)
+
+    # Assert
+    assert snapshot.transferred == set()
+    assert snapshot.final_summary is None
+    assert not run.output_dir.exists()
+
+
+@pytest.mark.parametrize(
+    "saved_protocol_run_id, final_summary_text, expected_reads",
+    [
+        pytest.param(None, None, 1, id="No saved metadata"),
+        pytest.param("1234", None, 0, id="Saved metadata without final summary"),
+        pytest.param("1234", "protocol_run_id=1234\n", 0, id="Saved metadata matches final summary"),
+        pytest.param("1234", "protocol_run_id=5678\n", 1, id="Saved metadata does not match final summary"),
+    ],
+)
+def test_metadata_is_persisted(monkeypatch, tmp_path, saved_protocol_run_id, final_summary_text, expected_reads):
+    # Count pod5 reads
+    reads = []
+
+    def mock_get_shared_metadata(pod5_files):
+        reads.append(pod5_files)
+        return Metadata("project", "library", "5678", 5000, "FLO-PRO114M", "SQK-LSK114")
+
+    monkeypatch.setattr(pod5_handling, "get_shared_metadata", mock_get_shared_metadata)
+
+    # Arrange
+    pod5_file = tmp_path / "pod5" / "file.pod5"
+    create_files([pod5_file])
+    run = SequencingRun(pod5_file.parent)
+    run.state.add_transferred_pod5_files([pod5_file])
+
+    if saved_protocol_run_id is not None:
+        Metadata("project", "library", saved_protocol_run_id, 5000, "FLO-PRO114M", "SQK-LSK114").save(run.metadata_file)
+    if final_summary_text is not None:
+        (tmp_path / "final_summary.txt").write_text(final_summary_text, encoding="utf-8")
+
+    # Act
+    metadata = SequencingRun(pod5_file.parent).metadata
+
+    # Assert
+    assert len(reads) == expected_reads
+    assert Metadata.load(run.metadata_file) == metadata
+
+
+def test_metadata_mismatch_is_checked_once(monkeypatch, tmp_path):
+    # Count pod5 reads
+    reads = []
+
+    def mock_get_shared_metadata(pod5_files):
+        reads.append(pod5_files)
+        return Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114")
+
+    monkeypatch.setattr(pod5_handling, "get_shared_metadata", mock_get_shared_metadata)
+
+    # Arrange
+    pod5_file = tmp_path / "pod5" / "file.pod5"
+    create_files([pod5_file])
+    run = SequencingRun(pod5_file.parent)
+    run.state.add_transferred_pod5_files([pod5_file])
+    run.output_dir.mkdir(exist_ok=True)
+
+    # Final summary of another protocol run, written after the metadata
+    Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114").save(run.metadata_file)
+    final_summary = tmp_path / "final_summary.txt"
+    final_summary.write_text("protocol_run_id=5678\n", encoding="utf-8")
+    now = time.time()
+    os.utime(run.metadata_file, (now - 10, now - 10))
+    os.utime(final_summary, (now - 5, now - 5))
+
+    # Act
+    for _ in range(3):
+        SequencingRun(pod5_file.parent).metadata
+
+    # Assert
+    assert len(reads) == 1
+
+
+@pytest.mark.parametrize(
+    "n_reads",
+    [
+        pytest.param(1, id="Single read"),
+        pytest.param(100, id="Multiple reads"),
+    ],
+)
+def test_read_metadata_from_footers(tmp_path, n_reads):
+    # Arrange
+    pod5_file = tmp_path / "file.pod5"
+    create_pod5_file(pod5_file, protocol_run_id="abcd", sample_rate=4000, n_reads=n_reads)
+
+    # Act
+    result = read_metadata_from_footers([pod5_file])
+
+    # Assert
+    assert result == {pod5_file: read_metadata(pod5_file)}
+    assert result[pod5_file].protocol_run_id == "abcd"
+    assert result[pod5_file].sample_rate == 4000
+
+
+@pytest.mark.parametrize(
+    "n_signatures",
+    [
+        pytest.param(1, id="Shorter than footer tail"),
+        pytest.param(3, id="Shorter than footer tail with two signatures"),
+        pytest.param(8, id="Invalid footer"),
+    ],
+)
+def test_read_metadata_from_footers_invalid_file(tmp_path, n_signatures):
+    # Arrange
+    pod5_file = tmp_path / "file.pod5"
+    pod5_file.write_bytes(b"\x8bPOD\r\n\x1a\n" * n_signatures)
+
+    # Act / Assert
+    with pytest.raises(ValueError):
+        read_metadata_from_footers([pod5_file])
+
+
+@pytest.mark.parametrize(
+    "run_infos, is_valid",
+    [
+        pytest.param([("1234", 5000)], True, id="Single file"),
+        pytest.param([("1234", 5000), ("1234", 5000)], True, id="Shared run info"),
+        pytest.param([("1234", 5000), ("5678", 5000)], False, id="Different protocol run IDs"),
+        pytest.param([("1234", 5000), ("1234", 4000)], False, id="Different sample rates"),
+    ],
+)
+def test_get_shared_metadata(tmp_path, run_infos, is_valid):
+    # Arrange
+    pod5_files = []
+    for i, (protocol_run_id, sample_rate) in enumerate(run_infos):
+        pod5_file = tmp_path / f"file{i}.pod5"
+        create_pod5_file(pod5_file, protocol_run_id=protocol_run_id, sample_rate=sample_rate)
+        pod5_files.append(pod5_file)
+
+    # Act / Assert
+    if is_valid:
+        assert get_shared_metadata(pod5_files).protocol_run_id == run_infos[0][0]
+    else:
+        with pytest.raises(ValueError):
+            get_shared_metadata(pod5_files)
+
+
+def test_read_pod5_metadata_falls_back_to_pod5_reader(monkeypatch, tmp_path):
+    # Arrange
+    pod5_file = tmp_path / "file.pod5"
+    create_pod5_file(pod5_file, protocol_run_id="abcd", sample_rate=4000)
+
+    def mock_read_metadata_from_footer(pod5_file):
+        raise ValueError("Unsupported footer")
+
+    monkeypatch.setattr(pod5_handling, "read_metadata_from_footer", mock_read_metadata_from_footer)
+
+    # Act
+    result = read_pod5_metadata(pod5_file)
+
+    # Assert
+    assert result == read_metadata(pod5_file)
+
+
+@pytest.mark.parametrize(
+    "n_files, sample_size, expected",
+    [
+        pytest.param(3, 8, [0, 1, 2], id="Fewer files than sample size"),
+        pytest.param(10, 4, [0, 3, 6, 9], id="Evenly spaced"),
+        pytest.param(10_000, 2, [0, 9999], id="First and last"),
+    ],
+)
+def test_sample_pod5_files(n_files, sample_size, expected):
+    # Arrange
+    pod5_files = [Path(f"file{i}.pod5") for i in range(n_files)]
+
+    # Act
+    result = sample_pod5_files(pod5_files, sample_size)
+
+    # Assert
+    assert result == [pod5_files[i] for i in expected]
+
+
+def test_get_shared_metadata_reads_sample(monkeypatch):
+    # Count pod5 reads
+    reads = []
+
+    def mock_read_pod5_metadata(pod5_file):
+        reads.append(pod5_file)
+        return Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114")
+
+    monkeypatch.setattr(pod5_handling, "read_pod5_metadata", mock_read_pod5_metadata)
+
+    # Act
+    get_shared_metadata([Path(f"file{i}.pod5") for i in range(10_000)])
+
+    # Assert
+    assert len(reads) == METADATA_SAMPLE_SIZE
+
+
+@pytest.mark.parametrize(
+    "n_reads, n_samples",
+    [
+        pytest.param(1, 100, id="Single read"),
+        pytest.param(50, 4000, id="Multiple reads"),
+    ],
+)
+def test_read_num_samples(tmp_path, n_reads, n_samples):
+    # Arrange
+    pod5_file = tmp_path / "file.pod5"
+    create_pod5_file(pod5_file, n_reads=n_reads, n_samples=n_samples)
+
+    # Act
+    result = read_num_samples(pod5_file)
+
+    # Assert
+    assert result == n_reads * n_samples
+
+
+def test_get_signal_samples_is_cached(monkeypatch, tmp_path):
+    # Arrange
+    pod5_dir = tmp_path / "pod5"
+    pod5_files = [pod5_dir / f"file{i}.pod5" for i in range(3)]
+    for i, pod5_file in enumerate(pod5_files):
+        create_pod5_file(pod5_file, n_reads=i + 1, n_samples=100)
+    pod5_files.append(pod5_dir / "invalid.pod5")
+    pod5_files[-1].write_bytes(b"\x8bPOD\r\n\x1a\n" * 8)
+    run = SequencingRun(pod5_dir)
+
+    reads = []
+
+    def mock_read_num_samples(pod5_file):
+        reads.append(pod5_file.name)
+        return read_num_samples(pod5_file)
+
+    monkeypatch.setattr(pod5_handling, "read_num_samples", mock_read_num_samples)
+
+    # Act
+    first_result = get_signal_samples(run, pod5_files)
+    second_result = get_signal_samples(run, pod5_files)
+
+    # Assert
+    expected = {"file0.pod5": 100, "file1.pod5": 200, "file2.pod5": 300, "invalid.pod5": None}
+    assert first_result == expected
+    assert second_result == expected
+    assert sorted(reads) == ["file0.pod5", "file1.pod5", "file2.pod5", "invalid.pod5", "invalid.pod5"]
@@ -0,0 +1,228 @@
+import subprocess
+
+import pytest
+
+import eldorado.resource_history as resource_history
+from eldorado.configuration import Metadata
+from eldorado.pod5_handling import SequencingRun
+from eldorado.resource_history import (
+    ResourceModel,
+    ResourceRecord,
+    SacctJob,
+    collect_job_resources,
+    load_resource_model,
+    parse_memory_mb,
+    parse_sacct_duration,
+    parse_sacct_output,
+    right_size_resource_profiles,
+)
+from eldorado.resources import SlurmResources
+
+# Recorded with: sacct --noheader --parsable2 --jobs 101,102,103 --format JobID,State,ReqMem,AllocCPUS,MaxRSS,TotalCPU,Elapsed
+SACCT_OUTPUT = """\
+101|COMPLETED|32G|4||02:00:00|01:00:00
+101.batch|COMPLETED||4|6291456K|02:00:00|01:00:00
+101.extern|COMPLETED||4|1024K|00:00.001|01:00:00
+102|OUT_OF_MEMORY|4000Mc|4||10:30.500|00:12:00
+102.batch|OUT_OF_MEMORY||4|16000M|10:30.500|00:12:00
+103|RUNNING|128G|16||00:00:00|00:05:00
+"""
+
+MERGING = SlurmResources(cpus=4, mem_gb=32, walltime="12:00:00")
+
+
+def create_record(
+    job_id: str,
+    input_bytes: int,
+    max_rss_mb: int,
+    state: str = "COMPLETED",
+    cpu_hours: int = 2,
+    req_mem_mb: int = 32 * 1024,
+) -> ResourceRecord:
+    return ResourceRecord(
+        job_id=job_id,
+        stage="merging",
+        input_bytes=input_bytes,
+        state=state,
+        req_mem_mb=req_mem_mb,
+        max_rss_mb=max_rss_mb,
+        alloc_cpus=4,
+        total_cpu_seconds=cpu_hours * 3600,
+        elapsed_seconds=3600,
+    )
+
+
+@pytest.mark.parametrize(
+    "memory, alloc_cpus, expected",
+    [
+        pytest.param("32G", 1, 32 * 1024, id="Gigabytes"),
+        pytest.param("32Gn", 4, 32 * 1024, id="Per node"),
+        pytest.param("4000Mc", 4, 16000, id="Per CPU"),
+        pytest.param("6291456K", 1, 6144, id="Kilobytes"),
+        pytest.param("0", 1, 0, id="Zero"),
+        pytest.param("", 1, 0, id="Empty"),
+    ],
+)
+def test_parse_memory_mb(memory, alloc_cpus, expected):
+    assert parse_memory_mb(memory, alloc_cpus) == expected
+
+
+@pytest.mark.parametrize(
+    "duration, expected",
+    [
+        pytest.param("01:00:00", 3600, id="Hours"),
+        pytest.param("1-02:00:00", 26 * 3600, id="Days"),
+        pytest.param("10:30.500", 630, id="Minutes with milliseconds"),
+    ],
+)
+def test_parse_sacct_duration(duration, expected):
+    assert parse_sacct_duration(duration) == expected
+
+
+def test_parse_sacct_output():
+    # Act
+    jobs = parse_sacct_output(SACCT_OUTPUT)
+
+    # Assert: the peak memory is taken from the steps
+    assert jobs == {
+        "101": SacctJob(state="COMPLETED", req_mem_mb=32 * 1024, alloc_cpus=4, max_rss_mb=6144, total_cpu_seconds=7200, elapsed_seconds=3600),
+        "102": SacctJob(state="OUT_OF_MEMORY", req_mem_mb=16000, alloc_cpus=4, max_rss_mb=16000, total_cpu_seconds=630, elapsed_seconds=720),
+        "103": SacctJob(state="RUNNING", req_mem_mb=128 * 1024, alloc_cpus=16, max_rss_mb=0, total_cpu_seconds=0, elapsed_seconds=300),
+    }
+
+
+@pytest.mark.parametrize(
+    "records, input_bytes, previous_job_id, expected",
+    [
+        pytest.param(
+            [],
+            100,
+            None,
+            MERGING,
+            id="No history",
+        ),
+        pytest.param(
+            [create_record(str(i), 200, 4 * 1024) for i in range(3)],
+            100,
+            None,
+            SlurmResources(cpus=3, mem_gb=8, walltime="12:00:00"),
+            id="Sized from larger runs with headroom",
+        ),
+        pytest.param(
+            [create_record(str(i), 50, 4 * 1024) for i in range(3)],
+            100,
+            None,
+            MERGING,
+            id="Only smaller runs in history",
+        ),
+        pytest.param(
+            [create_record(str(i), 200, 30 * 1024, cpu_hours=8) for i in range(3)],
+            100,
+            None,
+            MERGING,
+            id="Capped by the resource profile",
+        ),
+        pytest.param(
+            [create_record("1", 100, 32 * 1024, state="OUT_OF_MEMORY")],
+            100,
+            "1",
+            SlurmResources(cpus=4, mem_gb=64, walltime="12:00:00"),
+            id="Retry out of memory at the next tier",
+        ),
+        pytest.param(
+            [create_record("1", 100, 40 * 1024, state="OUT_OF_MEMORY", req_mem_mb=40 * 1024)],
+            100,
+            "1",
+            SlurmResources(cpus=4, mem_gb=64, walltime="12:00:00"),
+            id="Retry out of memory between tiers",
+        ),
+        pytest.param(
+            [create_record("1", 100, 512 * 1024, state="OUT_OF_MEMORY", req_mem_mb=512 * 1024)],
+            100,
+            "1",
+            SlurmResources(cpus=4, mem_gb=512, walltime="12:00:00"),
+            id="Retry out of memory at the largest tier",
+        ),
+    ],
+)
+def test_predict(records, input_bytes, previous_job_id, expected):
+    # Arrange
+    resource_model = ResourceModel(records)
+
+    # Act
+    resources = resource_model.predict("merging", MERGING, input_bytes, previous_job_id)
+
+    # Assert
+    assert resources == expected
+
+
+def setup_run_with_jobs(tmp_path) -> SequencingRun:
+    run = SequencingRun(tmp_path / "sample" / "pod5")
+    pod5_file = run.input_pod5_dir / "file.pod5"
+    pod5_file.parent.mkdir(parents=True, exist_ok=True)
+    pod5_file.write_bytes(b"a" * 100)
+    run.state.add_transferred_pod5_files([pod5_file])
+    Metadata("project", "library", "1234", 5000, "FLO-PRO114M", "SQK-LSK114").save(run.metadata_file)
+    run.merge_job_id_file.parent.mkdir(parents=True, exist_ok=True)
+    run.merge_job_id_file.write_text("102", encoding="utf-8")
+    run.demux_job_id_file.parent.mkdir(parents=True, exist_ok=True)
+    run.demux_job_id_file.write_text("103", encoding="utf-8")
+    return run
+
+
+def test_collect_job_resources(monkeypatch, tmp_path):
+    # Mock sacct with the recorded output and an empty queue
+    def mock_run(args, **kwargs):
+        return subprocess.CompletedProcess(args, 0, stdout=SACCT_OUTPUT.encode(), stderr=b"")
+
+    monkeypatch.setattr(resource_history.subprocess, "run", mock_run)
+    monkeypatch.setattr(resource_history, "is_in_queue", lambda job_id: False)
+
+    # Arrange
+    run = setup_run_with_jobs(tmp_path)
+    history_file = tmp_path / "eldorado_resources.csv"
+    resource_model = ResourceModel()
+
+    # Act
+    pending_stages = collect_job_resources(run, resource_model, history_file)
+    collect_job_resources(run, resource_model, history_file)
+
+    # Assert: the demultiplexing job left the queue, but is still running in the accounting. It is recorded on a later tick
+    expected = [ResourceRecord("102", "merging", 100, "OUT_OF_MEMORY", 16000, 16000, 4, 630, 720)]
+    assert pending_stages == {"demultiplexing"}
+    assert resource_model.records == expected
+    assert load_resource_model(history_file).records == expected
+
+
+def test_collect_job_resources_without_accounting(monkeypatch, tmp_path):
+    # Mock a failing sacct and an empty queue
+    def mock_run(args, **kwargs):
+        raise subprocess.CalledProcessError(1, args)
+
+    monkeypatch.setattr(resource_history.subprocess, "run", mock_run)
+    monkeypatch.setattr(resource_history, "is_in_queue", lambda job_id: False)
+
+    # Arrange
+    run = setup_run_with_jobs(tmp_path)
+    resource_model = ResourceModel()
+
+    # Act
+    pending_stages = collect_job_resources(run, resource_model, tmp_path / "eldorado_resources.csv")
+
+    # Assert: stages are not held back when the accounting can not be read
+    assert pending_stages == set()
+    assert resource_model.records == []
+
+
+def test_right_size_resource_profiles_retries_out_of_memory(monkeypatch, tmp_path):
+    # Arrange
+    monkeypatch.setattr(SequencingRun, "all_pod5_files_are_transferred", lambda self: True)
+    run = setup_run_with_jobs(tmp_path)
+    resource_model = ResourceModel([ResourceRecord("102", "merging", 100, "OUT_OF_MEMORY", 16 * 1024, 16000, 4, 630, 720)])
+
+    # Act
+    resource_profiles = right_size_resource_profiles(run, resource_model, None)
+
+    # Assert
+    assert resource_profiles["merging"] == SlurmResources(cpus=4, mem_gb=32, walltime="12:00:00")
+    assert resource_profiles["demultiplexing"] == SlurmResources(cpus=16, mem_gb=128, walltime="12:00:00")
@@ -0,0 +1,171 @@
+import sqlite3
+from pathlib import Path
+
+from eldorado.run_state import DONE, LOCKED, PROBE_COMPLETE, SCHEMA_VERSION, TRANSFERRED, Pod5Probe, Pod5SignalSamples, RunState
+from tests.conftest import create_files
+
+
+def test_lock_and_mark_batch_done(tmp_path: Path):
+    # Arrange
+    state = RunState(tmp_path / "run_state.sqlite3")
+    pod5_files = [tmp_path / "pod5" / f"file{i}.pod5" for i in range(3)]
+    state.add_transferred_pod5_files(pod5_files)
+
+    # Act
+    state.lock_batch("batch", tmp_path / "batch", pod5_files[:2])
+    state.set_batch_job_id("batch", "1234")
+
+    # Assert
+    assert state.get_pod5_files(LOCKED) == pod5_files[:2]
+    assert state.get_pod5_files(TRANSFERRED) == pod5_files[2:]
+    assert state.get_active_batches() == [("batch", tmp_path / "batch", "1234")]
+
+    # Act
+    state.mark_batch_done("batch")
+
+    # Assert
+    assert state.get_pod5_files(DONE) == pod5_files[:2]
+    assert state.get_active_batches() == []
+    assert state.get_done_batch_dirs() == [tmp_path / "batch"]
+
+
+def test_release_batch(tmp_path: Path):
+    # Arrange
+    state = RunState(tmp_path / "run_state.sqlite3")
+    pod5_files = [tmp_path / "pod5" / "file.pod5"]
+    state.add_transferred_pod5_files(pod5_files)
+    state.lock_batch("batch", tmp_path / "batch", pod5_files)
+
+    # Act
+    state.release_batch("batch")
+
+    # Assert
+    assert state.get_pod5_files(TRANSFERRED) == pod5_files
+    assert state.get_active_batches() == []
+    assert state.get_done_batch_dirs() == []
+
+
+def test_add_transferred_pod5_files_keeps_existing_state(tmp_path: Path):
+    # Arrange
+    state = RunState(tmp_path / "run_state.sqlite3")
+    pod5_files = [tmp_path / "pod5" / "file.pod5"]
+    state.add_transferred_pod5_files(pod5_files)
+    state.lock_batch("batch", tmp_path / "batch", pod5_files)
+
+    # Act
+    state.add_transferred_pod5_files(pod5_files)
+
+    # Assert
+    assert state.get_pod5_files(LOCKED) == pod5_files
+    assert state.count_pod5_files() == 1
+
+
+def test_reindex(tmp_path: Path):
+    # Arrange
+    transferred_dir = tmp_path / "transferred_pod5_files"
+    lock_dir = tmp_path / "lock_files"
+    done_dir = tmp_path / "done_files"
+    batches_dir = tmp_path / "batches"
+
+    create_files(
+        [
+            transferred_dir / "done.pod5",
+            transferred_dir / "locked.pod5",
+            transferred_dir / "new.pod5",
+            lock_dir / "locked.pod5.lock",
+            done_dir / "done.pod5.done",
+            batches_dir / "done_batch" / "batch.done",
+        ]
+    )
+    (batches_dir / "active_batch").mkdir()
+    (batches_dir / "active_batch" / "batch_job_id.txt").write_text("1234\n", encoding="utf-8")
+    (batches_dir / "active_batch" / "pod5_manifest.txt").write_text(f"{transferred_dir / 'locked.pod5'}\n", encoding="utf-8")
+
+    state = RunState(tmp_path / "run_state.sqlite3")
+
+    # Act
+    state.reindex(transferred_dir, lock_dir, done_dir, batches_dir)
+
+    # Assert
+    assert [x.name for x in state.get_pod5_files(DONE)] == ["done.pod5"]
+    assert [x.name for x in state.get_pod5_files(LOCKED)] == ["locked.pod5"]
+    assert [x.name for x in state.get_pod5_files(TRANSFERRED)] == ["new.pod5"]
+    assert state.get_active_batches() == [("active_batch", batches_dir / "active_batch", "1234")]
+    assert state.get_done_batch_dirs() == [batches_dir / "done_batch"]
+
+
+def test_connection_is_reused(tmp_path: Path):
+    # Arrange
+    state = RunState(tmp_path / "run_state.sqlite3")
+
+    # Act
+    with state.connect() as first_conn, state.connect() as second_conn:
+        pass
+
+    # Assert
+    assert first_conn is second_conn
+    assert first_conn.execute("PRAGMA user_version").fetchone() == (SCHEMA_VERSION,)
+
+
+def test_existing_store_is_reopened(tmp_path: Path):
+    # Arrange
+    pod5_files = [tmp_path / "pod5" / "file.pod5"]
+    state = RunState(tmp_path / "run_state.sqlite3")
+    state.add_transferred_pod5_files(pod5_files)
+    state.close()
+
+    # Act
+    reopened_state = RunState(tmp_path / "run_state.sqlite3")
+
+    # Assert
+    assert reopened_state.get_pod5_files(TRANSFERRED) == pod5_files
+
+
+def test_evict_pod5_probes(tmp_path: Path):
+    # Arrange
+    state = RunState(tmp_path / "run_state.sqlite3")
+    state.set_pod5_probes({name: Pod5Probe(1, 1, PROBE_COMPLETE) for name in ["new.pod5", "other.pod5"]})
+
+    # Act
+    state.evict_pod5_probes([tmp_path / "pod5" / "new.pod5"])
+
+    # Assert
+    assert list(state.get_pod5_probes()) == ["other.pod5"]
+
+
+def test_outdated_store_is_upgraded(tmp_path: Path):
+    # Arrange
+    # Store written by schema version 1
+    db_file = tmp_path / "run_state.sqlite3"
+    conn = sqlite3.connect(db_file)
+    conn.executescript(
+        """
+        CREATE TABLE pod5_files (name TEXT PRIMARY KEY, path TEXT NOT NULL, state TEXT NOT NULL, batch_id TEXT);
+        INSERT INTO pod5_files VALUES ('file.pod5', '/pod5/file.pod5', 'transferred', NULL);
+        PRAGMA user_version = 1;
+        """
+    )
+    conn.close()
+
+    # Act
+    upgraded_state = RunState(db_file)
+    upgraded_state.set_pod5_signal_samples({"file.pod5": Pod5SignalSamples(1, 1, 100)})
+
+    # Assert
+    assert upgraded_state.get_pod5_signal_samples() == {"file.pod5": Pod5SignalSamples(1, 1, 100)}
+    assert upgraded_state.count_pod5_files(TRANSFERRED) == 1
+    assert upgraded_state.get_oldest_added_at(TRANSFERRED) is not None
+
+
+def test_get_oldest_added_at(tmp_path: Path):
+    # Arrange
+    state = RunState(tmp_path / "run_state.sqlite3")
+    state.add_transferred_pod5_files([tmp_path / "pod5" / "old.pod5"], added_at=100)
+    state.add_transferred_pod5_files([tmp_path / "pod5" / "new.pod5"], added_at=200)
+
+    # Re-adding a file keeps its arrival time
+    state.add_transferred_pod5_files([tmp_path / "pod5" / "old.pod5"], added_at=300)
+
+    # Act / Assert
+    assert state.get_oldest_added_at(TRANSFERRED) == 100
+    assert state.get_oldest_added_at(LOCKED) is None
@@ -0,0 +1,150 @@
+from pathlib import Path
+
+import pytest
+
+from eldorado.pod5_handling import SequencingRun
+from eldorado.run_state import Pod5SignalSamples
+from eldorado.throughput import (
+    ThroughputModel,
+    ThroughputRecord,
+    fit_throughput_model,
+    load_throughput_model,
+    read_throughput_history,
+    record_batch_throughput,
+)
+from tests.conftest import create_files
+
+
+@pytest.mark.parametrize(
+    "records, expected",
+    [
+        pytest.param([], {}, id="No history"),
+        pytest.param(
+            [ThroughputRecord("model", "gpu", 100, None, 10)] * 2,
+            {},
+            id="Too few records",
+        ),
+        pytest.param(
+            [
+                ThroughputRecord("model", "gpu", 100, 1000, 10),
+                ThroughputRecord("model", "gpu", 200, 2000, 10),
+                ThroughputRecord("model", "gpu", 600, 6000, 20),
+            ],
+            {("model", "gpu", "B"): 900 / 40, ("model", "gpu", "samples"): 9000 / 40},
+            id="Total units over total runtime",
+        ),
+        pytest.param(
+            [
+                ThroughputRecord("model", "gpu", 100, None, 10),
+                ThroughputRecord("model", "gpu", 100, None, 10),
+                ThroughputRecord("model", "gpu", 100, None, 10),
+                ThroughputRecord("other_model", "gpu", 100, None, 10),
+            ],
+            {("model", "gpu", "B"): 10},
+            id="Per basecalling model and no samples",
+        ),
+    ],
+)
+def test_fit_throughput_model(records, expected):
+    # Act
+    model = fit_throughput_model(records)
+
+    # Assert
+    assert model.rates == pytest.approx(expected)
+
+
+@pytest.mark.parametrize(
+    "cost, expected",
+    [
+        pytest.param(0, "00:30:00", id="Minimum walltime"),
+        pytest.param(3600 * 10, "01:45:00", id="Predicted runtime with margin"),
+        pytest.param(3600 * 100, "12:00:00", id="Capped by default walltime"),
+    ],
+)
+def test_get_walltime(cost, expected):
+    # Arrange
+    model = ThroughputModel({("model", "gpu", "B"): 10})
+
+    # Act
+    result = model.get_walltime("model", "gpu", "B", cost, "12:00:00")
+
+    # Assert
+    assert result == expected
+
+
+def test_get_walltime_multi_gpu():
+    # Arrange
+    model = ThroughputModel({("model", "gpu", "B"): 10})
+
+    # Act
+    result = model.get_walltime("model", "gpu", "B", 3600 * 40, "12:00:00", gpus=4)
+
+    # Assert
+    assert result == "01:45:00"
+
+
+def test_get_walltime_without_history():
+    # Act
+    result = ThroughputModel().get_walltime("model", "gpu", "B", 1000, "12:00:00")
+
+    # Assert
+    assert result == "12:00:00"
+
+
+def test_get_max_batch_cost():
+    # Arrange
+    model = ThroughputModel({("model", "gpu", "B"): 10})
+
+    # Act / Assert
+    assert model.get_max_batch_cost("model", "gpu", "B", "01:00:00") == 36000
+    assert model.get_max_batch_cost("model", "gpu", "samples", "01:00:00") is None
+
+
+def test_record_batch_throughput(tmp_path):
+    # Arrange
+    pod5_files = [tmp_path / "pod5" / f"file{i}.pod5" for i in range(2)]
+    for pod5_file in pod5_files:
+        pod5_file.parent.mkdir(parents=True, exist_ok=True)
+        pod5_file.write_bytes(b"a" * 100)
+    run = SequencingRun(pod5_files[0].parent)
+    run.state.set_pod5_signal_samples({pod5_file.name: Pod5SignalSamples(100, 1, 500) for pod5_file in pod5_files})
+
+    history_file = tmp_path / "eldorado_throughput.csv"
+    working_dirs = []
+    for i, (runtime, gpus) in enumerate([(10, 1), (10, 2), (30, 1)]):
+        working_dir = tmp_path / f"batch{i}"
+        create_files([working_dir / "pod5_manifest.txt", working_dir / "basecalled.txt"])
+        (working_dir / "pod5_manifest.txt").write_text("".join(f"{x}\n" for x in pod5_files), encoding="utf-8")
+        (working_dir / "basecalled.txt").write_text(
+            f"slurm_job_id=1\npartition=gpu\ngpus={gpus}\nruntime={runtime}\nbasecalling_model=/models/model@v1\n", encoding="utf-8"
+        )
+        working_dirs.append(working_dir)
+
+    # Act
+    for working_dir in working_dirs:
+        record_batch_throughput(run, working_dir, history_file)
+
+    # Assert: runtime of the multi-GPU batch is recorded in GPU seconds
+    records = read_throughput_history(history_file)
+    assert records[0] == ThroughputRecord("model@v1", "gpu", 200, 1000, 10)
+    assert records[1].runtime == 20
+    assert load_throughput_model(history_file).rates == pytest.approx(
+        {("model@v1", "gpu", "B"): 600 / 60, ("model@v1", "gpu", "samples"): 3000 / 60}
+    )
+
+
+def test_read_throughput_history_skips_invalid_lines(tmp_path):
+    # Arrange
+    history_file = tmp_path / "eldorado_throughput.csv"
+    history_file.write_text("model,gpu,100,,10\nmodel,gpu,not_a_number,,10\nmodel\n", encoding="utf-8")
+
+    # Act
+    result = read_throughput_history(history_file)
+
+    # Assert
+    assert result == [ThroughputRecord("model", "gpu", 100, None, 10)]
+
+
+def test_read_throughput_history_missing_file(tmp_path):
+    # Act / Assert
+    assert read_throughput_history(Path(tmp_path / "missing.csv")) == []
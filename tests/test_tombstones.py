@@ -0,0 +1,33 @@
+from pathlib import Path
+
+from eldorado.tombstones import add_tombstone, read_tombstones, remove_tombstone
+
+
+def test_add_and_read_tombstones(tmp_path: Path):
+    # Arrange
+    tombstone_file = tmp_path / "eldorado_tombstones.txt"
+
+    # Act
+    add_tombstone(tombstone_file, tmp_path / "run1" / "pod5")
+    add_tombstone(tombstone_file, tmp_path / "run2" / "pod5")
+
+    # Assert
+    assert read_tombstones(tombstone_file) == {tmp_path / "run1" / "pod5", tmp_path / "run2" / "pod5"}
+
+
+def test_read_missing_tombstone_file(tmp_path: Path):
+    assert read_tombstones(tmp_path / "eldorado_tombstones.txt") == set()
+
+
+def test_remove_tombstone(tmp_path: Path):
+    # Arrange
+    tombstone_file = tmp_path / "eldorado_tombstones.txt"
+    add_tombstone(tombstone_file, tmp_path / "run1" / "pod5")
+    add_tombstone(tombstone_file, tmp_path / "run2" / "pod5")
+
+    # Act
+    results = [remove_tombstone(tombstone_file, tmp_path / "run1" / "pod5"), remove_tombstone(tombstone_file, tmp_path / "run3" / "pod5")]
+
+    # Assert
+    assert results == [True, False]
+    assert read_tombstones(tombstone_file) == {tmp_path / "run2" / "pod5"}
@@ -1,6 +1,21 @@
+import subprocess
+
 import pytest
 
-from eldorado.utils import is_complete_pod5_file
+import eldorado.utils as utils
+from eldorado.utils import (
+    SlurmQueueSnapshot,
+    format_walltime,
+    is_complete_pod5_file,
+    iter_complete_pod5_files,
+    parse_array_task_ids,
+    parse_squeue_job_comments,
+    parse_squeue_output,
+    parse_walltime,
+    probe_pod5_files,
+    submit_slurm_script,
+    try_lock_file,
+)
 
 
 @pytest.mark.parametrize(
@@ -31,6 +46,11 @@ from eldorado.utils import is_complete_pod5_file
             False,
             id="incomplete_file_with_extra_data",
         ),
+        pytest.param(
+            b"",
+            False,
+            id="empty_file",
+        ),
     ],
 )
 def test_is_complete_pod5_file(tmp_path, file_content, expected):
@@ -42,3 +62,312 @@ def test_is_complete_pod5_file(tmp_path, file_content, expected):
     result = is_complete_pod5_file(file_path)
     # Assert
     assert result == expected
+
+
+@pytest.mark.parametrize(
+    "output, expected",
+    [
+        pytest.param(
+            "",
+            {},
+            id="Empty queue",
+        ),
+        pytest.param(
+            "1234|RUNNING|eldorado-basecalling-lib-abc\n1235|PENDING|eldorado-merge-lib\n",
+            {"1234": "RUNNING", "1235": "PENDING"},
+            id="Eldorado jobs",
+        ),
+        pytest.param(
+            "1234|RUNNING|interactive\n",
+            {},
+            id="Other jobs are ignored",
+        ),
+        pytest.param(
+            "1234_1|RUNNING|eldorado-basecalling-lib\n1234_2|PENDING|eldorado-basecalling-lib\n",
+            {"1234_1": "RUNNING", "1234_2": "PENDING", "1234": "RUNNING"},
+            id="Array job",
+        ),
+    ],
+)
+def test_parse_squeue_output(output, expected):
+    assert parse_squeue_output(output) == expected
+
+
+def test_slurm_queue_snapshot_queries_slurm_once(monkeypatch):
+    # Mock squeue
+    calls = []
+
+    def mock_run(args, **kwargs):
+        calls.append(args)
+        return subprocess.CompletedProcess(args, 0, stdout=b"1234|RUNNING|eldorado-merge-lib\n", stderr=b"")
+
+    monkeypatch.setattr(utils.subprocess, "run", mock_run)
+
+    # Act
+    queue = SlurmQueueSnapshot(ttl=60)
+    results = [queue.is_in_queue("1234"), queue.is_in_queue("1234"), queue.is_in_queue("9999")]
+    queue.add_job("5678")
+
+    # Assert
+    assert results == [True, True, False]
+    assert queue.is_in_queue("5678")
+    assert len(calls) == 1
+
+
+def test_slurm_queue_snapshot_refreshes_after_ttl(monkeypatch):
+    # Mock squeue
+    calls = []
+
+    def mock_run(args, **kwargs):
+        calls.append(args)
+        return subprocess.CompletedProcess(args, 0, stdout=b"", stderr=b"")
+
+    monkeypatch.setattr(utils.subprocess, "run", mock_run)
+
+    # Act
+    queue = SlurmQueueSnapshot(ttl=0)
+    queue.is_in_queue("1234")
+    queue.timestamp = queue.timestamp - 1
+    queue.is_in_queue("1234")
+
+    # Assert
+    assert len(calls) == 2
+
+
+def test_slurm_queue_snapshot_count_jobs(monkeypatch):
+    # Mock squeue
+    output = (
+        "1234_1|RUNNING|eldorado-basecalling-lib-abc\n"
+        "1234_2|PENDING|eldorado-basecalling-lib-abc\n"
+        "1235|PENDING|eldorado-merge-lib\n"
+        "1236|RUNNING|interactive\n"
+    )
+
+    def mock_run(args, **kwargs):
+        return subprocess.CompletedProcess(args, 0, stdout=output.encode(), stderr=b"")
+
+    monkeypatch.setattr(utils.subprocess, "run", mock_run)
+
+    # Act
+    queue = SlurmQueueSnapshot(ttl=60)
+
+    # Assert
+    assert queue.count_jobs("eldorado-basecalling-") == 2
+    assert queue.count_jobs("eldorado-") == 3
+
+
+def test_slurm_queue_snapshot_keeps_last_snapshot_on_failure(monkeypatch):
+    # Mock squeue, which times out on the second call
+    calls = []
+
+    def mock_run(args, **kwargs):
+        calls.append(args)
+        if len(calls) > 1:
+            raise subprocess.CalledProcessError(1, args, stderr=b"slurm_load_jobs error: Socket timed out")
+        return subprocess.CompletedProcess(args, 0, stdout=b"1234|RUNNING|eldorado-merge-lib\n", stderr=b"")
+
+    monkeypatch.setattr(utils.subprocess, "run", mock_run)
+
+    # Act
+    queue = SlurmQueueSnapshot(ttl=0)
+    queue.is_in_queue("1234")
+    queue.timestamp = queue.timestamp - 1
+    result = queue.is_in_queue("1234")
+
+    # Assert
+    assert result
+    assert len(calls) == 2
+
+
+def test_slurm_queue_snapshot_counts_added_jobs(monkeypatch):
+    # Mock squeue
+    def mock_run(args, **kwargs):
+        return subprocess.CompletedProcess(args, 0, stdout=b"1235|PENDING|eldorado-merge-lib|(null)\n", stderr=b"")
+
+    monkeypatch.setattr(utils.subprocess, "run", mock_run)
+
+    # Act
+    queue = SlurmQueueSnapshot(ttl=60)
+    queue.add_job("1236", name="eldorado-basecalling-lib-abc", comment="project=a;pod5_bytes=10", array_task_ids=["1", "2"])
+    queue.add_job("1237", name="eldorado-demux-lib")
+
+    # Assert
+    assert queue.is_in_queue("1236")
+    assert queue.is_in_queue("1236_2")
+    assert queue.count_jobs("eldorado-basecalling-") == 2
+    assert queue.count_jobs("eldorado-") == 4
+    assert queue.get_comments("eldorado-basecalling-") == ["project=a;pod5_bytes=10"] * 2
+
+
+@pytest.mark.parametrize(
+    "array, expected",
+    [
+        pytest.param("1-3", ["1", "2", "3"], id="Range"),
+        pytest.param("1,3-4", ["1", "3", "4"], id="List"),
+        pytest.param("1-2%1", ["1", "2"], id="Concurrency limit"),
+        pytest.param("", [], id="No array"),
+    ],
+)
+def test_parse_array_task_ids(array, expected):
+    assert parse_array_task_ids(array) == expected
+
+
+@pytest.mark.parametrize(
+    "output, expected",
+    [
+        pytest.param(
+            "1234|RUNNING|eldorado-basecalling-lib-abc|project=a;pod5_bytes=10\n",
+            {"1234": "project=a;pod5_bytes=10"},
+            id="Basecalling job",
+        ),
+        pytest.param(
+            "1234|RUNNING|eldorado-merge-lib|(null)\n",
+            {},
+            id="No comment",
+        ),
+        pytest.param(
+            "1234|RUNNING|interactive|project=a;pod5_bytes=10\n",
+            {},
+            id="Other jobs are ignored",
+        ),
+        pytest.param(
+            "1234|RUNNING|eldorado-merge-lib\n",
+            {},
+            id="Output without comments",
+        ),
+    ],
+)
+def test_parse_squeue_job_comments(output, expected):
+    assert parse_squeue_job_comments(output) == expected
+
+
+@pytest.mark.parametrize(
+    "dependency, expected_args",
+    [
+        pytest.param(None, [], id="No dependency"),
+        pytest.param(["100", "101_2"], ["--dependency=afterok:100:101_2", "--kill-on-invalid-dep=yes"], id="Dependency"),
+    ],
+)
+def test_submit_slurm_script(monkeypatch, tmp_path, dependency, expected_args):
+    # Mock sbatch and squeue
+    calls = []
+
+    def mock_run(args, **kwargs):
+        calls.append(args)
+        stdout = b"200\n" if args[0] == "sbatch" else b""
+        return subprocess.CompletedProcess(args, 0, stdout=stdout, stderr=b"")
+
+    monkeypatch.setattr(utils.subprocess, "run", mock_run)
+    monkeypatch.setattr(utils, "slurm_queue", SlurmQueueSnapshot(ttl=60))
+
+    # Act
+    job_id = submit_slurm_script(tmp_path / "script.sh", dependency=dependency)
+
+    # Assert
+    assert job_id == "200"
+    assert calls[0] == ["sbatch", "--parsable", *expected_args, str(tmp_path / "script.sh")]
+    assert utils.is_in_queue("200")
+
+
+def test_submit_slurm_script_registers_job_name_and_comment(monkeypatch, tmp_path):
+    # Mock sbatch and squeue
+    def mock_run(args, **kwargs):
+        stdout = b"200\n" if args[0] == "sbatch" else b""
+        return subprocess.CompletedProcess(args, 0, stdout=stdout, stderr=b"")
+
+    monkeypatch.setattr(utils.subprocess, "run", mock_run)
+    monkeypatch.setattr(utils, "slurm_queue", SlurmQueueSnapshot(ttl=60))
+
+    # Arrange
+    script_file = tmp_path / "script.sh"
+    script_file.write_text(
+        "#!/bin/bash\n"
+        "#SBATCH --array             1-2\n"
+        "#SBATCH --comment           project=a;pod5_bytes=10\n"
+        "#SBATCH --job-name          eldorado-basecalling-lib-abc\n",
+        encoding="utf-8",
+    )
+
+    # Act
+    submit_slurm_script(script_file)
+
+    # Assert
+    assert utils.slurm_queue.count_jobs("eldorado-basecalling-") == 2
+    assert utils.slurm_queue.get_comments("eldorado-basecalling-") == ["project=a;pod5_bytes=10"] * 2
+
+
+def test_try_lock_file(tmp_path):
+    # Arrange
+    lock_file = tmp_path / "run" / "eldorado.lock"
+
+    # Act
+    with try_lock_file(lock_file) as first_lock:
+        with try_lock_file(lock_file) as second_lock:
+            pass
+    with try_lock_file(lock_file) as lock_after_release:
+        pass
+
+    # Assert
+    assert first_lock
+    assert not second_lock
+    assert lock_after_release
+
+
+@pytest.mark.parametrize("max_workers", [pytest.param(1, id="serial"), pytest.param(4, id="parallel")])
+def test_probe_pod5_files(tmp_path, max_workers):
+    # Arrange
+    contents = [b"\x8BPOD\r\n\x1A\n", b"\x8BPOD\r\n\x1A", b"\x8BPOD\r\n\x1A\n\x00\x8BPOD\r\n\x1A\n", b""] * 3
+    paths = []
+    for i, content in enumerate(contents):
+        path = tmp_path / f"file{i}.pod5"
+        path.write_bytes(content)
+        paths.append(path)
+
+    # Act
+    result = probe_pod5_files(paths, max_workers=max_workers)
+
+    # Assert
+    assert result == [is_complete_pod5_file(path) for path in paths]
+
+
+def test_iter_complete_pod5_files_stops_early(monkeypatch, tmp_path):
+    # Arrange
+    paths = []
+    for i in range(10):
+        path = tmp_path / f"file{i}.pod5"
+        path.write_bytes(b"\x8BPOD\r\n\x1A\n")
+        paths.append(path)
+
+    probed = []
+
+    def mock_is_complete_pod5_file(path):
+        probed.append(path)
+        return True
+
+    monkeypatch.setattr(utils, "is_complete_pod5_file", mock_is_complete_pod5_file)
+
+    # Act
+    first = next(iter_complete_pod5_files(paths, max_workers=3))
+
+    # Assert
+    assert first == paths[0]
+    assert sorted(probed) == paths[:3]
+
+
+@pytest.mark.parametrize(
+    "walltime, seconds",
+    [
+        pytest.param("00:30:00", 30 * 60, id="Minutes"),
+        pytest.param("12:00:00", 12 * 60 * 60, id="Hours"),
+        pytest.param("36:00:05", 36 * 60 * 60 + 5, id="More than a day"),
+    ],
+)
+def test_parse_and_format_walltime(walltime, seconds):
+    # Act / Assert
+    assert parse_walltime(walltime) == seconds
+    assert format_walltime(seconds) == walltime
+
+
+def test_parse_walltime_with_days():
+    # Act / Assert
+    assert parse_walltime("1-02:00:00") == 26 * 60 * 60